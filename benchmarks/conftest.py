@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+from copy import deepcopy
+from typing import Any, Callable, Dict
+
+import pytest
+
+from chaosistio import close_k8s_api_clients
+from chaosistio.fakeserver import FakeApiServer, virtual_service
+from chaosistio.fault.ledger import clear_ledger
+
+ROUTE_COUNTS = [10, 1000, 10000]
+# rounds of the benchmarks whose calls must write every time
+ROUNDS = 20
+
+
+@pytest.fixture(scope="session")
+def api_server():
+    # nothing watches, a long history would only hold on to every version of
+    # the large virtual services
+    server = FakeApiServer(history_size=1).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def k8s_env(api_server, monkeypatch, tmp_path):
+    monkeypatch.setenv("KUBECONFIG", str(tmp_path / "missing"))
+    monkeypatch.setenv("KUBERNETES_HOST", api_server.url)
+    monkeypatch.delenv("CHAOSTOOLKIT_IN_POD", raising=False)
+    yield
+    close_k8s_api_clients()
+    clear_ledger()
+
+
+@pytest.fixture(params=ROUTE_COUNTS, ids=lambda n: "{}-routes".format(n))
+def virtual_service_name(request, api_server) -> str:
+    name = "reviews-{}".format(request.param)
+    api_server.add(virtual_service(name, routes=request.param))
+    return name
+
+
+@pytest.fixture
+def reseed(api_server, virtual_service_name) -> Callable[..., Callable]:
+    """
+    Return a function building a benchmark setup that puts the virtual
+    service back as it was seeded, with `fault` on its first route when
+    given, so every round has something to write.
+    """
+    seeded = api_server.get("VirtualService", virtual_service_name)
+
+    def make(fault: Dict[str, Any] = None) -> Callable[[], None]:
+        obj = deepcopy(seeded)
+        if fault is not None:
+            obj["spec"]["http"][0]["fault"] = fault
+
+        def setup() -> None:
+            api_server.add(obj)
+
+        return setup
+
+    return make
+
+
+@pytest.fixture
+def measure(benchmark, api_server) -> Callable[..., Any]:
+    """
+    Benchmark a call then run it once more to record, in the benchmark extra
+    info, the requests and bytes it exchanged with the API server and its
+    peak memory, which includes what the in-process server allocated to
+    serve it.
+
+    With a `setup`, called before each round and left out of the timing,
+    the call runs `ROUNDS` times and must send one PATCH in every round.
+    """
+
+    def run(
+        fn: Callable[..., Any],
+        *args,
+        setup: Callable[[], None] = None,
+        **kwargs,
+    ) -> Any:
+        if setup is None:
+            result = benchmark(fn, *args, **kwargs)
+        else:
+            patches = []
+
+            def round_setup() -> None:
+                setup()
+                api_server.reset_counters()
+
+            def round_teardown(*_args, **_kwargs) -> None:
+                patches.append(api_server.requests_by_method.get("PATCH"))
+
+            result = benchmark.pedantic(
+                fn,
+                args,
+                kwargs,
+                setup=round_setup,
+                teardown=round_teardown,
+                rounds=ROUNDS,
+            )
+            assert patches == [1] * len(patches)
+            setup()
+
+        api_server.reset_counters()
+        tracemalloc.start()
+        try:
+            fn(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        if setup is not None:
+            assert api_server.requests_by_method.get("PATCH") == 1
+        benchmark.extra_info.update(
+            {
+                "requests_per_call": api_server.requests,
+                "bytes_sent": api_server.bytes_received,
+                "bytes_received": api_server.bytes_sent,
+                "peak_memory": peak,
+            }
+        )
+        return result
+
+    return run
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from chaosistio import close_k8s_api_clients
+from chaosistio.fault.actions import (
+    PATCH_STRATEGIES,
+    add_abort_fault,
+    add_delay_fault,
+    remove_abort_fault,
+    remove_delay_fault,
+    set_fault,
+    unset_fault,
+)
+from chaosistio.fault.probes import get_virtual_service
+
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+def routes(virtual_service_name):
+    """
+    Select the first route of the seeded virtual service, whose routes all
+    go to a host of its name.
+    """
+    return [{"destination": {"host": virtual_service_name, "subset": "v0"}}]
+
+
+def test_get_virtual_service(measure, virtual_service_name):
+    result = measure(get_virtual_service, virtual_service_name)
+    assert result["status"] == 200
+
+
+@pytest.mark.parametrize("patch_strategy", PATCH_STRATEGIES)
+def test_set_fault(measure, reseed, virtual_service_name, patch_strategy):
+    result = measure(
+        set_fault,
+        virtual_service_name,
+        routes(virtual_service_name),
+        FAULT,
+        patch_strategy=patch_strategy,
+        setup=reseed(),
+    )
+    assert result["status"] == 200
+
+
+@pytest.mark.parametrize("patch_strategy", PATCH_STRATEGIES)
+def test_unset_fault(measure, reseed, virtual_service_name, patch_strategy):
+    result = measure(
+        unset_fault,
+        virtual_service_name,
+        routes(virtual_service_name),
+        patch_strategy=patch_strategy,
+        setup=reseed(FAULT),
+    )
+    assert result["status"] == 200
+
+
+def test_add_delay_fault(measure, reseed, virtual_service_name):
+    result = measure(
+        add_delay_fault,
+        virtual_service_name,
+        "5s",
+        routes(virtual_service_name),
+        percentage=50.0,
+        setup=reseed(),
+    )
+    assert result["status"] == 200
+
+
+def test_add_abort_fault(measure, reseed, virtual_service_name):
+    result = measure(
+        add_abort_fault,
+        virtual_service_name,
+        503,
+        routes(virtual_service_name),
+        percentage=50.0,
+        setup=reseed(),
+    )
+    assert result["status"] == 200
+
+
+def test_remove_delay_fault(measure, reseed, virtual_service_name):
+    result = measure(
+        remove_delay_fault,
+        virtual_service_name,
+        routes(virtual_service_name),
+        setup=reseed({"delay": {"fixedDelay": "5s"}}),
+    )
+    assert result["status"] == 200
+
+
+def test_remove_abort_fault(measure, reseed, virtual_service_name):
+    result = measure(
+        remove_abort_fault,
+        virtual_service_name,
+        routes(virtual_service_name),
+        setup=reseed(FAULT),
+    )
+    assert result["status"] == 200
+
+
+def test_set_fault_without_client_reuse(measure, reseed, virtual_service_name):
+    def set_fault_with_new_client():
+        close_k8s_api_clients()
+        return set_fault(
+            virtual_service_name, routes(virtual_service_name), FAULT
+        )
+
+    result = measure(set_fault_with_new_client, setup=reseed())
+    assert result["status"] == 200
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import tracemalloc
+from copy import deepcopy
+
+import pytest
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import merge_patch_faults
+
+from .conftest import ROUTE_COUNTS
+
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+def deepcopy_patch_faults(name, version, http, faults, section="http"):
+    """
+    How merge patches were built before routes were copied on write.
+    """
+    spec = deepcopy(http)
+    for index, fault in faults.items():
+        if fault is None:
+            spec[index].pop("fault", None)
+        else:
+            spec[index]["fault"] = fault
+    return {"spec": {section: spec}}
+
+
+@pytest.mark.parametrize(
+    "build",
+    [merge_patch_faults, deepcopy_patch_faults],
+    ids=["copy-on-write", "deepcopy"],
+)
+@pytest.mark.parametrize(
+    "routes", ROUTE_COUNTS, ids=lambda n: "{}-routes".format(n)
+)
+def test_merge_patch_allocations(benchmark, build, routes):
+    """
+    Time building the merge patch of a fault set on two routes and record
+    the memory allocated to build it.
+    """
+    http = virtual_service(routes=routes)["spec"]["http"]
+    faults = {0: FAULT, routes - 1: None}
+
+    patch = benchmark(build, "reviews", "v1", http, faults)
+    assert patch["spec"]["http"][0]["fault"] == FAULT
+
+    tracemalloc.start()
+    try:
+        build("reviews", "v1", http, faults)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info["peak_memory"] = peak
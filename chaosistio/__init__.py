@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
+import hashlib
+import json
 import logging
 import os
 import os.path
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from importlib.metadata import version, PackageNotFoundError
-from typing import List
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
 from chaoslib.discovery.discover import (
     discover_actions,
@@ -16,9 +22,20 @@ from chaoslib.types import (
     Discovery,
     Secrets,
 )
-from kubernetes import client, config
 
-__all__ = ["create_k8s_api_client", "discover", "__version__"]
+from chaosistio.credentials import EXPIRY_SKEW, configure_credentials
+from chaosistio.instrumentation import emit, instrumented
+from chaosistio.throttle import configure_throttling
+
+if TYPE_CHECKING:  # pragma: no cover
+    from kubernetes import client
+
+__all__ = [
+    "create_k8s_api_client",
+    "close_k8s_api_clients",
+    "discover",
+    "__version__",
+]
 logger = logging.getLogger("chaostoolkit")
 
 try:
@@ -28,15 +45,33 @@ except PackageNotFoundError:
 
 
 def has_local_config_file():
-    config_path = os.path.expanduser(
-        os.environ.get("KUBECONFIG", "~/.kube/config")
-    )
-    return os.path.exists(config_path)
+    return os.path.exists(kubeconfig_path())
+
+
+IN_CLUSTER_TOKEN_PATH = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+CREDENTIAL_SETTINGS = (
+    "api_key",
+    "api_key_prefix",
+    "cert_file",
+    "key_file",
+    "username",
+    "password",
+)
+_clients_lock = threading.Lock()
+# fingerprint, client and expiry of its credential, by identity
+_clients: Dict[
+    Tuple[Any, ...], Tuple[Any, "client.ApiClient", Optional[datetime]]
+] = {}
+_build_locks: Dict[Tuple[Any, ...], threading.Lock] = {}
+# calls in flight per client, by client id
+_in_use: Dict[int, int] = {}
+# replaced clients waiting for their calls to finish before being closed
+_retired: Dict[int, "client.ApiClient"] = {}
 
 
 def create_k8s_api_client(
     configuration: Configuration, secrets: Secrets = None
-) -> client.ApiClient:
+) -> "client.ApiClient":
     """
     Create a Kubernetes client from:
 
@@ -69,44 +104,79 @@ def create_k8s_api_client(
 
         You may pass a secrets dictionary, in which case, values will be looked
         there before the environ.
+
+    Clients are cached for the lifetime of the process and keyed by their
+    effective connection settings so their connection pool is reused across
+    activities. A cached client is replaced when the kubeconfig file (or the
+    in-cluster token) is modified, when the settings change or when the
+    client certificate an exec plugin issued for it expires. A replaced
+    client is only closed once the calls it is making are done. Call
+    `close_k8s_api_clients` to release them explicitly.
+
+    The Kubernetes client package is only imported when the first client is
+    built.
+
+    The throttling settings of `configuration` are applied to the calls
+    made with every client, see `chaosistio.throttle`.
+
+    Credentials issued by the exec plugins of the kubeconfig file are shared
+    by all clients and only requested again when they are about to expire,
+    see `chaosistio.credentials`.
     """
-    env = os.environ
-    secrets = secrets or {}
+    configure_throttling(configuration)
+    configure_credentials(configuration)
+    if not instrumented():
+        return cached_k8s_api_client(secrets)[0]
 
-    def lookup(k: str, d: str = None) -> str:
-        return secrets.get(k, env.get(k, d))
+    start_time_ns = time.time_ns()
+    started = time.perf_counter()
+    api, cached = cached_k8s_api_client(secrets)
+    emit(
+        "client",
+        cached=cached,
+        duration=time.perf_counter() - started,
+        start_time_ns=start_time_ns,
+    )
+    return api
 
-    if has_local_config_file():
-        context = lookup("KUBERNETES_CONTEXT")
-        logger.debug(
-            "Using Kubernetes context: {}".format(context or "default")
-        )
-        return config.new_client_from_config(context=context)
 
-    elif env.get("CHAOSTOOLKIT_IN_POD") == "true":
-        config.load_incluster_config()
-        return client.ApiClient()
+def close_k8s_api_clients() -> None:
+    """
+    Close and forget every Kubernetes client cached by
+    `create_k8s_api_client`.
 
-    else:
-        cfg = client.Configuration()
-        cfg.debug = True
-        cfg.host = lookup("KUBERNETES_HOST", "http://localhost")
-        cfg.verify_ssl = lookup("KUBERNETES_VERIFY_SSL", False) is not False
-        cfg.cert_file = lookup("KUBERNETES_CA_CERT_FILE")
-
-        if "KUBERNETES_API_KEY" in env or "KUBERNETES_API_KEY" in secrets:
-            cfg.api_key["authorization"] = lookup("KUBERNETES_API_KEY")
-            cfg.api_key_prefix["authorization"] = lookup(
-                "KUBERNETES_API_KEY_PREFIX", "Bearer"
-            )
-        elif "KUBERNETES_CERT_FILE" in env or "KUBERNETES_CERT_FILE" in secrets:
-            cfg.cert_file = lookup("KUBERNETES_CERT_FILE")
-            cfg.key_file = lookup("KUBERNETES_KEY_FILE")
-        elif "KUBERNETES_USERNAME" in env or "KUBERNETES_USERNAME" in secrets:
-            cfg.username = lookup("KUBERNETES_USERNAME")
-            cfg.password = lookup("KUBERNETES_PASSWORD", "")
+    Long-running processes may call this to release pooled connections or to
+    force the next activity to reload its configuration.
+    """
+    with _clients_lock:
+        clients = [api for (_, api, _) in _clients.values()]
+        _clients.clear()
+        _build_locks.clear()
 
-    return client.ApiClient(cfg)
+    for api in clients:
+        retire(api)
+
+
+@contextmanager
+def client_in_use(api: "client.ApiClient") -> Iterator["client.ApiClient"]:
+    """
+    Mark `api` as making a call for the duration of the block so it is not
+    closed meanwhile, should it be replaced in the cache.
+    """
+    key = id(api)
+    with _clients_lock:
+        _in_use[key] = _in_use.get(key, 0) + 1
+    try:
+        yield api
+    finally:
+        retired = None
+        with _clients_lock:
+            _in_use[key] -= 1
+            if not _in_use[key]:
+                del _in_use[key]
+                retired = _retired.pop(key, None)
+        if retired is not None:
+            retired.close()
 
 
 def discover(discover_system: bool = True) -> Discovery:
@@ -132,4 +202,199 @@ def load_exported_activities() -> List[DiscoveredActivities]:
     activities = []
     activities.extend(discover_actions("chaosistio.fault.actions"))
     activities.extend(discover_probes("chaosistio.fault.probes"))
+    activities.extend(discover_actions("chaosistio.destination.actions"))
+    activities.extend(discover_probes("chaosistio.destination.probes"))
+    activities.extend(discover_actions("chaosistio.envoy.actions"))
+    activities.extend(discover_probes("chaosistio.envoy.probes"))
+    activities.extend(discover_actions("chaosistio.instrumentation.actions"))
+    activities.extend(discover_probes("chaosistio.instrumentation.probes"))
     return activities
+
+
+def cached_k8s_api_client(
+    secrets: Secrets = None,
+) -> Tuple["client.ApiClient", bool]:
+    """
+    Return the client for the current connection settings and whether it
+    was already cached.
+    """
+    settings = connection_settings(secrets)
+    identity, fingerprint = settings["identity"], settings["fingerprint"]
+
+    with _clients_lock:
+        cached = _clients.get(identity)
+        if reusable(cached, fingerprint):
+            return cached[1], True
+        build_lock = _build_locks.setdefault(identity, threading.Lock())
+
+    # building may run an exec plugin or read files, so only the threads
+    # wanting the same client wait for it
+    with build_lock:
+        with _clients_lock:
+            cached = _clients.get(identity)
+            if reusable(cached, fingerprint):
+                return cached[1], True
+
+        api = new_k8s_api_client(settings)
+        expiry = None
+        if settings["mode"] == "kubeconfig":
+            from chaosistio import kubeconfig
+
+            expiry = kubeconfig.credential_expiry(api)
+        with _clients_lock:
+            _clients[identity] = (fingerprint, api, expiry)
+
+    if cached is not None:
+        logger.debug(
+            "Kubernetes connection settings or credential changed, closing "
+            "client"
+        )
+        retire(cached[1])
+
+    return api, False
+
+
+def reusable(
+    cached: Optional[Tuple[Any, "client.ApiClient", Optional[datetime]]],
+    fingerprint: Any,
+) -> bool:
+    """
+    Tell if the `cached` client still has the given settings `fingerprint`
+    and a credential that has not expired.
+    """
+    if cached is None or cached[0] != fingerprint:
+        return False
+    expiry = cached[2]
+    return expiry is None or datetime.now(timezone.utc) < expiry - EXPIRY_SKEW
+
+
+def retire(api: "client.ApiClient") -> None:
+    """
+    Close `api` now, or once its calls in flight are done.
+    """
+    with _clients_lock:
+        if id(api) in _in_use:
+            _retired[id(api)] = api
+            return
+    api.close()
+
+
+def kubeconfig_path() -> str:
+    return os.path.expanduser(os.environ.get("KUBECONFIG", "~/.kube/config"))
+
+
+def file_mtime(path: Optional[str]) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, TypeError):
+        return None
+
+
+def connection_settings(secrets: Secrets = None) -> Dict[str, Any]:
+    """
+    Resolve the settings used to connect to the Kubernetes API.
+
+    The `identity` entry tells which cached client these settings belong to
+    while the `fingerprint` entry changes whenever that client must be
+    rebuilt.
+    """
+    env = os.environ
+    secrets = secrets or {}
+
+    def lookup(k: str, d: str = None) -> str:
+        return secrets.get(k, env.get(k, d))
+
+    if has_local_config_file():
+        path = kubeconfig_path()
+        context = lookup("KUBERNETES_CONTEXT")
+        return {
+            "mode": "kubeconfig",
+            "path": path,
+            "context": context,
+            "identity": ("kubeconfig", path, context),
+            "fingerprint": file_mtime(path),
+        }
+
+    if env.get("CHAOSTOOLKIT_IN_POD") == "true":
+        return {
+            "mode": "incluster",
+            "identity": ("incluster",),
+            "fingerprint": file_mtime(IN_CLUSTER_TOKEN_PATH),
+        }
+
+    settings = {
+        "mode": "env",
+        "host": lookup("KUBERNETES_HOST", "http://localhost"),
+        "verify_ssl": lookup("KUBERNETES_VERIFY_SSL", False) is not False,
+        "ca_cert_file": lookup("KUBERNETES_CA_CERT_FILE"),
+    }
+    if "KUBERNETES_API_KEY" in env or "KUBERNETES_API_KEY" in secrets:
+        settings["api_key"] = lookup("KUBERNETES_API_KEY")
+        settings["api_key_prefix"] = lookup(
+            "KUBERNETES_API_KEY_PREFIX", "Bearer"
+        )
+    elif "KUBERNETES_CERT_FILE" in env or "KUBERNETES_CERT_FILE" in secrets:
+        settings["cert_file"] = lookup("KUBERNETES_CERT_FILE")
+        settings["key_file"] = lookup("KUBERNETES_KEY_FILE")
+    elif "KUBERNETES_USERNAME" in env or "KUBERNETES_USERNAME" in secrets:
+        settings["username"] = lookup("KUBERNETES_USERNAME")
+        settings["password"] = lookup("KUBERNETES_PASSWORD", "")
+
+    # clients of the same host with different credentials live side by side
+    credentials = json.dumps(
+        [settings.get(k) for k in CREDENTIAL_SETTINGS], default=str
+    )
+    settings["identity"] = (
+        "env",
+        settings["host"],
+        hashlib.sha256(credentials.encode("utf-8")).hexdigest(),
+    )
+    settings["fingerprint"] = tuple(
+        sorted((k, v) for (k, v) in settings.items() if k != "identity")
+    ) + tuple(
+        file_mtime(settings.get(k))
+        for k in ("ca_cert_file", "cert_file", "key_file")
+    )
+    return settings
+
+
+def new_k8s_api_client(settings: Dict[str, Any]) -> "client.ApiClient":
+    """
+    Build a new Kubernetes client from the given connection settings.
+    """
+    # imported here as the client package is slow to import and not needed
+    # to discover this extension
+    from kubernetes import client, config
+
+    if settings["mode"] == "kubeconfig":
+        from chaosistio import kubeconfig
+
+        context = settings["context"]
+        logger.debug(
+            "Using Kubernetes context: {}".format(context or "default")
+        )
+        return kubeconfig.new_client_from_kubeconfig(
+            settings["path"], context=context
+        )
+
+    elif settings["mode"] == "incluster":
+        config.load_incluster_config()
+        return client.ApiClient()
+
+    cfg = client.Configuration()
+    cfg.debug = True
+    cfg.host = settings["host"]
+    cfg.verify_ssl = settings["verify_ssl"]
+    cfg.cert_file = settings["ca_cert_file"]
+
+    if "api_key" in settings:
+        cfg.api_key["authorization"] = settings["api_key"]
+        cfg.api_key_prefix["authorization"] = settings["api_key_prefix"]
+    elif "cert_file" in settings:
+        cfg.cert_file = settings["cert_file"]
+        cfg.key_file = settings["key_file"]
+    elif "username" in settings:
+        cfg.username = settings["username"]
+        cfg.password = settings["password"]
+
+    return client.ApiClient(cfg)
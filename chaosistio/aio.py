@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio Kubernetes clients and API calls.
+
+Clients are cached per event loop and closed when the loop shuts down, as
+`asyncio.run` does. The calls made on a loop are bounded by the
+`istio_async_max_concurrency` configuration key, 100 by default, the size
+of the connection pool of a client.
+
+Clients built from the Kubernetes configuration file do not share the
+cached credentials of its exec plugins, see `chaosistio.credentials`:
+`kubernetes_asyncio` runs the plugins itself whenever it loads the file.
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+from chaoslib.types import Configuration, Secrets
+
+try:
+    from kubernetes_asyncio import client, config
+    from kubernetes_asyncio.client.rest import ApiException
+except ImportError:  # pragma: no cover
+    raise ImportError(
+        "The asyncio support of chaostoolkit-istio requires the "
+        "'kubernetes_asyncio' package, install it with "
+        "'pip install chaostoolkit-istio[async]'"
+    )
+
+from chaosistio import connection_settings
+from chaosistio.api import emit_request, emit_throttled, error_result, loads
+from chaosistio.instrumentation import emit, instrumented
+from chaosistio.throttle import configure_throttling, get_rate_limiter
+
+__all__ = [
+    "create_async_k8s_api_client",
+    "close_async_k8s_api_clients",
+    "async_call_api",
+]
+logger = logging.getLogger("chaostoolkit")
+DEFAULT_MAX_CONCURRENCY = 100
+_max_concurrency = DEFAULT_MAX_CONCURRENCY
+# clients and concurrency limit of each event loop, dropped when it shuts
+# down
+_loops: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+async def create_async_k8s_api_client(
+    configuration: Configuration, secrets: Secrets = None
+) -> client.ApiClient:
+    """
+    Asyncio counterpart of `chaosistio.create_k8s_api_client`.
+
+    Clients are cached per event loop and connection settings so their
+    connection pool is shared by all the coroutines of that loop. They are
+    closed when the loop shuts down its asynchronous generators, which
+    `asyncio.run` does before closing it.
+
+    The number of calls in flight on the loop is bounded by the
+    `istio_async_max_concurrency` key of `configuration`.
+    """
+    configure_throttling(configuration)
+    configure_concurrency(configuration)
+    if not instrumented():
+        return (await cached_async_k8s_api_client(secrets))[0]
+
+    start_time_ns = time.time_ns()
+    started = time.perf_counter()
+    api, cached = await cached_async_k8s_api_client(secrets)
+    emit(
+        "client",
+        cached=cached,
+        duration=time.perf_counter() - started,
+        start_time_ns=start_time_ns,
+    )
+    return api
+
+
+async def close_async_k8s_api_clients() -> None:
+    """
+    Close and forget every client cached for the running event loop.
+    """
+    state = _loops.get(asyncio.get_running_loop())
+    if state is not None:
+        await close_clients(state["clients"])
+
+
+async def async_call_api(
+    api: client.ApiClient,
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Asyncio counterpart of `chaosistio.api.call_api`.
+
+    Calls wait for one of the `istio_async_max_concurrency` slots of the
+    running loop before being sent.
+    """
+    semaphore = (await loop_state())["semaphore"]
+    limiter = get_rate_limiter()
+    if limiter is None:
+        async with semaphore:
+            return await measured_send(
+                api, url, method, header_params, body, query_params
+            )
+
+    attempt = 0
+    while True:
+        await asyncio.sleep(limiter.reserve(method))
+        async with semaphore:
+            result = await measured_send(
+                api, url, method, header_params, body, query_params
+            )
+        delay = limiter.retry_delay(method, result, attempt)
+        if delay is None:
+            return result
+
+        attempt += 1
+        emit_throttled(method, url, result, attempt, delay)
+        await asyncio.sleep(delay)
+
+
+###############################################################################
+# Private functions
+###############################################################################
+async def measured_send(
+    api: client.ApiClient,
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+) -> Dict[str, Any]:
+    if not instrumented():
+        result, _ = await send(
+            api, url, method, header_params, body, query_params
+        )
+        return result
+
+    start_time_ns = time.time_ns()
+    started = time.perf_counter()
+    result, response_size = await send(
+        api, url, method, header_params, body, query_params
+    )
+    emit_request(
+        method, url, result, start_time_ns, started, body, response_size
+    )
+    return result
+
+
+def configure_concurrency(configuration: Configuration = None) -> None:
+    """
+    Set the number of calls in flight allowed per event loop, when the
+    `istio_async_max_concurrency` key of `configuration` is set.
+    """
+    global _max_concurrency
+    limit = (configuration or {}).get("istio_async_max_concurrency")
+    if limit:
+        _max_concurrency = int(limit)
+
+
+async def loop_state() -> Dict[str, Any]:
+    """
+    The clients and semaphore of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    state = _loops.get(loop)
+    if state is None:
+        state = _loops[loop] = {"clients": {}, "limit": None}
+        # asyncio.run, or loop.shutdown_asyncgens, closes this generator
+        # before closing the loop so the clients are closed on their loop
+        state["closer"] = close_at_shutdown(state)
+        await state["closer"].__anext__()
+
+    if state["limit"] != _max_concurrency:
+        state["limit"] = _max_concurrency
+        state["semaphore"] = asyncio.Semaphore(_max_concurrency)
+    return state
+
+
+async def close_at_shutdown(state: Dict[str, Any]) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        _loops.pop(asyncio.get_running_loop(), None)
+        await close_clients(state["clients"])
+        # the semaphore is bound to the loop
+        state.clear()
+
+
+async def close_clients(
+    clients: Dict[Tuple[Any, ...], Tuple[Any, client.ApiClient]],
+) -> None:
+    apis = [api for (_, api) in clients.values()]
+    clients.clear()
+    for api in apis:
+        await api.close()
+
+
+async def cached_async_k8s_api_client(
+    secrets: Secrets = None,
+) -> Tuple[client.ApiClient, bool]:
+    settings = connection_settings(secrets)
+    identity, fingerprint = settings["identity"], settings["fingerprint"]
+    clients = (await loop_state())["clients"]
+
+    cached = clients.get(identity)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1], True
+
+    api = await new_async_k8s_api_client(settings)
+    clients[identity] = (fingerprint, api)
+
+    if cached is not None:
+        logger.debug("Kubernetes connection settings changed, closing client")
+        await cached[1].close()
+
+    return api, False
+
+
+async def new_async_k8s_api_client(
+    settings: Dict[str, Any],
+) -> client.ApiClient:
+    """
+    Build a new asyncio Kubernetes client from the given connection settings.
+    """
+    if settings["mode"] == "kubeconfig":
+        context = settings["context"]
+        logger.debug(
+            "Using Kubernetes context: {}".format(context or "default")
+        )
+        return await config.new_client_from_config(context=context)
+
+    cfg = client.Configuration()
+    if settings["mode"] == "incluster":
+        config.load_incluster_config(client_configuration=cfg)
+        return client.ApiClient(cfg)
+
+    cfg.host = settings["host"]
+    cfg.verify_ssl = settings["verify_ssl"]
+    cfg.cert_file = settings["ca_cert_file"]
+
+    if "api_key" in settings:
+        cfg.api_key["authorization"] = settings["api_key"]
+        cfg.api_key_prefix["authorization"] = settings["api_key_prefix"]
+    elif "cert_file" in settings:
+        cfg.cert_file = settings["cert_file"]
+        cfg.key_file = settings["key_file"]
+    elif "username" in settings:
+        cfg.username = settings["username"]
+        cfg.password = settings["password"]
+
+    return client.ApiClient(cfg)
+
+
+async def send(
+    api: client.ApiClient,
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+) -> Tuple[Dict[str, Any], int]:
+    kwargs = {"header_params": header_params}
+    if body is not None:
+        kwargs["body"] = body
+    if query_params:
+        kwargs["query_params"] = query_params
+
+    try:
+        response = await api.call_api(
+            url,
+            method,
+            **kwargs,
+            auth_settings=["BearerToken"],
+            _preload_content=False,
+        )
+    except ApiException as x:
+        return error_result(x), len(x.body or "")
+
+    try:
+        raw = await response.read()
+    finally:
+        response.release()
+
+    try:
+        data = loads(raw)
+    except ValueError:
+        data = raw.decode("utf-8", errors="replace")
+    return {
+        "status": response.status,
+        "body": data,
+        "headers": dict(**response.headers),
+    }, len(raw)
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+import codecs
+import json
+import logging
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+from chaosistio import client_in_use
+from chaosistio.instrumentation import emit, instrumented
+from chaosistio.throttle import get_rate_limiter
+
+if TYPE_CHECKING:  # pragma: no cover
+    from kubernetes import client
+
+__all__ = [
+    "call_api",
+    "stream_list",
+    "iter_listing",
+    "resource_url",
+    "virtual_service_url",
+    "destination_rule_url",
+    "slim_result",
+    "loads",
+]
+logger = logging.getLogger("chaostoolkit")
+LIST_CHUNK_SIZE = 64 * 1024
+
+# orjson, when installed, decodes responses several times faster
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def resource_url(
+    plural: str, version: str, ns: str = None, name: str = None
+) -> str:
+    """
+    Build the API path to a resource, or to the collection of `plural`
+    resources in `ns` when `name` is not set. Without `ns` either, the path
+    targets these resources across all namespaces.
+    """
+    if not ns:
+        return "/apis/{}/{}".format(version, plural)
+
+    url = "/apis/{}/namespaces/{}/{}".format(version, ns, plural)
+    if name:
+        url = "{}/{}".format(url, name)
+    return url
+
+
+def virtual_service_url(version: str, ns: str = None, name: str = None) -> str:
+    """
+    Build the API path to a virtual service, or to the collection of virtual
+    services in `ns` when `name` is not set. Without `ns` either, the path
+    targets virtual services across all namespaces.
+    """
+    return resource_url("virtualservices", version, ns, name)
+
+
+def destination_rule_url(version: str, ns: str = None, name: str = None) -> str:
+    """
+    Build the API path to a destination rule, see `virtual_service_url`.
+    """
+    return resource_url("destinationrules", version, ns, name)
+
+
+def call_api(
+    api: "client.ApiClient",
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+    request_timeout: float = None,
+) -> Dict[str, Any]:
+    """
+    Perform a call against the Kubernetes API and return its status, decoded
+    body and headers.
+
+    API errors are not raised but returned with their status code so callers
+    can decide what to do with them. Connection errors, including running
+    past `request_timeout` seconds, are raised.
+
+    When throttling is configured (see `chaosistio.throttle`), writes wait
+    for the rate limiter and calls rejected with a 429 are retried once the
+    API server allows it.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return measured_send(
+            api, url, method, header_params, body, query_params, request_timeout
+        )
+
+    attempt = 0
+    while True:
+        time.sleep(limiter.reserve(method))
+        result = measured_send(
+            api, url, method, header_params, body, query_params, request_timeout
+        )
+        delay = limiter.retry_delay(method, result, attempt)
+        if delay is None:
+            return result
+
+        attempt += 1
+        emit_throttled(method, url, result, attempt, delay)
+        time.sleep(delay)
+
+
+def stream_list(
+    api: "client.ApiClient",
+    url: str,
+    header_params: Dict[str, str],
+    query_params: List[Tuple[str, Any]] = None,
+) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+    """
+    Perform a LIST call against the Kubernetes API and yield its items as
+    they are decoded from the response, so a large list is never held in
+    memory both as raw bytes and as decoded objects.
+
+    Once exhausted, the generator returns the same result as `call_api`
+    except that the body of a successful call is the list without its
+    items, thus mostly its `metadata`.
+    """
+    from kubernetes.client.rest import ApiException
+
+    kwargs = {"header_params": header_params}
+    if query_params:
+        kwargs["query_params"] = query_params
+
+    sizes = None
+    if instrumented():
+        sizes = []
+        start_time_ns = time.time_ns()
+        started = time.perf_counter()
+
+    with client_in_use(api):
+        try:
+            data, status, headers = api.call_api(
+                url,
+                "GET",
+                **kwargs,
+                auth_settings=["BearerToken"],
+                _preload_content=False,
+            )
+        except ApiException as x:
+            result = error_result(x)
+            if sizes is not None:
+                emit_request(
+                    "LIST",
+                    url,
+                    result,
+                    start_time_ns,
+                    started,
+                    None,
+                    len(x.body or ""),
+                )
+            return result
+
+        chunks = data.stream(LIST_CHUNK_SIZE, decode_content=True)
+        if sizes is not None:
+            chunks = counted(chunks, sizes)
+
+        consumed = False
+        try:
+            body = yield from decode_list(chunks)
+            consumed = True
+        finally:
+            # a connection with unread data cannot go back to the pool
+            if consumed:
+                data.release_conn()
+            else:
+                data.close()
+
+    result = {"status": status, "body": body, "headers": dict(**headers)}
+    if sizes is not None:
+        # includes the time the caller spent on each item
+        emit_request(
+            "LIST", url, result, start_time_ns, started, None, sum(sizes)
+        )
+    return result
+
+
+def iter_listing(
+    listing: Generator[Dict[str, Any], None, Dict[str, Any]],
+    result: Dict[str, Any],
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the items of a `stream_list` listing then fill `result` with the
+    result it returned, once exhausted.
+    """
+    result.update((yield from listing))
+
+
+def slim_result(
+    result: Dict[str, Any], fields: List[str] = None
+) -> Dict[str, Any]:
+    """
+    Drop the headers of a result and, when `fields` are given, keep only
+    these dotted paths of its body, such as `metadata.resourceVersion` or
+    `spec.http.0.fault`.
+    """
+    body = result["body"]
+    if fields and isinstance(body, dict):
+        body = project(body, fields)
+    return {"status": result["status"], "body": body}
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def measured_send(
+    api: "client.ApiClient",
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+    request_timeout: float = None,
+) -> Dict[str, Any]:
+    if not instrumented():
+        return send(
+            api, url, method, header_params, body, query_params, request_timeout
+        )[0]
+
+    start_time_ns = time.time_ns()
+    started = time.perf_counter()
+    result, response_size = send(
+        api, url, method, header_params, body, query_params, request_timeout
+    )
+    emit_request(
+        method, url, result, start_time_ns, started, body, response_size
+    )
+    return result
+
+
+def send(
+    api: "client.ApiClient",
+    url: str,
+    method: str,
+    header_params: Dict[str, str],
+    body: Union[Dict[str, Any], List[Dict[str, Any]]] = None,
+    query_params: List[Tuple[str, Any]] = None,
+    request_timeout: float = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Perform the call and return its result and the size of the response
+    body.
+    """
+    from kubernetes.client.rest import ApiException
+
+    kwargs = {"header_params": header_params}
+    if body is not None:
+        kwargs["body"] = body
+    if query_params:
+        kwargs["query_params"] = query_params
+    if request_timeout:
+        kwargs["_request_timeout"] = request_timeout
+
+    with client_in_use(api):
+        try:
+            data, status, headers = api.call_api(
+                url,
+                method,
+                **kwargs,
+                auth_settings=["BearerToken"],
+                _preload_content=False,
+            )
+        except ApiException as x:
+            return error_result(x), len(x.body or "")
+
+        raw = data.read(decode_content=True)
+    return {
+        "status": status,
+        "body": loads(raw),
+        "headers": dict(**headers),
+    }, len(raw)
+
+
+def emit_request(
+    verb: str,
+    url: str,
+    result: Dict[str, Any],
+    start_time_ns: int,
+    started: float,
+    body: Any,
+    response_size: int,
+) -> None:
+    emit(
+        "request",
+        verb=verb,
+        url=url,
+        status=result["status"],
+        duration=time.perf_counter() - started,
+        start_time_ns=start_time_ns,
+        # as serialized by the Kubernetes client
+        request_size=len(json.dumps(body)) if body is not None else 0,
+        response_size=response_size,
+    )
+
+
+def emit_throttled(
+    verb: str, url: str, result: Dict[str, Any], attempt: int, delay: float
+) -> None:
+    emit(
+        "retry",
+        verb=verb,
+        url=url,
+        status=result["status"],
+        attempt=attempt,
+    )
+    logger.debug(
+        "Kubernetes API call {} {} throttled, retrying in {}s ({})".format(
+            verb, url, delay, attempt
+        )
+    )
+
+
+def counted(chunks: Iterable[bytes], sizes: List[int]) -> Iterable[bytes]:
+    for chunk in chunks:
+        sizes.append(len(chunk))
+        yield chunk
+
+
+def error_result(x: Exception) -> Dict[str, Any]:
+    body = x.body
+    headers = x.headers or {}
+    if headers.get("Content-Type") == "application/json":
+        body = loads(body)
+    return {"status": x.status, "body": body, "headers": dict(**headers)}
+
+
+def project(obj: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    projected = {}
+    for field in fields:
+        keys = field.split(".")
+        value = obj
+        try:
+            for key in keys:
+                if isinstance(value, list):
+                    value = value[int(key)]
+                else:
+                    value = value[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+
+        target = projected
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return projected
+
+
+def decode_list(
+    chunks: Iterable[bytes],
+) -> Generator[Dict[str, Any], None, Dict[str, Any]]:
+    """
+    Incrementally decode a JSON object read from `chunks`, yielding the
+    elements of its `items` array as soon as each is complete and returning
+    its other members.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill(at_least: int = 1) -> bool:
+        nonlocal buffer, pos, eof
+        if pos:
+            buffer, pos = buffer[pos:], 0
+        wanted = len(buffer) + at_least
+        while not eof and len(buffer) < wanted:
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+                buffer += utf8.decode(b"", final=True)
+            else:
+                buffer += utf8.decode(chunk)
+        return len(buffer) >= wanted
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                raise ValueError("Truncated JSON list")
+
+    def expect(char: str) -> None:
+        nonlocal pos
+        if peek() != char:
+            raise ValueError("Expected '{}' at position {}".format(char, pos))
+        pos += 1
+
+    def value() -> Any:
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buffer, pos)
+                # a number at the end of the buffer may not be complete
+                if end < len(buffer) or eof:
+                    pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            # read at least as much again before trying to decode again
+            fill(max(len(buffer) - pos, LIST_CHUNK_SIZE))
+
+    envelope = {}
+    expect("{")
+    if peek() == "}":
+        return envelope
+
+    while True:
+        key = value()
+        expect(":")
+        if key == "items" and peek() == "[":
+            expect("[")
+            if peek() != "]":
+                while True:
+                    yield value()
+                    if peek() != ",":
+                        break
+                    expect(",")
+            expect("]")
+        else:
+            envelope[key] = value()
+
+        if peek() != ",":
+            break
+        expect(",")
+    expect("}")
+    return envelope
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Run activities against several Kubernetes clusters at once.
+
+A cluster is either the name of a context of the Kubernetes configuration
+file or a mapping of the keys read by `chaosistio.create_k8s_api_client`,
+such as `KUBERNETES_HOST` and `KUBERNETES_API_KEY`, with an optional `name`
+to report it under. These keys override the `secrets` of the activity for
+that cluster, so each cluster gets its own pooled client.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Secrets
+
+__all__ = [
+    "Cluster",
+    "PARTIAL_FAILURE_POLICIES",
+    "cluster_name",
+    "cluster_secrets",
+    "cluster_of",
+    "cluster_key",
+    "on_clusters",
+]
+logger = logging.getLogger("chaostoolkit")
+Cluster = Union[str, Dict[str, str]]
+PARTIAL_FAILURE_POLICIES = ("rollback", "continue")
+# keys telling which cluster secrets point to, without credentials so they
+# can be persisted
+LOCATING_KEYS = ("KUBERNETES_CONTEXT", "KUBERNETES_HOST")
+
+
+def cluster_name(cluster: Cluster) -> str:
+    if isinstance(cluster, str):
+        return cluster
+    for key in ("name",) + LOCATING_KEYS:
+        if cluster.get(key):
+            return cluster[key]
+    raise ActivityFailed(
+        "A cluster must be a context name or set one of: name, {}".format(
+            ", ".join(LOCATING_KEYS)
+        )
+    )
+
+
+def cluster_secrets(secrets: Secrets, cluster: Cluster) -> Secrets:
+    """
+    The `secrets` to connect to `cluster` with.
+    """
+    if isinstance(cluster, str):
+        return dict(secrets or {}, KUBERNETES_CONTEXT=cluster)
+    return dict(
+        secrets or {}, **{k: v for (k, v) in cluster.items() if k != "name"}
+    )
+
+
+def cluster_of(secrets: Secrets) -> Optional[Dict[str, str]]:
+    """
+    The keys of `secrets` locating the cluster they connect to, `None` when
+    it is the one set by the environment.
+    """
+    for key in LOCATING_KEYS:
+        if (secrets or {}).get(key):
+            return {key: secrets[key]}
+
+
+def cluster_key(secrets: Secrets) -> Optional[Tuple[str, str]]:
+    """
+    Hashable version of `cluster_of`.
+    """
+    cluster = cluster_of(secrets)
+    if cluster is not None:
+        return next(iter(cluster.items()))
+
+
+def on_clusters(
+    clusters: List[Cluster],
+    secrets: Secrets,
+    apply: Callable[[Secrets], Dict[str, Any]],
+    rollback: Callable[[Secrets], Any] = None,
+    on_partial_failure: str = "rollback",
+) -> Dict[str, Any]:
+    """
+    Call `apply` with the secrets of each cluster, all concurrently, and
+    return the result of each cluster by name.
+
+    A cluster fails when `apply` raises or returns an API error. When some
+    clusters failed and `on_partial_failure` is `"rollback"`, `rollback` is
+    then called for the ones that succeeded so they are all left as they
+    were. With `"continue"`, the changes made on the other clusters are
+    kept.
+    """
+    if on_partial_failure not in PARTIAL_FAILURE_POLICIES:
+        raise ActivityFailed(
+            "Unknown partial failure policy '{}', must be one of: {}".format(
+                on_partial_failure, ", ".join(PARTIAL_FAILURE_POLICIES)
+            )
+        )
+
+    targets = {cluster_name(c): cluster_secrets(secrets, c) for c in clusters}
+    if len(targets) != len(clusters):
+        raise ActivityFailed("Clusters must have distinct names")
+
+    def run(name: str) -> Dict[str, Any]:
+        try:
+            return apply(targets[name])
+        except Exception as x:
+            return {"status": "failed", "error": str(x)}
+
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+        results = dict(zip(targets, pool.map(run, targets)))
+
+    failed = [
+        name for (name, result) in results.items() if not succeeded(result)
+    ]
+    rolled_back = []
+    if failed and rollback is not None and on_partial_failure == "rollback":
+        logger.warning(
+            "Failed on cluster(s) {}, rolling back the others".format(
+                ", ".join(failed)
+            )
+        )
+        for name in results:
+            if name in failed:
+                continue
+            try:
+                rollback(targets[name])
+            except Exception as x:
+                logger.error(
+                    "Failed to roll back cluster '{}': {}".format(name, x)
+                )
+            else:
+                rolled_back.append(name)
+
+    return {
+        "clusters": results,
+        "failed": failed,
+        "rolledBack": rolled_back,
+    }
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def succeeded(result: Dict[str, Any]) -> bool:
+    status = result.get("status")
+    return isinstance(status, int) and status < 400
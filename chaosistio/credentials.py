@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the credentials issued by the exec plugins of the Kubernetes
+configuration file, such as `aws eks get-token`, `gke-gcloud-auth-plugin` or
+`kubelogin`.
+
+Running such a plugin takes hundreds of milliseconds so its credential is
+kept until its `expirationTimestamp` and shared by all the clients of the
+process. A background thread runs the plugin again shortly before the
+credential expires so activities never wait for it. The following
+configuration keys tune this:
+
+* `istio_exec_credentials_cache_dir`: directory where tokens are also
+  cached, readable only by the current user, so they survive the process.
+  Not set by default
+* `istio_exec_credentials_refresh_margin`: seconds before their expiry at
+  which credentials are refreshed, 60 by default
+"""
+
+import hashlib
+import json
+import logging
+import os
+import os.path
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from chaoslib.types import Configuration
+
+__all__ = [
+    "configure_credentials",
+    "exec_credential",
+    "clear_credentials",
+]
+logger = logging.getLogger("chaostoolkit")
+DEFAULT_REFRESH_MARGIN = 60.0
+# a credential this close to its expiry is not used anymore as the API server
+# may see it expired
+EXPIRY_SKEW = timedelta(seconds=10)
+# delay before retrying a failed background refresh
+REFRESH_RETRY_DELAY = 10.0
+_settings_lock = threading.Lock()
+_cache_dir: Optional[str] = None
+_refresh_margin = timedelta(seconds=DEFAULT_REFRESH_MARGIN)
+_credentials_lock = threading.Condition()
+_credentials: Dict[str, "Credential"] = {}
+_key_locks: Dict[str, threading.Lock] = {}
+_refresher: Optional[threading.Thread] = None
+_stopped = False
+
+
+class Credential:
+    """
+    The `status` returned by an exec plugin, with what is needed to run the
+    plugin again.
+    """
+
+    def __init__(
+        self,
+        exec_config: Dict[str, Any],
+        cwd: Optional[str],
+        status: Dict[str, Any],
+    ):
+        self.exec_config = exec_config
+        self.cwd = cwd
+        self.status = status
+        self.expiry = expiration(status)
+        self.refresh_at = None
+        if self.expiry is not None and self.valid():
+            now = datetime.now(timezone.utc)
+            # short-lived credentials are refreshed half way through their
+            # validity
+            self.refresh_at = max(
+                self.expiry - _refresh_margin,
+                now + (self.expiry - EXPIRY_SKEW - now) / 2,
+            )
+
+    def valid(self) -> bool:
+        return self.expiry is None or (
+            datetime.now(timezone.utc) < self.expiry - EXPIRY_SKEW
+        )
+
+
+def configure_credentials(configuration: Configuration = None) -> None:
+    """
+    Apply the credentials settings of `configuration` to the process,
+    keeping the current value of each one `configuration` does not have, as
+    is the case of internal calls.
+
+    A setting given as `None` goes back to its default.
+    """
+    configuration = configuration or {}
+    global _cache_dir, _refresh_margin
+    with _settings_lock:
+        if "istio_exec_credentials_cache_dir" in configuration:
+            cache_dir = configuration["istio_exec_credentials_cache_dir"]
+            _cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        if "istio_exec_credentials_refresh_margin" in configuration:
+            margin = configuration["istio_exec_credentials_refresh_margin"]
+            _refresh_margin = timedelta(
+                seconds=DEFAULT_REFRESH_MARGIN
+                if margin is None
+                else float(margin)
+            )
+
+
+def exec_credential(
+    exec_config: Dict[str, Any], cwd: str = None
+) -> Dict[str, Any]:
+    """
+    The `status` of the ExecCredential issued by the exec plugin configured
+    by `exec_config`, the `exec` entry of a kubeconfig user.
+
+    The plugin only runs when no valid credential is cached, in memory or
+    in the cache directory, for the same command, arguments and
+    environment.
+    """
+    key = credential_key(exec_config, cwd)
+    with _credentials_lock:
+        credential = _credentials.get(key)
+        if credential is not None and credential.valid():
+            return credential.status
+        lock = _key_locks.setdefault(key, threading.Lock())
+
+    # one plugin run per key at a time, others wait for its credential
+    with lock:
+        with _credentials_lock:
+            credential = _credentials.get(key)
+        if credential is None or not credential.valid():
+            credential = load_credential(key, exec_config, cwd)
+        if credential is None or not credential.valid():
+            credential = Credential(
+                exec_config, cwd, run_exec_plugin(exec_config, cwd)
+            )
+            save_credential(key, credential)
+        remember(key, credential)
+    return credential.status
+
+
+def clear_credentials() -> None:
+    """
+    Stop refreshing credentials and forget them. The cache directory is
+    left untouched.
+    """
+    global _refresher, _stopped
+    with _credentials_lock:
+        refresher = _refresher
+        _refresher = None
+        _stopped = True
+        _credentials.clear()
+        _key_locks.clear()
+        _credentials_lock.notify_all()
+
+    if refresher is not None:
+        refresher.join()
+
+    with _credentials_lock:
+        _stopped = False
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def credential_key(exec_config: Dict[str, Any], cwd: Optional[str]) -> str:
+    plugin = {
+        k: exec_config.get(k) for k in ("apiVersion", "command", "args", "env")
+    }
+    plugin["cwd"] = cwd
+    plugin = json.dumps(plugin, sort_keys=True, default=str)
+    return hashlib.sha256(plugin.encode("utf-8")).hexdigest()
+
+
+def run_exec_plugin(
+    exec_config: Dict[str, Any], cwd: Optional[str]
+) -> Dict[str, Any]:
+    # imported here as the client package is slow to import
+    from kubernetes.config.exec_provider import ExecProvider
+    from kubernetes.config.kube_config import ConfigNode
+
+    logger.debug(
+        "Running Kubernetes exec plugin '{}'".format(exec_config.get("command"))
+    )
+    return ExecProvider(ConfigNode("exec", exec_config), cwd).run()
+
+
+def expiration(status: Dict[str, Any]) -> Optional[datetime]:
+    if not status.get("expirationTimestamp"):
+        return None
+
+    from kubernetes.config.dateutil import parse_rfc3339
+
+    return parse_rfc3339(status["expirationTimestamp"])
+
+
+def remember(key: str, credential: Credential) -> None:
+    global _refresher
+    with _credentials_lock:
+        _credentials[key] = credential
+        if credential.refresh_at is None:
+            return
+        if _refresher is None:
+            _refresher = threading.Thread(
+                target=refresh_credentials,
+                name="chaosistio-credentials",
+                daemon=True,
+            )
+            _refresher.start()
+        _credentials_lock.notify_all()
+
+
+def refresh_credentials() -> None:
+    """
+    Run the plugins of the cached credentials when they are about to
+    expire, until `clear_credentials` is called.
+    """
+    while True:
+        with _credentials_lock:
+            while True:
+                if _stopped:
+                    return
+                now = datetime.now(timezone.utc)
+                pending = [
+                    (k, c)
+                    for (k, c) in _credentials.items()
+                    if c.refresh_at is not None
+                ]
+                due = [(k, c) for (k, c) in pending if c.refresh_at <= now]
+                if due:
+                    break
+                timeout = None
+                if pending:
+                    timeout = min(c.refresh_at for (_, c) in pending) - now
+                    timeout = timeout.total_seconds()
+                _credentials_lock.wait(timeout)
+
+        for key, credential in due:
+            refresh_credential(key, credential)
+
+
+def refresh_credential(key: str, credential: Credential) -> None:
+    try:
+        fresh = Credential(
+            credential.exec_config,
+            credential.cwd,
+            run_exec_plugin(credential.exec_config, credential.cwd),
+        )
+    except Exception as x:
+        logger.warning(
+            "Failed to refresh the credential of Kubernetes exec plugin "
+            "'{}': {}".format(credential.exec_config.get("command"), x)
+        )
+        retry_at = datetime.now(timezone.utc) + timedelta(
+            seconds=REFRESH_RETRY_DELAY
+        )
+        with _credentials_lock:
+            if _credentials.get(key) is not credential:
+                return
+            if credential.valid():
+                credential.refresh_at = retry_at
+            else:
+                # the next client call runs the plugin again
+                del _credentials[key]
+        return
+
+    save_credential(key, fresh)
+    with _credentials_lock:
+        if key in _credentials:
+            _credentials[key] = fresh
+
+
+def credential_path(key: str) -> Optional[str]:
+    cache_dir = _cache_dir
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, "{}.json".format(key))
+
+
+def load_credential(
+    key: str, exec_config: Dict[str, Any], cwd: Optional[str]
+) -> Optional[Credential]:
+    path = credential_path(key)
+    if path is None:
+        return None
+
+    try:
+        with open(path) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as x:
+        logger.debug("Ignoring cached credential '{}': {}".format(path, x))
+        return None
+
+    return Credential(exec_config, cwd, status)
+
+
+def save_credential(key: str, credential: Credential) -> None:
+    """
+    Write a token to the cache directory, if any. Credentials without
+    expiry or made of client certificates are only kept in memory.
+    """
+    path = credential_path(key)
+    if (
+        path is None
+        or credential.expiry is None
+        or "token" not in credential.status
+    ):
+        return
+
+    cache_dir = os.path.dirname(path)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        # the temporary file is only readable by the current user
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(credential.status, f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as x:
+        logger.warning(
+            "Failed to cache the credential to '{}': {}".format(path, x)
+        )
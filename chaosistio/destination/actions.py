@@ -0,0 +1,650 @@
+# -*- coding: utf-8 -*-
+import logging
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import call_api, destination_rule_url, slim_result
+from chaosistio.clusters import cluster_of
+from chaosistio.destination.probes import (
+    get_destination_rule,
+    locate_traffic_policy,
+)
+from chaosistio.fault.actions import (
+    check_patch_strategy,
+    is_entry_of,
+    patch_with_retries,
+)
+from chaosistio.fault.ledger import (
+    forget_traffic_policy,
+    pending_faults,
+    record_traffic_policy,
+    setting_key,
+)
+
+__all__ = [
+    "set_connection_pool",
+    "unset_connection_pool",
+    "limit_connection_pool",
+    "set_outlier_detection",
+    "unset_outlier_detection",
+    "tighten_outlier_detection",
+]
+logger = logging.getLogger("chaostoolkit")
+
+
+def set_connection_pool(
+    destination_rule_name: str,
+    connection_pool: Dict[str, Any],
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Set the connection pool settings of the destination rule identified by
+    `name`, or of its `subset`
+
+    The `connection_pool` argument must be the object passed as the
+    `connectionPool` property of a traffic policy. It replaces the current
+    one, shrinking its limits simulates an overloaded upstream.
+
+    See `chaosistio.fault.actions.set_fault` for the meaning of
+    `patch_strategy`, `max_retries` and `fields`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#ConnectionPoolSettings
+    """  # noqa: E501
+    return patch_traffic_policy(
+        destination_rule_name,
+        "connectionPool",
+        connection_pool,
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+def unset_connection_pool(
+    destination_rule_name: str,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Restore the connection pool settings of the destination rule identified
+    by `name`, or of its `subset`, to what they were before
+    `set_connection_pool` changed them
+
+    They are left as they are when the ledger holds no change of them, see
+    `chaosistio.fault.actions.rollback_all_faults`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#ConnectionPoolSettings
+    """  # noqa: E501
+    return restore_traffic_policy(
+        destination_rule_name,
+        "connectionPool",
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+def limit_connection_pool(
+    destination_rule_name: str,
+    max_connections: int = None,
+    http1_max_pending_requests: int = None,
+    http2_max_requests: int = None,
+    max_requests_per_connection: int = None,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Limit the connections and requests the sidecars open to the host of the
+    destination rule identified by `name`, or to its `subset`
+
+    Only the given limits are set, the other connection pool settings are
+    removed. Restore them with `unset_connection_pool`.
+
+    See `chaosistio.fault.actions.set_fault` for the meaning of
+    `patch_strategy`, `max_retries` and `fields`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#ConnectionPoolSettings
+    """  # noqa: E501
+    connection_pool = {}
+    if max_connections is not None:
+        connection_pool["tcp"] = {"maxConnections": max_connections}
+
+    http = {}
+    if http1_max_pending_requests is not None:
+        http["http1MaxPendingRequests"] = http1_max_pending_requests
+    if http2_max_requests is not None:
+        http["http2MaxRequests"] = http2_max_requests
+    if max_requests_per_connection is not None:
+        http["maxRequestsPerConnection"] = max_requests_per_connection
+    if http:
+        connection_pool["http"] = http
+
+    if not connection_pool:
+        raise ActivityFailed("Set at least one connection pool limit")
+
+    return set_connection_pool(
+        destination_rule_name,
+        connection_pool,
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+def set_outlier_detection(
+    destination_rule_name: str,
+    outlier_detection: Dict[str, Any],
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Set the outlier detection settings of the destination rule identified by
+    `name`, or of its `subset`
+
+    The `outlier_detection` argument must be the object passed as the
+    `outlierDetection` property of a traffic policy. It replaces the current
+    one, tightening it makes the sidecars eject hosts sooner.
+
+    See `chaosistio.fault.actions.set_fault` for the meaning of
+    `patch_strategy`, `max_retries` and `fields`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#OutlierDetection
+    """  # noqa: E501
+    return patch_traffic_policy(
+        destination_rule_name,
+        "outlierDetection",
+        outlier_detection,
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+def unset_outlier_detection(
+    destination_rule_name: str,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Restore the outlier detection settings of the destination rule
+    identified by `name`, or of its `subset`, to what they were before
+    `set_outlier_detection` changed them
+
+    They are left as they are when the ledger holds no change of them, see
+    `chaosistio.fault.actions.rollback_all_faults`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#OutlierDetection
+    """  # noqa: E501
+    return restore_traffic_policy(
+        destination_rule_name,
+        "outlierDetection",
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+def tighten_outlier_detection(
+    destination_rule_name: str,
+    consecutive_5xx_errors: int = 1,
+    interval: str = "1s",
+    base_ejection_time: str = "30s",
+    max_ejection_percent: int = 100,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Make the sidecars eject the hosts of the destination rule identified by
+    `name`, or of its `subset`, after `consecutive_5xx_errors` errors,
+    checked every `interval`, for `base_ejection_time`, up to
+    `max_ejection_percent` of them
+
+    Restore the previous settings with `unset_outlier_detection`.
+
+    See `chaosistio.fault.actions.set_fault` for the meaning of
+    `patch_strategy`, `max_retries` and `fields`.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#OutlierDetection
+    """  # noqa: E501
+    return set_outlier_detection(
+        destination_rule_name,
+        {
+            "consecutive5xxErrors": consecutive_5xx_errors,
+            "interval": interval,
+            "baseEjectionTime": base_ejection_time,
+            "maxEjectionPercent": max_ejection_percent,
+        },
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def patch_traffic_policy(
+    destination_rule_name: str,
+    setting: str,
+    value: Optional[Dict[str, Any]],
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    record: bool = True,
+) -> Dict[str, Any]:
+    """
+    Set the `setting` of the traffic policy of a destination rule, or of its
+    `subset`, to `value` or remove it when `value` is `None`. Nothing is
+    written when the setting already has that value.
+
+    Unless `record` is `False`, the setting is recorded in the ledger as it
+    was before the first change so it can be restored.
+    """
+    check_patch_strategy(patch_strategy)
+    url = destination_rule_url(version, ns, destination_rule_name)
+    # the setting as the last attempt read it
+    last = {}
+
+    def attempt_patch(attempt: int) -> Dict[str, Any]:
+        result = read_destination_rule(
+            destination_rule_name, ns, version, configuration, secrets
+        )
+        destination_rule = result["body"]
+        _, policy = locate_traffic_policy(destination_rule, subset)
+        last["original"] = (policy or {}).get(setting)
+        if last["original"] == value:
+            logger.debug(
+                "Destination rule '{}' already has this {}, not patching "
+                "it".format(destination_rule_name, setting)
+            )
+            return dict(result, changed=False)
+
+        api = create_k8s_api_client(configuration, secrets)
+        content_type, payload = traffic_policy_patch(
+            patch_strategy, version, destination_rule, subset, setting, value
+        )
+        return call_api(
+            api,
+            url,
+            "PATCH",
+            header_params={
+                "Content-Type": content_type,
+                "Accept": "application/json",
+            },
+            body=payload,
+        )
+
+    result = patch_with_retries(
+        url,
+        attempt_patch,
+        max_retries,
+        "Destination rule '{}'".format(destination_rule_name),
+    )
+    if "changed" not in result:
+        result["changed"] = result["status"] < 400
+        if record and result["changed"]:
+            record_traffic_policy(
+                destination_rule_name,
+                ns,
+                version,
+                subset,
+                setting,
+                last["original"],
+                configuration,
+                cluster_of(secrets),
+            )
+
+    if fields is not None:
+        return slim_result(result, fields)
+    return result
+
+
+def restore_traffic_policy(
+    destination_rule_name: str,
+    setting: str,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Put back the `setting` recorded in the ledger before it was first
+    changed, leaving it as it is when none was recorded.
+    """
+    key = setting_key(subset, setting)
+    entry = next(
+        (
+            e
+            for e in pending_faults(configuration)
+            if is_entry_of(
+                e,
+                destination_rule_name,
+                ns,
+                version,
+                secrets,
+                "DestinationRule",
+            )
+            and key in e["settings"]
+        ),
+        None,
+    )
+    if entry is None:
+        logger.debug(
+            "No {} of destination rule '{}' was recorded, leaving it "
+            "alone".format(setting, destination_rule_name)
+        )
+        result = read_destination_rule(
+            destination_rule_name, ns, version, configuration, secrets
+        )
+        result = dict(result, changed=False)
+        if fields is not None:
+            return slim_result(result, fields)
+        return result
+
+    result = patch_traffic_policy(
+        destination_rule_name,
+        setting,
+        entry["settings"][key]["value"],
+        subset=subset,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        record=False,
+    )
+    if result["status"] < 400:
+        forget_traffic_policy(entry, key, configuration)
+    return result
+
+
+def restore_traffic_policies(
+    entry: Dict[str, Any],
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Put back, in a single JSON Patch, the settings recorded in the ledger
+    entry of a destination rule, in the cluster it belongs to.
+    """
+    if entry.get("cluster"):
+        secrets = dict(secrets or {}, **entry["cluster"])
+    name, ns, version = entry["name"], entry["ns"], entry["version"]
+    url = destination_rule_url(version, ns, name)
+
+    def attempt_patch(attempt: int) -> Dict[str, Any]:
+        result = get_destination_rule(
+            name,
+            ns=ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        )
+        if result["status"] != 200:
+            return result
+
+        # each change is applied to a copy so the next ones build on it
+        destination_rule = deepcopy(result["body"])
+        ops = []
+        for recorded in entry["settings"].values():
+            subset, setting = recorded["subset"], recorded["setting"]
+            try:
+                changes = traffic_policy_ops(
+                    destination_rule, subset, setting, recorded["value"]
+                )
+            except ActivityFailed:
+                # the subset is gone, and its settings with it
+                continue
+            ops.extend(changes)
+            set_traffic_policy(
+                destination_rule, subset, setting, recorded["value"]
+            )
+
+        if not ops:
+            return result
+
+        api = create_k8s_api_client(configuration, secrets)
+        return call_api(
+            api,
+            url,
+            "PATCH",
+            header_params={
+                "Content-Type": "application/json-patch+json",
+                "Accept": "application/json",
+            },
+            body=resource_version_test(result["body"]) + ops,
+        )
+
+    return patch_with_retries(
+        url,
+        attempt_patch,
+        max_retries,
+        "Destination rule '{}'".format(name),
+    )
+
+
+def read_destination_rule(
+    destination_rule_name: str,
+    ns: str,
+    version: str,
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    result = get_destination_rule(
+        destination_rule_name,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+    )
+    if result["status"] != 200:
+        raise ActivityFailed(
+            "Destination Rule '{}' does not exist: {}".format(
+                destination_rule_name, str(result["body"])
+            )
+        )
+    return result
+
+
+def traffic_policy_patch(
+    patch_strategy: str,
+    version: str,
+    destination_rule: Dict[str, Any],
+    subset: Optional[str],
+    setting: str,
+    value: Optional[Dict[str, Any]],
+) -> Tuple[str, Any]:
+    """
+    Return the content type and payload of the patch setting, or removing
+    when `value` is `None`, the `setting` of the traffic policy of the
+    destination rule or of its `subset`.
+    """
+    path, policy = locate_traffic_policy(destination_rule, subset)
+    if patch_strategy == "merge":
+        spec = destination_rule["spec"]
+        if subset is None:
+            current = (policy or {}).get(setting)
+            patch = {"trafficPolicy": {setting: replacement(current, value)}}
+        else:
+            # lists are replaced as a whole by a merge-patch
+            subsets = deepcopy(spec["subsets"])
+            index = int(path.split("/")[3])
+            policy = subsets[index].setdefault("trafficPolicy", {})
+            if value is None:
+                policy.pop(setting, None)
+            else:
+                policy[setting] = value
+            patch = {"subsets": subsets}
+
+        return "application/merge-patch+json", {
+            "apiVersion": version,
+            "kind": "DestinationRule",
+            "metadata": {"name": destination_rule["metadata"]["name"]},
+            "spec": patch,
+        }
+
+    ops = resource_version_test(destination_rule)
+    ops.extend(traffic_policy_ops(destination_rule, subset, setting, value))
+    return "application/json-patch+json", ops
+
+
+def traffic_policy_ops(
+    destination_rule: Dict[str, Any],
+    subset: Optional[str],
+    setting: str,
+    value: Optional[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    JSON Patch operations setting, or removing when `value` is `None`, the
+    `setting` of the traffic policy of the destination rule or of its
+    `subset`, none when it already has that value.
+    """
+    path, policy = locate_traffic_policy(destination_rule, subset)
+    if (policy or {}).get(setting) == value:
+        return []
+    if policy is None:
+        return [{"op": "add", "path": path, "value": {setting: value}}]
+    path = "{}/{}".format(path, setting)
+    if value is None:
+        return [{"op": "remove", "path": path}]
+    return [{"op": "add", "path": path, "value": value}]
+
+
+def set_traffic_policy(
+    destination_rule: Dict[str, Any],
+    subset: Optional[str],
+    setting: str,
+    value: Optional[Dict[str, Any]],
+) -> None:
+    """
+    Change the destination rule in place as the operations of
+    `traffic_policy_ops` would.
+    """
+    path, policy = locate_traffic_policy(destination_rule, subset)
+    if value is None:
+        if policy is not None:
+            policy.pop(setting, None)
+        return
+
+    holder = destination_rule["spec"]
+    if subset is not None:
+        holder = holder["subsets"][int(path.split("/")[3])]
+    holder.setdefault("trafficPolicy", {})[setting] = value
+
+
+def resource_version_test(
+    destination_rule: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    """
+    JSON Patch operation failing the patch when the destination rule was
+    changed since it was read, if it has a resource version.
+    """
+    resource_version = destination_rule.get("metadata", {}).get(
+        "resourceVersion"
+    )
+    if not resource_version:
+        return []
+    return [
+        {
+            "op": "test",
+            "path": "/metadata/resourceVersion",
+            "value": resource_version,
+        }
+    ]
+
+
+def replacement(current: Any, value: Any) -> Any:
+    """
+    Merge-patch value replacing `current` by `value`: objects are merged
+    by a merge-patch so their members missing from `value` are nulled.
+    """
+    if not isinstance(current, dict) or not isinstance(value, dict):
+        return value
+
+    patch = {k: None for k in current if k not in value}
+    for k, v in value.items():
+        patch[k] = replacement(current.get(k), v)
+    return patch
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, List, Optional, Tuple
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import call_api, destination_rule_url, slim_result
+
+__all__ = ["get_destination_rule", "get_traffic_policy"]
+
+
+def get_destination_rule(
+    destination_rule_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    Get a destination rule identified by `name`
+
+    Set `fields` to a list of dotted paths, such as
+    `spec.trafficPolicy.connectionPool`, to only return these fields of the
+    destination rule and no headers.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/
+    """  # noqa: E501
+    api = create_k8s_api_client(configuration, secrets)
+    url = destination_rule_url(version, ns, destination_rule_name)
+    result = call_api(
+        api, url, "GET", header_params={"Accept": "application/json"}
+    )
+
+    if fields is not None:
+        return slim_result(result, fields)
+    return result
+
+
+def get_traffic_policy(
+    destination_rule_name: str,
+    subset: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Get the traffic policy of a destination rule, or of one of its subsets,
+    such as its `connectionPool` and `outlierDetection` settings
+
+    The traffic policy of a subset is returned as declared, without the
+    settings it inherits from the destination rule.
+
+    See https://istio.io/latest/docs/reference/config/networking/destination-rule/#TrafficPolicy
+    """  # noqa: E501
+    result = get_destination_rule(
+        destination_rule_name,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+    )
+    if result["status"] != 200:
+        raise ActivityFailed(
+            "Destination Rule '{}' does not exist: {}".format(
+                destination_rule_name, str(result["body"])
+            )
+        )
+
+    _, policy = locate_traffic_policy(result["body"], subset)
+    return policy or {}
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def locate_traffic_policy(
+    destination_rule: Dict[str, Any], subset: str = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Return the JSON pointer to the traffic policy of the destination rule,
+    or of its `subset`, and that policy, `None` when it has none yet.
+    """
+    spec = destination_rule["spec"]
+    if subset is None:
+        return "/spec/trafficPolicy", spec.get("trafficPolicy")
+
+    for i, declared in enumerate(spec.get("subsets") or []):
+        if declared.get("name") == subset:
+            return (
+                "/spec/subsets/{}/trafficPolicy".format(i),
+                declared.get("trafficPolicy"),
+            )
+
+    raise ActivityFailed(
+        "Destination Rule '{}' has no subset '{}'".format(
+            destination_rule["metadata"]["name"], subset
+        )
+    )
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import re
+from typing import Any, Dict, List, Union
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import call_api, resource_url
+from chaosistio.envoy.probes import MANAGED_BY, iter_envoy_faults
+
+__all__ = [
+    "add_bandwidth_limit",
+    "add_delay_distribution",
+    "remove_envoy_fault",
+    "remove_all_envoy_faults",
+]
+logger = logging.getLogger("chaostoolkit")
+CONTEXTS = ("SIDECAR_INBOUND", "SIDECAR_OUTBOUND", "GATEWAY")
+DELAY_HEADER = "x-envoy-fault-delay-request"
+DURATION = re.compile(r"^(\d+(?:\.\d+)?)(ms|s|m)$")
+DURATION_UNITS = {"ms": 1, "s": 1000, "m": 60000}
+
+LUA_DELAY_SAMPLER = """\
+local points = {{{points}}}
+
+function envoy_on_request(request_handle)
+  local u = math.random() * 100
+  local delay = points[#points][2]
+  for i = 2, #points do
+    if u <= points[i][1] then
+      local p0, p1 = points[i - 1], points[i]
+      delay = p0[2] + (p1[2] - p0[2]) * (u - p0[1]) / (p1[1] - p0[1])
+      break
+    end
+  end
+  request_handle:headers():replace("{header}", tostring(math.floor(delay)))
+end
+"""
+
+
+def add_bandwidth_limit(
+    envoy_filter_name: str,
+    workload_labels: Dict[str, str],
+    limit_kbps: int,
+    percentage: float = 100.0,
+    context: str = "SIDECAR_INBOUND",
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Cap to `limit_kbps` KiB per second the bandwidth of `percentage` percent
+    of the responses going through the sidecars of the workloads matching
+    `workload_labels`
+
+    With the default `SIDECAR_INBOUND` context, the responses of the
+    selected workloads are throttled. With `SIDECAR_OUTBOUND`, the
+    responses they receive from the services they call are.
+
+    The fault is an EnvoyFilter named `envoy_filter_name` inserting the
+    Envoy fault filter in front of the router, replaced when it already
+    exists. Remove it with `remove_envoy_fault` or
+    `remove_all_envoy_faults`.
+
+    See https://www.envoyproxy.io/docs/envoy/latest/api-v3/extensions/filters/http/fault/v3/fault.proto
+    """  # noqa: E501
+    if limit_kbps < 1:
+        raise ActivityFailed("The bandwidth limit must be at least 1 KiB/s")
+
+    fault = {
+        "response_rate_limit": {
+            "fixed_limit": {"limit_kbps": limit_kbps},
+            "percentage": fractional_percent(percentage),
+        }
+    }
+    return apply_envoy_filter(
+        envoy_filter_name,
+        workload_labels,
+        [fault_filter(fault)],
+        context=context,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+    )
+
+
+def add_delay_distribution(
+    envoy_filter_name: str,
+    workload_labels: Dict[str, str],
+    percentiles: Dict[str, str] = None,
+    percentage: float = 100.0,
+    context: str = "SIDECAR_INBOUND",
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Delay `percentage` percent of the requests going through the sidecars
+    of the workloads matching `workload_labels` following a latency
+    distribution rather than a fixed delay
+
+    The distribution is given by `percentiles`, mapping percentiles to
+    delays, for instance `{"50": "20ms", "90": "100ms", "99": "1s"}`. Each
+    request draws its delay from it, interpolating linearly between the
+    given percentiles and from no delay at the 0th percentile, and requests
+    above the last percentile get its delay. This reproduces tail latencies
+    a fixed delay cannot.
+
+    Without `percentiles`, the delay of each request is read, in
+    milliseconds, from its `x-envoy-fault-delay-request` header so clients
+    drive it.
+
+    The fault is an EnvoyFilter named `envoy_filter_name`, replaced when it
+    already exists, inserting before the router a Lua filter drawing the
+    delays and the Envoy fault filter applying them. Remove it with
+    `remove_envoy_fault` or `remove_all_envoy_faults`.
+
+    See https://www.envoyproxy.io/docs/envoy/latest/configuration/http/http_filters/fault_filter
+    """  # noqa: E501
+    filters = []
+    if percentiles:
+        filters.append(delay_sampler(percentiles))
+
+    fault = {
+        "delay": {
+            "header_delay": {},
+            "percentage": fractional_percent(percentage),
+        }
+    }
+    filters.append(fault_filter(fault))
+    return apply_envoy_filter(
+        envoy_filter_name,
+        workload_labels,
+        filters,
+        context=context,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+    )
+
+
+def remove_envoy_fault(
+    envoy_filter_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Delete the EnvoyFilter of a fault added by `add_bandwidth_limit` or
+    `add_delay_distribution`. A filter already gone is not an error.
+
+    Like `add_bandwidth_limit`, it refuses to touch an EnvoyFilter that was
+    not installed by these activities, as told by its
+    `app.kubernetes.io/managed-by` label. The delete is conditioned on the
+    filter still being the one that was checked.
+    """
+    api = create_k8s_api_client(configuration, secrets)
+    url = resource_url("envoyfilters", version, ns, envoy_filter_name)
+    result = call_api(
+        api, url, "GET", header_params={"Accept": "application/json"}
+    )
+    if result["status"] == 200:
+        metadata = managed_metadata(
+            envoy_filter_name, result["body"], "deleting"
+        )
+        preconditions = {
+            k: metadata[k] for k in ("uid", "resourceVersion") if k in metadata
+        }
+        result = call_api(
+            api,
+            url,
+            "DELETE",
+            header_params={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+            body={
+                "apiVersion": "v1",
+                "kind": "DeleteOptions",
+                "preconditions": preconditions,
+            },
+        )
+
+    if result["status"] >= 400 and result["status"] != 404:
+        raise ActivityFailed(
+            "Failed to delete EnvoyFilter '{}': {}".format(
+                envoy_filter_name, str(result["body"])
+            )
+        )
+    return {"name": envoy_filter_name, "ns": ns, "status": result["status"]}
+
+
+def remove_all_envoy_faults(
+    ns: str = None,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Delete every EnvoyFilter installed by the actions of this module, in
+    `ns` or in all namespaces when not set, for instance as a rollback
+
+    They are found by their `app.kubernetes.io/managed-by` label so filters
+    left behind by an interrupted experiment are removed too.
+    """
+    removed = []
+    for obj in list(iter_envoy_faults(ns, version, configuration, secrets)):
+        metadata = obj["metadata"]
+        removed.append(
+            remove_envoy_fault(
+                metadata["name"],
+                ns=metadata["namespace"],
+                version=version,
+                configuration=configuration,
+                secrets=secrets,
+            )
+        )
+    return {"removed": removed}
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def apply_envoy_filter(
+    envoy_filter_name: str,
+    workload_labels: Dict[str, str],
+    filters: List[Dict[str, Any]],
+    context: str = "SIDECAR_INBOUND",
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Create, or replace, the EnvoyFilter inserting `filters`, in that order,
+    before the router of the selected workloads.
+
+    An existing EnvoyFilter is only replaced when it was installed by these
+    activities, as told by its `app.kubernetes.io/managed-by` label.
+    """
+    if context not in CONTEXTS:
+        raise ActivityFailed(
+            "Unknown context '{}', must be one of: {}".format(
+                context, ", ".join(CONTEXTS)
+            )
+        )
+    if not workload_labels:
+        raise ActivityFailed("Select the workloads with their labels")
+
+    body = envoy_filter(
+        envoy_filter_name, ns, version, workload_labels, filters, context
+    )
+    api = create_k8s_api_client(configuration, secrets)
+    url = resource_url("envoyfilters", version, ns)
+    result = call_api(
+        api,
+        url,
+        "POST",
+        header_params={
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        },
+        body=body,
+    )
+    if result["status"] == 409:
+        result = replace_envoy_filter(api, url, body)
+
+    if result["status"] >= 400:
+        raise ActivityFailed(
+            "Failed to install EnvoyFilter '{}': {}".format(
+                envoy_filter_name, str(result["body"])
+            )
+        )
+    return result
+
+
+def replace_envoy_filter(
+    api: Any, url: str, body: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Replace the EnvoyFilter that already exists with the name of `body`,
+    refusing to take over one we did not install.
+    """
+    name = body["metadata"]["name"]
+    url = "{}/{}".format(url, name)
+    result = call_api(
+        api, url, "GET", header_params={"Accept": "application/json"}
+    )
+    if result["status"] != 200:
+        return result
+
+    metadata = managed_metadata(name, result["body"], "replacing")
+    labels = metadata.get("labels") or {}
+    ops = []
+    if metadata.get("resourceVersion"):
+        # the filter we checked must still be the one we replace
+        ops.append(
+            {
+                "op": "test",
+                "path": "/metadata/resourceVersion",
+                "value": metadata["resourceVersion"],
+            }
+        )
+    ops.extend(
+        [
+            # unlike `replace`, `add` does not require the member to exist
+            {
+                "op": "add",
+                "path": "/metadata/labels",
+                "value": dict(labels, **body["metadata"]["labels"]),
+            },
+            {"op": "add", "path": "/spec", "value": body["spec"]},
+        ]
+    )
+
+    logger.debug("EnvoyFilter '{}' exists, replacing it".format(name))
+    return call_api(
+        api,
+        url,
+        "PATCH",
+        header_params={
+            "Content-Type": "application/json-patch+json",
+            "Accept": "application/json",
+        },
+        body=ops,
+    )
+
+
+def managed_metadata(
+    name: str, obj: Dict[str, Any], doing: str
+) -> Dict[str, Any]:
+    """
+    Metadata of the existing EnvoyFilter `obj`, refusing to go on `doing`
+    something to it when we did not install it.
+    """
+    metadata = obj.get("metadata", {})
+    labels = metadata.get("labels") or {}
+    if labels.get("app.kubernetes.io/managed-by") != MANAGED_BY:
+        raise ActivityFailed(
+            "EnvoyFilter '{}' exists and is not managed by {}, not "
+            "{} it".format(name, MANAGED_BY, doing)
+        )
+    return metadata
+
+
+def envoy_filter(
+    envoy_filter_name: str,
+    ns: str,
+    version: str,
+    workload_labels: Dict[str, str],
+    filters: List[Dict[str, Any]],
+    context: str,
+) -> Dict[str, Any]:
+    match = {
+        "context": context,
+        "listener": {
+            "filterChain": {
+                "filter": {
+                    "name": "envoy.filters.network.http_connection_manager",
+                    "subFilter": {"name": "envoy.filters.http.router"},
+                }
+            }
+        },
+    }
+    return {
+        "apiVersion": version,
+        "kind": "EnvoyFilter",
+        "metadata": {
+            "name": envoy_filter_name,
+            "namespace": ns,
+            "labels": {"app.kubernetes.io/managed-by": MANAGED_BY},
+        },
+        "spec": {
+            "workloadSelector": {"labels": dict(workload_labels)},
+            # each filter goes right before the router, thus after the
+            # previous ones
+            "configPatches": [
+                {
+                    "applyTo": "HTTP_FILTER",
+                    "match": match,
+                    "patch": {"operation": "INSERT_BEFORE", "value": f},
+                }
+                for f in filters
+            ],
+        },
+    }
+
+
+def fault_filter(fault: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": "chaosistio.fault",
+        "typed_config": dict(
+            fault,
+            **{
+                "@type": "type.googleapis.com/"
+                "envoy.extensions.filters.http.fault.v3.HTTPFault"
+            },
+        ),
+    }
+
+
+def delay_sampler(percentiles: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Lua filter setting the delay header of each request to a delay drawn
+    from the distribution given by `percentiles`.
+    """
+    points = [(0.0, 0.0)] + sorted(
+        (parse_percentile(p), parse_duration(d))
+        for (p, d) in percentiles.items()
+    )
+    for (p0, d0), (p1, d1) in zip(points, points[1:]):
+        if p1 == p0 or d1 < d0:
+            raise ActivityFailed(
+                "Delays must increase with their percentile: {}".format(
+                    json.dumps(percentiles)
+                )
+            )
+
+    code = LUA_DELAY_SAMPLER.format(
+        points=", ".join("{{{}, {}}}".format(p, d) for (p, d) in points),
+        header=DELAY_HEADER,
+    )
+    return {
+        "name": "chaosistio.delay_sampler",
+        "typed_config": {
+            "@type": "type.googleapis.com/"
+            "envoy.extensions.filters.http.lua.v3.Lua",
+            "default_source_code": {"inline_string": code},
+        },
+    }
+
+
+def fractional_percent(percentage: float) -> Dict[str, Any]:
+    if not 0 <= percentage <= 100:
+        raise ActivityFailed("A percentage must be between 0 and 100")
+    return {"numerator": round(percentage * 10000), "denominator": "MILLION"}
+
+
+def parse_percentile(percentile: Union[str, float]) -> float:
+    try:
+        value = float(percentile)
+    except ValueError:
+        raise ActivityFailed("Invalid percentile '{}'".format(percentile))
+    if not 0 < value <= 100:
+        raise ActivityFailed("Percentiles must be in ]0, 100]")
+    return value
+
+
+def parse_duration(duration: Union[str, int]) -> float:
+    """
+    Milliseconds of a duration such as `20ms`, `1.5s` or `1m`, a bare number
+    being milliseconds already.
+    """
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    m = DURATION.match(duration.strip())
+    if not m:
+        raise ActivityFailed("Invalid duration '{}'".format(duration))
+    return float(m.group(1)) * DURATION_UNITS[m.group(2)]
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, Iterator, List
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import iter_listing, resource_url, stream_list
+
+__all__ = ["list_envoy_faults"]
+MANAGED_BY = "chaostoolkit-istio"
+
+
+def list_envoy_faults(
+    ns: str = None,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> List[Dict[str, Any]]:
+    """
+    List the EnvoyFilters installed by the `chaosistio.envoy.actions`
+    faults, in `ns` or in all namespaces when not set
+
+    An empty list tells the faults were all removed.
+    """
+    return [
+        {
+            "name": obj["metadata"]["name"],
+            "ns": obj["metadata"]["namespace"],
+            "workloadSelector": obj["spec"].get("workloadSelector"),
+        }
+        for obj in iter_envoy_faults(ns, version, configuration, secrets)
+    ]
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def iter_envoy_faults(
+    ns: str = None,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Iterator[Dict[str, Any]]:
+    api = create_k8s_api_client(configuration, secrets)
+    listing = stream_list(
+        api,
+        resource_url("envoyfilters", version, ns),
+        header_params={"Accept": "application/json"},
+        query_params=[
+            (
+                "labelSelector",
+                "app.kubernetes.io/managed-by={}".format(MANAGED_BY),
+            )
+        ],
+    )
+    result = {}
+    yield from iter_listing(listing, result)
+
+    if result["status"] != 200:
+        raise ActivityFailed(
+            "Failed to list EnvoyFilters: {}".format(str(result["body"]))
+        )
@@ -0,0 +1,807 @@
+# -*- coding: utf-8 -*-
+"""
+In-memory fake of the Kubernetes API server, serving Istio resources, to run
+experiments and tests without a cluster.
+
+It implements GET, LIST, WATCH, POST, PATCH (JSON merge patch and JSON
+Patch) and DELETE on namespaced custom resources, such as virtual services,
+and enforces `resourceVersion` conflicts and the preconditions of deletes
+like the real API server does. Objects are served at every version of their
+group.
+
+Start it from Python:
+
+    with FakeApiServer() as server:
+        server.add(virtual_service)
+        os.environ["KUBERNETES_HOST"] = server.url
+
+or as a standalone process, optionally loading objects from JSON files:
+
+    $ python -m chaosistio.fakeserver --port 8001 virtual-services.json
+
+Pytest fixtures are provided by the `chaosistio.pytest_plugin` module.
+"""
+
+import argparse
+import base64
+import json
+import re
+import threading
+import uuid
+from collections import deque
+from copy import deepcopy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+__all__ = ["FakeApiServer", "virtual_service", "destination_rule"]
+PLURALS = {
+    "VirtualService": "virtualservices",
+    "DestinationRule": "destinationrules",
+    "Gateway": "gateways",
+    "ServiceEntry": "serviceentries",
+    "Sidecar": "sidecars",
+    "EnvoyFilter": "envoyfilters",
+    "WorkloadEntry": "workloadentries",
+    "Pod": "pods",
+}
+KINDS = {plural: kind for (kind, plural) in PLURALS.items()}
+Key = Tuple[str, str, str, str]
+
+
+class FakeApiServer:
+    """
+    Kubernetes API server holding its objects in memory and serving them
+    from a background thread.
+
+    The server also counts the requests it handled, in total and per method,
+    and the bytes it received and sent, see `reset_counters`.
+
+    Watches replay the last `history_size` changes, older resource versions
+    get a `410 Gone` error, as the real API server does once they were
+    compacted.
+    """
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, history_size: int = 1000
+    ):
+        self.objects: Dict[Key, Dict[str, Any]] = {}
+        self.resource_version = 0
+        self.history = deque(maxlen=history_size)
+        self.changed = threading.Condition()
+        self.closing = False
+        self.counters_lock = threading.Lock()
+        self.reset_counters()
+        self.httpd = ThreadingHTTPServer((host, port), handler(self))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self) -> "FakeApiServer":
+        """
+        Serve requests from a background thread.
+        """
+        self.thread = threading.Thread(
+            target=self.serve_forever,
+            name="chaosistio-fake-api-server",
+            daemon=True,
+        )
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        with self.changed:
+            self.closing = True
+            self.changed.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeApiServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def serve_forever(self) -> None:
+        """
+        Serve requests from the calling thread until `stop` is called.
+        """
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def reset_counters(self) -> None:
+        with self.counters_lock:
+            self.requests = 0
+            self.requests_by_method = {}
+            self.bytes_received = 0
+            self.bytes_sent = 0
+
+    def add(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Create or replace an object, its `apiVersion`, `kind` and metadata
+        `name` and `namespace` tell where it is served from.
+        """
+        obj = deepcopy(obj)
+        metadata = obj.setdefault("metadata", {})
+        metadata.setdefault("namespace", "default")
+        key = object_key(obj)
+        with self.changed:
+            event = "MODIFIED" if key in self.objects else "ADDED"
+            return deepcopy(self.store(key, obj, event))
+
+    def get(
+        self, kind: str, name: str, ns: str = "default"
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return a copy of the object of the given kind, or `None`.
+        """
+        for key, obj in list(self.objects.items()):
+            if obj["kind"] == kind and key[2:] == (ns, name):
+                return deepcopy(obj)
+
+    def delete(self, kind: str, name: str, ns: str = "default") -> bool:
+        with self.changed:
+            for key, obj in list(self.objects.items()):
+                if obj["kind"] == kind and key[2:] == (ns, name):
+                    self.remove(key)
+                    return True
+        return False
+
+    ###########################################################################
+    # Request handling, called from the handler threads
+    ###########################################################################
+    def count(
+        self, method: str = None, received: int = 0, sent: int = 0
+    ) -> None:
+        with self.counters_lock:
+            if method:
+                self.requests += 1
+                self.requests_by_method[method] = (
+                    self.requests_by_method.get(method, 0) + 1
+                )
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def handle_get(
+        self, path: "ResourcePath", query: Dict[str, str]
+    ) -> Tuple[int, Dict[str, Any]]:
+        if path.name:
+            obj = self.objects.get(path.key)
+            if obj is None:
+                return 404, not_found(path)
+            return 200, path.served(obj)
+        return self.list(path, query)
+
+    def list(
+        self, path: "ResourcePath", query: Dict[str, str]
+    ) -> Tuple[int, Dict[str, Any]]:
+        with self.changed:
+            items = sorted(
+                (
+                    (key, obj)
+                    for (key, obj) in self.objects.items()
+                    if path.contains(key) and selected(obj, query)
+                ),
+                key=lambda i: i[0],
+            )
+            resource_version = str(self.resource_version)
+
+        offset = 0
+        if query.get("continue"):
+            try:
+                offset = json.loads(base64.b64decode(query["continue"]))["o"]
+            except ValueError:
+                return 400, status(400, "BadRequest", "invalid continue")
+
+        limit = int(query.get("limit") or 0)
+        page = items[offset : offset + limit] if limit else items[offset:]
+        metadata = {"resourceVersion": resource_version}
+        if limit and offset + limit < len(items):
+            token = json.dumps({"o": offset + limit}).encode("utf-8")
+            metadata["continue"] = base64.b64encode(token).decode("ascii")
+            metadata["remainingItemCount"] = len(items) - offset - limit
+
+        return 200, {
+            "apiVersion": path.api_version,
+            "kind": "{}List".format(KINDS.get(path.plural, "")),
+            "metadata": metadata,
+            "items": [path.served(obj) for (_, obj) in page],
+        }
+
+    def handle_create(
+        self, path: "ResourcePath", obj: Any
+    ) -> Tuple[int, Dict[str, Any]]:
+        if not isinstance(obj, dict) or "kind" not in obj:
+            return 400, status(400, "BadRequest", "invalid object")
+
+        metadata = obj.setdefault("metadata", {})
+        metadata.setdefault("namespace", path.ns or "default")
+        metadata.pop("resourceVersion", None)
+        if not metadata.get("name"):
+            return 422, status(422, "Invalid", "metadata.name is required")
+        obj["apiVersion"] = path.api_version
+        key = (path.group, path.plural, metadata["namespace"], metadata["name"])
+        with self.changed:
+            if key in self.objects:
+                return 409, status(
+                    409,
+                    "AlreadyExists",
+                    '{} "{}" already exists'.format(path.plural, key[3]),
+                )
+            return 201, path.served(self.store(key, obj, "ADDED"))
+
+    def handle_patch(
+        self,
+        path: "ResourcePath",
+        content_type: str,
+        patch: Any,
+        query: Dict[str, str],
+    ) -> Tuple[int, Dict[str, Any]]:
+        with self.changed:
+            current = self.objects.get(path.key)
+            if current is None:
+                return 404, not_found(path)
+
+            obj = deepcopy(current)
+            if content_type == "application/merge-patch+json":
+                expected = (patch.get("metadata") or {}).get("resourceVersion")
+                if expected and expected != obj["metadata"]["resourceVersion"]:
+                    return 409, conflict(path)
+                obj = merge_patch(obj, patch)
+            elif content_type == "application/json-patch+json":
+                try:
+                    obj = json_patch(obj, patch)
+                except PatchTestFailed as x:
+                    return 422, status(422, "Invalid", str(x))
+                except (KeyError, IndexError, TypeError, ValueError) as x:
+                    return 422, status(
+                        422, "Invalid", "invalid patch: {}".format(x)
+                    )
+            else:
+                return 415, status(
+                    415,
+                    "UnsupportedMediaType",
+                    "the body of the request was in an unknown format: "
+                    "{}".format(content_type),
+                )
+
+            if query.get("dryRun") == "All":
+                obj["metadata"]["resourceVersion"] = current["metadata"][
+                    "resourceVersion"
+                ]
+                return 200, path.served(obj)
+            return 200, path.served(self.store(path.key, obj, "MODIFIED"))
+
+    def handle_delete(
+        self, path: "ResourcePath", options: Any = None
+    ) -> Tuple[int, Dict[str, Any]]:
+        preconditions = (options or {}).get("preconditions") or {}
+        with self.changed:
+            current = self.objects.get(path.key)
+            if current is None:
+                return 404, not_found(path)
+            for field in ("uid", "resourceVersion"):
+                expected = preconditions.get(field)
+                actual = current["metadata"].get(field)
+                if expected and expected != actual:
+                    return 409, status(
+                        409,
+                        "Conflict",
+                        "Precondition failed: {0} in precondition: {1}, "
+                        "{0} in object meta: {2}".format(
+                            field[0].upper() + field[1:], expected, actual
+                        ),
+                    )
+            return 200, path.served(self.remove(path.key))
+
+    def watch(
+        self, path: "ResourcePath", query: Dict[str, str]
+    ) -> Iterable[Dict[str, Any]]:
+        """
+        Yield the watch events of the objects under `path`, until
+        `timeoutSeconds` elapsed or the server stops.
+        """
+        timeout = float(query.get("timeoutSeconds") or 1800)
+        bookmarks = query.get("allowWatchBookmarks") == "true"
+        since = query.get("resourceVersion") or "0"
+
+        with self.changed:
+            if since == "0":
+                pending = [
+                    {"type": "ADDED", "object": path.served(obj)}
+                    for (key, obj) in sorted(self.objects.items())
+                    if path.contains(key) and selected(obj, query)
+                ]
+                since = self.resource_version
+            else:
+                since = int(since)
+                oldest = self.history[0][0] if self.history else None
+                if since < self.resource_version and (
+                    oldest is None or since < oldest - 1
+                ):
+                    yield {
+                        "type": "ERROR",
+                        "object": status(
+                            410,
+                            "Expired",
+                            "too old resource version: {}".format(since),
+                        ),
+                    }
+                    return
+                pending = []
+
+        yield from pending
+        deadline = threading.Event()
+        timer = threading.Timer(timeout, self.wake, (deadline,))
+        timer.daemon = True
+        timer.start()
+        try:
+            while True:
+                with self.changed:
+                    events = [
+                        (rv, kind, obj)
+                        for (rv, kind, key, obj) in self.history
+                        if rv > since
+                        and path.contains(key)
+                        and selected(obj, query)
+                    ]
+                    if not events and not (self.closing or deadline.is_set()):
+                        self.changed.wait()
+                        continue
+                    if self.history:
+                        since = max(since, self.history[-1][0])
+
+                for _, kind, obj in events:
+                    yield {"type": kind, "object": path.served(obj)}
+
+                if self.closing or deadline.is_set():
+                    break
+        finally:
+            timer.cancel()
+
+        if bookmarks and not self.closing:
+            yield {
+                "type": "BOOKMARK",
+                "object": {
+                    "apiVersion": path.api_version,
+                    "kind": "",
+                    "metadata": {"resourceVersion": str(since)},
+                },
+            }
+
+    def wake(self, deadline: threading.Event) -> None:
+        with self.changed:
+            deadline.set()
+            self.changed.notify_all()
+
+    def store(
+        self, key: Key, obj: Dict[str, Any], event: str
+    ) -> Dict[str, Any]:
+        """
+        Save an object under a new resource version. Must be called while
+        holding `self.changed`.
+        """
+        self.resource_version += 1
+        obj["metadata"]["resourceVersion"] = str(self.resource_version)
+        previous = self.objects.get(key)
+        obj["metadata"].setdefault(
+            "uid",
+            previous["metadata"]["uid"] if previous else str(uuid.uuid4()),
+        )
+        obj["metadata"].setdefault("generation", 0)
+        obj["metadata"]["generation"] += 1
+        self.objects[key] = obj
+        self.history.append((self.resource_version, event, key, obj))
+        self.changed.notify_all()
+        return obj
+
+    def remove(self, key: Key) -> Dict[str, Any]:
+        obj = self.objects.pop(key)
+        self.resource_version += 1
+        deleted = dict(
+            obj,
+            metadata=dict(
+                obj["metadata"], resourceVersion=str(self.resource_version)
+            ),
+        )
+        self.history.append((self.resource_version, "DELETED", key, deleted))
+        self.changed.notify_all()
+        return obj
+
+
+def virtual_service(
+    name: str = "reviews",
+    ns: str = "default",
+    routes: int = 10,
+    labels: Dict[str, str] = None,
+    version: str = "networking.istio.io/v1alpha3",
+) -> Dict[str, Any]:
+    """
+    Build a virtual service with `routes` http routes, each one forwarding
+    to its own subset of the host named after the virtual service.
+    """
+    metadata = {"name": name, "namespace": ns}
+    if labels:
+        metadata["labels"] = dict(labels)
+    return {
+        "apiVersion": version,
+        "kind": "VirtualService",
+        "metadata": metadata,
+        "spec": {
+            "hosts": [name],
+            "http": [
+                {
+                    "name": "route-{}".format(i),
+                    "match": [{"uri": {"prefix": "/r{}".format(i)}}],
+                    "route": [
+                        {
+                            "destination": {
+                                "host": name,
+                                "subset": "v{}".format(i),
+                            }
+                        }
+                    ],
+                }
+                for i in range(routes)
+            ],
+        },
+    }
+
+
+def destination_rule(
+    name: str = "reviews",
+    ns: str = "default",
+    subsets: int = 3,
+    traffic_policy: Dict[str, Any] = None,
+    version: str = "networking.istio.io/v1alpha3",
+) -> Dict[str, Any]:
+    """
+    Build a destination rule for the host named after it, with `subsets`
+    subsets matching the `version` label of its pods.
+    """
+    spec = {
+        "host": name,
+        "subsets": [
+            {"name": "v{}".format(i), "labels": {"version": "v{}".format(i)}}
+            for i in range(subsets)
+        ],
+    }
+    if traffic_policy:
+        spec["trafficPolicy"] = deepcopy(traffic_policy)
+    return {
+        "apiVersion": version,
+        "kind": "DestinationRule",
+        "metadata": {"name": name, "namespace": ns},
+        "spec": spec,
+    }
+
+
+def main(args: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m chaosistio.fakeserver",
+        description="Serve Istio resources from an in-memory fake "
+        "Kubernetes API server",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "files",
+        nargs="*",
+        help="JSON files holding an object, a list of objects or a List",
+    )
+    options = parser.parse_args(args)
+
+    server = FakeApiServer(options.host, options.port)
+    for path in options.files:
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict) and "items" in data:
+            data = data["items"]
+        for obj in data if isinstance(data, list) else [data]:
+            server.add(obj)
+
+    print("Serving fake Kubernetes API on {}".format(server.url), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+###############################################################################
+# Private functions
+###############################################################################
+class PatchTestFailed(Exception):
+    pass
+
+
+class ResourcePath:
+    """
+    Parsed `/apis/{group}/{version}[/namespaces/{ns}]/{plural}[/{name}]`
+    URL path, or `/api/{version}/...` for the core group.
+    """
+
+    def __init__(self, path: str):
+        parts = [p for p in path.split("/") if p]
+        if len(parts) >= 3 and parts[0] == "apis":
+            self.group, self.version, rest = parts[1], parts[2], parts[3:]
+        elif len(parts) >= 2 and parts[0] == "api":
+            self.group, self.version, rest = "", parts[1], parts[2:]
+        else:
+            raise ValueError(path)
+
+        self.ns = None
+        if len(rest) >= 3 and rest[0] == "namespaces":
+            self.ns, rest = rest[1], rest[2:]
+        if not rest or len(rest) > 2:
+            raise ValueError(path)
+        self.plural = rest[0]
+        self.name = rest[1] if len(rest) == 2 else None
+
+    @property
+    def api_version(self) -> str:
+        if not self.group:
+            return self.version
+        return "{}/{}".format(self.group, self.version)
+
+    @property
+    def key(self) -> Key:
+        return (self.group, self.plural, self.ns, self.name)
+
+    def contains(self, key: Key) -> bool:
+        return key[:2] == (self.group, self.plural) and (
+            self.ns is None or key[2] == self.ns
+        )
+
+    def served(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Copy of a stored object as served at the requested version. Stored
+        objects are replaced, never changed in place, so a shallow copy is
+        enough.
+        """
+        return dict(obj, apiVersion=self.api_version)
+
+
+def handler(server: FakeApiServer) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            path, query = self.parse()
+            if path is None:
+                return
+            if query.get("watch") in ("true", "1"):
+                self.stream(server.watch(path, query))
+            else:
+                self.reply(*server.handle_get(path, query))
+
+        def do_POST(self) -> None:
+            path, _ = self.parse()
+            if path is not None:
+                self.reply(*server.handle_create(path, self.body))
+
+        def do_PATCH(self) -> None:
+            path, query = self.parse()
+            if path is not None:
+                content_type = self.headers.get("Content-Type", "")
+                self.reply(
+                    *server.handle_patch(
+                        path, content_type.split(";")[0], self.body, query
+                    )
+                )
+
+        def do_DELETE(self) -> None:
+            path, _ = self.parse()
+            if path is not None:
+                self.reply(*server.handle_delete(path, self.body))
+
+        def parse(self) -> Tuple[Optional[ResourcePath], Dict[str, str]]:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length) if length else b""
+            server.count(self.command, received=len(data))
+
+            url = urlsplit(self.path)
+            query = {k: v[-1] for (k, v) in parse_qs(url.query).items()}
+            try:
+                path = ResourcePath(url.path)
+            except ValueError:
+                self.reply(
+                    404,
+                    status(
+                        404,
+                        "NotFound",
+                        "the server could not find the requested resource",
+                    ),
+                )
+                return None, query
+            try:
+                self.body = json.loads(data) if data else None
+            except ValueError:
+                self.reply(400, status(400, "BadRequest", "invalid body"))
+                return None, query
+            return path, query
+
+        def reply(self, code: int, obj: Dict[str, Any]) -> None:
+            data = json.dumps(obj).encode("utf-8")
+            server.count(sent=len(data))
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream(self, events: Iterable[Dict[str, Any]]) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                for event in events:
+                    data = json.dumps(event).encode("utf-8") + b"\n"
+                    server.count(sent=len(data))
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+
+def object_key(obj: Dict[str, Any]) -> Key:
+    group = obj["apiVersion"].rpartition("/")[0]
+    kind = obj["kind"]
+    plural = PLURALS.get(kind, "{}s".format(kind.lower()))
+    metadata = obj["metadata"]
+    return (group, plural, metadata["namespace"], metadata["name"])
+
+
+def selected(obj: Dict[str, Any], query: Dict[str, str]) -> bool:
+    """
+    Tell if the object matches the `labelSelector` and `fieldSelector` of
+    the query.
+    """
+    metadata = obj.get("metadata", {})
+    labels = metadata.get("labels") or {}
+    for requirement in split_selector(query.get("labelSelector")):
+        if not label_matches(labels, requirement):
+            return False
+
+    fields = {
+        "metadata.name": metadata.get("name"),
+        "metadata.namespace": metadata.get("namespace"),
+    }
+    for requirement in split_selector(query.get("fieldSelector")):
+        match = re.match(r"^([\w.]+)\s*(!=|==|=)\s*(.*)$", requirement)
+        if not match or match.group(1) not in fields:
+            return False
+        field, op, value = match.groups()
+        if (fields[field] == value) != (op != "!="):
+            return False
+    return True
+
+
+def split_selector(selector: Optional[str]) -> List[str]:
+    if not selector:
+        return []
+    return [
+        r.strip()
+        for r in re.findall(r"(?:[^,(]|\([^)]*\))+", selector)
+        if r.strip()
+    ]
+
+
+def label_matches(labels: Dict[str, str], requirement: str) -> bool:
+    match = re.match(r"^([\w./-]+)\s+(in|notin)\s+\((.*)\)$", requirement)
+    if match:
+        key, op, values = match.groups()
+        values = {v.strip() for v in values.split(",")}
+        return (labels.get(key) in values) == (op == "in")
+
+    match = re.match(r"^([\w./-]+)\s*(!=|==|=)\s*(.*)$", requirement)
+    if match:
+        key, op, value = match.groups()
+        if op == "!=":
+            return labels.get(key) != value
+        return labels.get(key) == value
+
+    if requirement.startswith("!"):
+        return requirement[1:].strip() not in labels
+    return requirement in labels
+
+
+def merge_patch(target: Any, patch: Any) -> Any:
+    """
+    Apply a RFC 7386 JSON merge patch.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(target, dict):
+        target = {}
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        else:
+            target[key] = merge_patch(target.get(key), value)
+    return target
+
+
+def json_patch(target: Any, ops: List[Dict[str, Any]]) -> Any:
+    """
+    Apply the `test`, `add`, `replace` and `remove` operations of a RFC 6902
+    JSON Patch.
+    """
+    for op in ops:
+        tokens = [
+            t.replace("~1", "/").replace("~0", "~")
+            for t in op["path"].split("/")[1:]
+        ]
+        parent = target
+        for token in tokens[:-1]:
+            parent = parent[int(token) if isinstance(parent, list) else token]
+        last = tokens[-1]
+        if isinstance(parent, list):
+            last = len(parent) if last == "-" else int(last)
+
+        if op["op"] == "test":
+            if parent[last] != op["value"]:
+                raise PatchTestFailed(
+                    "the object has been modified; testing value {} "
+                    "failed".format(op["path"])
+                )
+        elif op["op"] == "remove":
+            del parent[last]
+        elif op["op"] == "add" and isinstance(parent, list):
+            parent.insert(last, op["value"])
+        elif op["op"] == "replace":
+            if isinstance(parent, dict) and last not in parent:
+                raise KeyError(op["path"])
+            parent[last] = op["value"]
+        elif op["op"] == "add":
+            parent[last] = op["value"]
+        else:
+            raise ValueError("unsupported operation {}".format(op["op"]))
+    return target
+
+
+def status(code: int, reason: str, message: str) -> Dict[str, Any]:
+    return {
+        "kind": "Status",
+        "apiVersion": "v1",
+        "metadata": {},
+        "status": "Failure",
+        "message": message,
+        "reason": reason,
+        "code": code,
+    }
+
+
+def not_found(path: ResourcePath) -> Dict[str, Any]:
+    return status(
+        404,
+        "NotFound",
+        '{}.{} "{}" not found'.format(path.plural, path.group, path.name),
+    )
+
+
+def conflict(path: ResourcePath) -> Dict[str, Any]:
+    return status(
+        409,
+        "Conflict",
+        'Operation cannot be fulfilled on {}.{} "{}": the object has been '
+        "modified; please apply your changes to the latest version and try "
+        "again".format(path.plural, path.group, path.name),
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
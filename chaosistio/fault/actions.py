@@ -1,23 +1,95 @@
 # -*- coding: utf-8 -*-
 import json
-from copy import deepcopy
-from typing import Any, Dict, List
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
 from chaoslib.exceptions import ActivityFailed
 from chaoslib.types import Configuration, Secrets
-from kubernetes.client.rest import ApiException
 
 from chaosistio import create_k8s_api_client
-from chaosistio.fault.probes import get_virtual_service
+from chaosistio.api import call_api, slim_result, virtual_service_url
+from chaosistio.clusters import (
+    Cluster,
+    cluster_key,
+    cluster_name,
+    cluster_of,
+    on_clusters,
+)
+from chaosistio.informer import get_informer, start_informer, stop_informers
+from chaosistio.instrumentation import emit
+from chaosistio.fault.diff import structural_diff
+from chaosistio.fault.ledger import (
+    entry_key,
+    forget_faults,
+    key_signature,
+    pending_faults,
+    ROUTE_FIELDS,
+    record_faults,
+    route_key,
+    route_records,
+    route_signature,
+)
+from chaosistio.fault.probes import (
+    get_virtual_service,
+    invalidate_virtual_services_cache,
+    iter_virtual_services,
+    read_virtual_service,
+)
+from chaosistio.fault.ramp import (
+    fault_with_percentage,
+    ramp_schedule,
+    start_ramp,
+    stop_ramps,
+)
+from chaosistio.fault.routes import get_route_index
+from chaosistio.throttle import coalesce, coalescing_window
 
 __all__ = [
     "set_fault",
     "add_delay_fault",
     "add_abort_fault",
     "unset_fault",
+    "set_faults",
+    "unset_faults",
     "remove_delay_fault",
     "remove_abort_fault",
+    "add_grpc_abort_fault",
+    "set_tcp_blackhole",
+    "unset_tcp_blackhole",
+    "bulk_set_fault",
+    "bulk_unset_fault",
+    "start_virtual_service_informer",
+    "stop_virtual_service_informers",
+    "rollback_all_faults",
+    "ramp_fault",
+    "stop_fault_ramp",
 ]
+logger = logging.getLogger("chaostoolkit")
+PATCH_STRATEGIES = ("merge", "json")
+DRY_RUN_MODES = ("client", "server")
+GRPC_STATUSES = (
+    "CANCELLED",
+    "UNKNOWN",
+    "INVALID_ARGUMENT",
+    "DEADLINE_EXCEEDED",
+    "NOT_FOUND",
+    "ALREADY_EXISTS",
+    "PERMISSION_DENIED",
+    "RESOURCE_EXHAUSTED",
+    "FAILED_PRECONDITION",
+    "ABORTED",
+    "OUT_OF_RANGE",
+    "UNIMPLEMENTED",
+    "INTERNAL",
+    "UNAVAILABLE",
+    "DATA_LOSS",
+    "UNAUTHENTICATED",
+)
+# routes selectors and the fault to set on them, None to remove it
+FaultChange = Tuple[List[Dict[str, str]], Optional[Dict[str, Any]]]
 
 
 def set_fault(
@@ -28,6 +100,12 @@ def set_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Setfault injection on the virtual service identified by `name`
@@ -37,80 +115,56 @@ def set_fault(
 
     If a fault already exists, it is updated with the new specification.
 
+    The `routes` argument lists route selectors. Each selector targets the
+    routes forwarding to its `destination` and may narrow them down by
+    `weight`, route `name` or `match` conditions (see
+    `chaosistio.fault.routes.RouteIndex`).
+
+    By default, the whole `http` array is sent back as a merge-patch. Set
+    `patch_strategy` to `"json"` to send a JSON Patch that only touches the
+    `fault` of the matching routes. Both are guarded by the
+    `resourceVersion` of the virtual service as read. On conflict, the
+    virtual service is read again and the operation is retried up to
+    `max_retries` times.
+
+    Set `fields` to a list of dotted paths of the virtual service, such as
+    `metadata.resourceVersion`, to return only these fields of the patched
+    virtual service, no headers, and the indexes of the touched `routes`.
+    This keeps the experiment journal small with large virtual services.
+
+    Set `dry_run` to tell what the action would change without changing
+    anything: with `"client"`, the change is computed locally against the
+    virtual service as read; with `"server"`, the patch is sent with
+    `dryRun=All` so the API server validates and applies it without
+    persisting it. Either way, the result tells whether the virtual service
+    would change, the `routes` indexes matched, the size in bytes of the
+    patch (`patchBytes`) and a `diff` of the spec listing the changed paths.
+    Nothing is recorded for rollback.
+
+    Set `clusters` to run the action on several clusters at once, each one
+    given by its context name in the Kubernetes configuration file or by a
+    mapping of the secrets to connect to it (see `chaosistio.clusters`). The
+    result then maps each cluster name to its own result. When the action
+    fails on some clusters, it is rolled back on the others unless
+    `on_partial_failure` is `"continue"`.
+
     See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
     """  # noqa: E501
-    result = get_virtual_service(
+    return patch_faults(
         virtual_service_name,
+        routes,
+        fault,
         ns=ns,
         version=version,
         configuration=configuration,
         secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
     )
-    if result["status"] != 200:
-        raise ActivityFailed(
-            "Virtual Service '{}' does not exist: {}".format(
-                virtual_service_name, str(result["body"])
-            )
-        )
-
-    # which destinations to we target?
-    expected_destinations = set()
-    for route in routes:
-        if "destination" in route:
-            destination = route["destination"]
-            expected_destinations.add(
-                (destination["host"], destination.get("subset"))
-            )
-
-    # inject a fault block into the targets
-    spec = deepcopy(result["body"]["spec"]["http"])
-    for i in spec:
-        if "route" in i:
-            for route in i["route"]:
-                if "destination" in route:
-                    destination = route["destination"]
-                    # not mandatory in response
-                    # https://istio.io/latest/docs/reference/config/networking/virtual-service/#Destination  # noqa: E501
-                    target = (destination["host"], destination.get("subset"))
-                    if target in expected_destinations:
-                        i["fault"] = fault
-                        break
-
-    api = create_k8s_api_client(configuration, secrets)
-
-    url = "/apis/{}/namespaces/{}/virtualservices/{}".format(
-        version, ns, virtual_service_name
-    )
-    payload = {
-        "apiVersion": version,
-        "kind": "VirtualService",
-        "metadata": {"name": virtual_service_name},
-        "spec": {"http": spec},
-    }
-
-    try:
-        data, status, headers = api.call_api(
-            url,
-            "PATCH",
-            header_params={
-                "Content-Type": "application/merge-patch+json",
-                "Accept": "application/json",
-            },
-            body=payload,
-            auth_settings=["BearerToken"],
-            _preload_content=False,
-        )
-    except ApiException as x:
-        body = x.body
-        if x.headers.get("Content-Type") == "application/json":
-            body = json.loads(body)
-        return {"status": x.status, "body": body, "headers": dict(**x.headers)}
-
-    return {
-        "status": status,
-        "body": json.loads(data.read(decode_content=True)),
-        "headers": dict(**headers),
-    }
 
 
 def unset_fault(
@@ -120,6 +174,12 @@ def unset_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Unset fault injection from the virtual service identified by `name`
@@ -127,77 +187,116 @@ def unset_fault(
     The `fault` argument must be the object passed as the `spec` property
     of a virtual service resource.
 
+    See `set_fault` for the meaning of `patch_strategy`, `max_retries`,
+    `fields`, `dry_run`, `clusters` and `on_partial_failure`.
+
     See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
     """  # noqa: E501
-    result = get_virtual_service(
+    return patch_faults(
         virtual_service_name,
+        routes,
+        None,
         ns=ns,
         version=version,
         configuration=configuration,
         secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
     )
-    if result["status"] != 200:
-        raise ActivityFailed(
-            "Virtual Service '{}' does not exist: {}".format(
-                virtual_service_name, str(result["body"])
-            )
-        )
 
-    # which destinations to we target?
-    expected_destinations = set()
-    for route in routes:
-        if "destination" in route:
-            destination = route["destination"]
-            expected_destinations.add(
-                (destination["host"], destination.get("subset"))
-            )
 
-    # remove fault block from the targets
-    spec = deepcopy(result["body"]["spec"]["http"])
-    for i in spec:
-        if "route" in i:
-            for route in i["route"]:
-                if "destination" in route:
-                    destination = route["destination"]
-                    target = (destination["host"], destination.get("subset"))
-                    if target in expected_destinations:
-                        i.pop("fault", None)
-
-    api = create_k8s_api_client(configuration, secrets)
-
-    url = "/apis/{}/namespaces/{}/virtualservices/{}".format(
-        version, ns, virtual_service_name
+def set_faults(
+    virtual_service_name: str,
+    faults: List[Dict[str, Any]],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
+) -> Dict[str, Any]:
+    """
+    Set different faults on different routes of the virtual service
+    identified by `name` in a single write
+
+    Each item of `faults` is an object with the `routes` selectors, as for
+    `set_fault`, and the `fault` to set on the routes they match. For
+    instance, a delay on the routes to `reviews:v2` and an abort on the
+    ones to `ratings:v1`. The changes are applied in order so the last one
+    wins on routes matched by several items.
+
+    The virtual service is read once and patched once, so istiod pushes the
+    new configuration to the sidecars once. See `set_fault` for the other
+    arguments.
+
+    See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
+    """  # noqa: E501
+    changes = fault_changes(faults, with_fault=True)
+    return patch_faults(
+        virtual_service_name,
+        None,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
+        changes=changes,
     )
-    payload = {
-        "apiVersion": version,
-        "kind": "VirtualService",
-        "metadata": {"name": virtual_service_name},
-        "spec": {"http": spec},
-    }
 
-    try:
-        data, status, headers = api.call_api(
-            url,
-            "PATCH",
-            header_params={
-                "Content-Type": "application/merge-patch+json",
-                "Accept": "application/json",
-            },
-            body=payload,
-            auth_settings=["BearerToken"],
-            _preload_content=False,
-        )
-    except ApiException as x:
-        body = x.body
-        if x.headers.get("Content-Type") == "application/json":
-            body = json.loads(body)
-        return {"status": x.status, "body": body, "headers": dict(**x.headers)}
 
-    return {
-        "status": status,
-        "body": json.loads(data.read(decode_content=True)),
-        "headers": dict(**headers),
-    }
+def unset_faults(
+    virtual_service_name: str,
+    faults: List[Dict[str, Any]],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
+) -> Dict[str, Any]:
+    """
+    Unset fault injection from the routes of the virtual service identified
+    by `name` matched by any item of `faults`, in a single write
+
+    Each item of `faults` is an object with the `routes` selectors, as for
+    `unset_fault`. Their `fault`, if any, is ignored so the `faults` passed
+    to `set_faults` can be passed as they are to roll it back.
+
+    See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
+    """  # noqa: E501
+    changes = fault_changes(faults, with_fault=False)
+    return patch_faults(
+        virtual_service_name,
+        None,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
+        changes=changes,
+    )
 
 
 def add_delay_fault(
@@ -209,6 +308,12 @@ def add_delay_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Add delay to the virtual service identified by `name`
@@ -228,6 +333,12 @@ def add_delay_fault(
         secrets=secrets,
         routes=routes,
         version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
     )
 
 
@@ -240,6 +351,12 @@ def add_abort_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Abort requests early by the virtual service identified by `name`
@@ -259,6 +376,12 @@ def add_abort_fault(
         secrets=secrets,
         routes=routes,
         version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
     )
 
 
@@ -269,6 +392,12 @@ def remove_delay_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Remove delay from the virtual service identified by `name`
@@ -282,6 +411,12 @@ def remove_delay_fault(
         secrets=secrets,
         routes=routes,
         version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
     )
 
 
@@ -292,6 +427,12 @@ def remove_abort_fault(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
 ) -> Dict[str, Any]:
     """
     Remove abort request faults from the virtual service identified by `name`
@@ -305,4 +446,1489 @@ def remove_abort_fault(
         secrets=secrets,
         routes=routes,
         version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
+    )
+
+
+def add_grpc_abort_fault(
+    virtual_service_name: str,
+    grpc_status: str,
+    routes: List[Dict[str, str]],
+    percentage: float = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
+) -> Dict[str, Any]:
+    """
+    Abort gRPC calls early with the `grpc_status` status code, such as
+    `UNAVAILABLE`, by the virtual service identified by `name`
+
+    gRPC services are routed by the `http` routes of the virtual service, so
+    `routes` select them like for `add_abort_fault`. Remove the fault with
+    `remove_abort_fault`.
+
+    See https://istio.io/latest/docs/reference/config/networking/virtual-service/#HTTPFaultInjection-Abort
+    """  # noqa: E501
+    if grpc_status not in GRPC_STATUSES:
+        raise ActivityFailed(
+            "Unknown gRPC status '{}', must be one of: {}".format(
+                grpc_status, ", ".join(GRPC_STATUSES)
+            )
+        )
+
+    fault = {"abort": {"grpcStatus": grpc_status}}
+    if percentage is not None:
+        fault["abort"]["percentage"] = {}
+        fault["abort"]["percentage"]["value"] = percentage
+
+    return set_fault(
+        virtual_service_name,
+        fault=fault,
+        ns=ns,
+        configuration=configuration,
+        secrets=secrets,
+        routes=routes,
+        version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
+    )
+
+
+def set_tcp_blackhole(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    subset: str = "chaos-blackhole",
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
+) -> Dict[str, Any]:
+    """
+    Disrupt the TCP traffic of the `tcp` routes matching `routes` in the
+    virtual service identified by `name`
+
+    The destinations of these routes are rewritten to `subset`, which must
+    not be declared by any destination rule of their hosts: the sidecars then
+    have no upstream for them and refuse the connections. Restore the routes
+    with `unset_tcp_blackhole` or `rollback_all_faults`.
+
+    The `routes` selectors are the ones of `set_fault`, matched against the
+    `tcp` routes.
+
+    See https://istio.io/latest/docs/reference/config/networking/virtual-service/#TCPRoute
+    """  # noqa: E501
+
+    def blackhole(route: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [
+            dict(r, destination=dict(r["destination"], subset=subset))
+            for r in route.get("route", [])
+        ]
+
+    return patch_faults(
+        virtual_service_name,
+        routes,
+        blackhole,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+        section="tcp",
+        dry_run=dry_run,
+        clusters=clusters,
+        on_partial_failure=on_partial_failure,
+    )
+
+
+def unset_tcp_blackhole(
+    virtual_service_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    max_retries: int = 3,
+    clusters: List[Cluster] = None,
+) -> Dict[str, Any]:
+    """
+    Restore the `tcp` routes of the virtual service identified by `name`
+    that `set_tcp_blackhole` rewrote
+
+    Set `clusters` to restore them on several clusters at once, see
+    `set_fault`. The routes restored on some clusters are left restored
+    when others fail.
+
+    See https://istio.io/latest/docs/reference/config/networking/virtual-service/#TCPRoute
+    """  # noqa: E501
+    if clusters:
+
+        def apply(cluster_secrets: Secrets) -> Dict[str, Any]:
+            return unset_tcp_blackhole(
+                virtual_service_name,
+                ns=ns,
+                version=version,
+                configuration=configuration,
+                secrets=cluster_secrets,
+                max_retries=max_retries,
+            )
+
+        return on_clusters(clusters, secrets, apply)
+
+    for entry in pending_faults(configuration):
+        if not is_entry_of(entry, virtual_service_name, ns, version, secrets):
+            continue
+
+        routes = {
+            k: r
+            for (k, r) in entry["routes"].items()
+            if r.get("section") == "tcp"
+        }
+        if not routes:
+            continue
+
+        entry = dict(entry, routes=routes)
+        result = restore_faults(entry, configuration, secrets, max_retries)
+        if result["status"] < 400 or result["status"] == 404:
+            forget_faults(entry, configuration, section="tcp")
+        return result
+
+    raise ActivityFailed(
+        "No tcp route of virtual service '{}' to restore".format(
+            virtual_service_name
+        )
+    )
+
+
+def bulk_set_fault(
+    routes: List[Dict[str, str]],
+    fault: Dict[str, Any],
+    virtual_service_names: List[str] = None,
+    label_selector: str = None,
+    namespaces: List[str] = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    max_workers: int = 10,
+    max_error_rate: float = None,
+    dry_run: str = None,
+) -> Dict[str, Any]:
+    """
+    Set fault injection on many virtual services at once
+
+    The virtual services are either the ones named in
+    `virtual_service_names` or the ones matching `label_selector`. They are
+    looked up in each namespace of `namespaces`, or in `ns` when it is not
+    set.
+
+    The virtual services are patched concurrently by up to `max_workers`
+    threads sharing the same Kubernetes client. When `max_error_rate` is set,
+    as soon as the ratio of failed virtual services over all the targeted
+    ones goes above it, the remaining ones are skipped.
+
+    The result reports the outcome for each virtual service.
+
+    With `dry_run`, see `set_fault`, nothing is changed and the outcome of
+    each virtual service tells what would change. The virtual services are
+    read concurrently, or from the informer watching their namespace if
+    any, so a whole namespace is evaluated in one pass.
+
+    See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
+    """  # noqa: E501
+    check_dry_run(dry_run)
+    targets = resolve_virtual_services(
+        virtual_service_names,
+        label_selector,
+        namespaces or [ns],
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+    )
+
+    def apply(target_ns: str, name: str) -> Dict[str, Any]:
+        return set_fault(
+            name,
+            routes,
+            fault,
+            ns=target_ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+            patch_strategy=patch_strategy,
+            max_retries=max_retries,
+            dry_run=dry_run,
+        )
+
+    return run_bulk(targets, apply, max_workers, max_error_rate)
+
+
+def bulk_unset_fault(
+    routes: List[Dict[str, str]],
+    virtual_service_names: List[str] = None,
+    label_selector: str = None,
+    namespaces: List[str] = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    max_workers: int = 10,
+    max_error_rate: float = None,
+    dry_run: str = None,
+) -> Dict[str, Any]:
+    """
+    Unset fault injection from many virtual services at once
+
+    See `bulk_set_fault` for how the virtual services are selected and
+    patched, and for `dry_run`.
+
+    See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#HTTPFaultInjection
+    """  # noqa: E501
+    check_dry_run(dry_run)
+    targets = resolve_virtual_services(
+        virtual_service_names,
+        label_selector,
+        namespaces or [ns],
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
     )
+
+    def apply(target_ns: str, name: str) -> Dict[str, Any]:
+        return unset_fault(
+            name,
+            routes,
+            ns=target_ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+            patch_strategy=patch_strategy,
+            max_retries=max_retries,
+            dry_run=dry_run,
+        )
+
+    return run_bulk(targets, apply, max_workers, max_error_rate)
+
+
+def start_virtual_service_informer(
+    ns: str = None,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Watch the virtual services of `ns`, or of all namespaces when not set,
+    and keep them in a local store
+
+    While the informer runs, `get_virtual_service` and the fault actions
+    read virtual services from that store and only call the API server to
+    write them. Stop it with `stop_virtual_service_informers`, usually as a
+    rollback.
+    """
+    informer = start_informer(
+        ns=ns, version=version, configuration=configuration, secrets=secrets
+    )
+    return {
+        "ns": ns,
+        "synced": informer.synced,
+        "count": len(informer),
+        "resourceVersion": informer.resource_version,
+    }
+
+
+def stop_virtual_service_informers() -> None:
+    """
+    Stop all running virtual service informers
+    """
+    stop_informers()
+
+
+def rollback_all_faults(
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    max_workers: int = 10,
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Restore the faults of every route changed by the fault actions to what
+    they were before the experiment touched them
+
+    Each fault action records in a ledger the faults of the routes it
+    changes. This action puts them back with a single write per virtual
+    service, patching virtual services concurrently on up to `max_workers`
+    threads, each write being retried up to `max_retries` times on
+    conflicts. Faults that existed before the experiment are restored rather
+    than removed. The destination rule settings changed by the
+    `chaosistio.destination` actions are restored the same way.
+
+    The ledger lives in memory unless the `istio_fault_ledger_path`
+    configuration key points to a file to persist it to, so a later
+    process can roll back an interrupted experiment. Running fault ramps
+    are stopped first so they do not put faults back afterwards.
+    """
+    # the destination rule actions build on these ones
+    from chaosistio.destination.actions import restore_traffic_policies
+
+    stop_ramps()
+    entries = {}
+    targets = []
+    for entry in pending_faults(configuration):
+        key = entry_key(entry)
+        entries[key] = entry
+        cluster = entry.get("cluster")
+        targets.append(
+            (
+                entry["ns"],
+                entry["name"],
+                cluster_name(cluster) if cluster else None,
+                entry["version"],
+                key,
+            )
+        )
+
+    def apply(
+        ns: str, name: str, cluster: str, version: str, key: Tuple[Any, ...]
+    ) -> Dict[str, Any]:
+        entry = entries[key]
+        if entry.get("kind") == "DestinationRule":
+            result = restore_traffic_policies(
+                entry, configuration, secrets, max_retries
+            )
+        else:
+            result = restore_faults(entry, configuration, secrets, max_retries)
+        # a virtual service which is gone has nothing left to roll back
+        if result["status"] < 400 or result["status"] == 404:
+            forget_faults(entry, configuration)
+        return result
+
+    return run_bulk(targets, apply, max_workers)
+
+
+def ramp_fault(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    fault: Dict[str, Any],
+    schedule: List[Dict[str, float]] = None,
+    curve: str = None,
+    start_percentage: float = 1.0,
+    end_percentage: float = 100.0,
+    step_count: int = 5,
+    duration: float = 600.0,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "json",
+) -> Dict[str, Any]:
+    """
+    Progressively increase the percentage of requests affected by `fault` on
+    the given routes, from a background thread so the experiment goes on
+
+    The ramp is either an explicit `schedule`, a list of
+    `{"percentage": ..., "duration": ...}` steps where `duration` is the
+    number of seconds the percentage is held for, or a `linear` or
+    `exponential` `curve` of `step_count` steps spread over `duration`
+    seconds from `start_percentage` to `end_percentage`.
+
+    The percentage is set on the `delay` and `abort` of `fault`. A step is
+    only written when its percentage differs from the previous one and
+    each write starts from the virtual service returned by the previous one
+    instead of reading it again. Starting a ramp on a virtual service stops
+    the ramp already running on it.
+
+    Stop the ramp with `stop_fault_ramp` or `rollback_all_faults`.
+
+    Returns the steps of the ramp.
+
+    see: https://istio.io/latest/docs/reference/config/networking/virtual-service/#HTTPFaultInjection
+    """  # noqa: E501
+    check_patch_strategy(patch_strategy)
+    steps = ramp_schedule(
+        schedule,
+        curve,
+        start_percentage=start_percentage,
+        end_percentage=end_percentage,
+        step_count=step_count,
+        duration=duration,
+    )
+    last = {"virtual_service": None}
+    changed_routes = set()
+
+    def apply(percentage: float) -> None:
+        result = patch_faults(
+            virtual_service_name,
+            routes,
+            fault_with_percentage(fault, percentage),
+            ns=ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+            patch_strategy=patch_strategy,
+            virtual_service=last["virtual_service"],
+        )
+        if result["status"] >= 400:
+            last["virtual_service"] = None
+            raise ActivityFailed(
+                "Failed to set the fault of virtual service '{}': {}".format(
+                    virtual_service_name, str(result["body"])
+                )
+            )
+        last["virtual_service"] = result["body"]
+        http = result["body"]["spec"].get("http") or []
+        index = get_route_index(http, result["body"].get("metadata"))
+        changed_routes.update(
+            route_key("http", http[i], i) for i in index.select(routes)
+        )
+        logger.debug(
+            "Fault of virtual service '{}' ramped to {}%".format(
+                virtual_service_name, percentage
+            )
+        )
+
+    start_ramp(
+        (ns, version, virtual_service_name), steps, apply, changed_routes
+    )
+    return {"ns": ns, "name": virtual_service_name, "steps": steps}
+
+
+def stop_fault_ramp(
+    virtual_service_name: str = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    rollback: bool = True,
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Stop the fault ramp running on the given virtual service, or all of them
+    when no name is given
+
+    Unless `rollback` is `False`, the faults of the routes the stopped ramps
+    changed are restored to what they were before the experiment. Faults
+    set by other actions on other routes are left alone.
+
+    Returns, for each stopped ramp, the last percentage it applied, the
+    `error` that stopped it early, if any, and the status of the rollback.
+    """
+    key = None
+    if virtual_service_name:
+        key = (ns, version, virtual_service_name)
+
+    entries = pending_faults(configuration) if rollback else []
+
+    stopped = []
+    for (ramp_ns, ramp_version, name), ramp in stop_ramps(key):
+        info = {
+            "ns": ramp_ns,
+            "name": name,
+            "percentage": ramp.current,
+            "error": ramp.error,
+        }
+        entry = next(
+            (
+                e
+                for e in entries
+                if is_entry_of(e, name, ramp_ns, ramp_version, secrets)
+            ),
+            None,
+        )
+        if entry is not None:
+            routes = {
+                k: r for (k, r) in entry["routes"].items() if k in ramp.routes
+            }
+            if routes:
+                entry = dict(entry, routes=routes)
+                result = restore_faults(entry, configuration, secrets)
+                if result["status"] < 400 or result["status"] == 404:
+                    forget_faults(entry, configuration, routes=list(routes))
+                info["status"] = result["status"]
+        stopped.append(info)
+
+    return {"stopped": stopped}
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def patch_faults(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    fault: Dict[str, Any] = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    virtual_service: Dict[str, Any] = None,
+    fields: List[str] = None,
+    section: str = "http",
+    dry_run: str = None,
+    clusters: List[Cluster] = None,
+    on_partial_failure: str = "rollback",
+    changes: List[FaultChange] = None,
+    snapshots: Dict[Any, Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Set `fault` on the routes matching `routes` or remove it from them
+    when `fault` is `None`. On `tcp` routes, `fault` is the new `route`
+    of each matching route, see `write_faults`.
+
+    Pass `changes` instead to make several `(routes, fault)` changes in a
+    single write. The `routes` of the result are then the indexes of the
+    routes selected by any of them.
+
+    When given, `virtual_service` is the last known state of the resource and
+    saves reading it before the first attempt. Otherwise, when the
+    `istio_fault_coalescing_window` configuration key is set, the change
+    waits for other changes to the same virtual service and they are all
+    written at once. Dry runs are never coalesced.
+
+    With `clusters`, the patch is made on each of them concurrently, see
+    `chaosistio.clusters.on_clusters`. When it fails on some, the others
+    get back the routes this call changed as they were before it, faults
+    set earlier are kept.
+
+    When given, `snapshots` maps the cluster of `secrets`, see
+    `cluster_key`, to the routes the patch changed as they were before,
+    see `write_faults`. Such a patch is never coalesced with others.
+    """
+    check_patch_strategy(patch_strategy)
+    check_dry_run(dry_run)
+    if changes is None:
+        changes = [(routes, fault)]
+
+    if clusters:
+        snapshots = {}
+
+        def apply(cluster_secrets: Secrets) -> Dict[str, Any]:
+            return patch_faults(
+                virtual_service_name,
+                routes,
+                fault,
+                ns=ns,
+                version=version,
+                configuration=configuration,
+                secrets=cluster_secrets,
+                patch_strategy=patch_strategy,
+                max_retries=max_retries,
+                fields=fields,
+                section=section,
+                dry_run=dry_run,
+                changes=changes,
+                snapshots=snapshots,
+            )
+
+        def rollback(cluster_secrets: Secrets) -> None:
+            snapshot = snapshots.get(cluster_key(cluster_secrets))
+            if snapshot is not None:
+                rollback_virtual_service(
+                    snapshot, configuration, cluster_secrets, max_retries
+                )
+
+        return on_clusters(
+            clusters,
+            secrets,
+            apply,
+            None if dry_run else rollback,
+            on_partial_failure,
+        )
+
+    def flush(
+        groups: List[List[FaultChange]],
+    ) -> List[Tuple[Dict[str, Any], List[int]]]:
+        outcomes = iter(
+            write_faults(
+                virtual_service_name,
+                [change for group in groups for change in group],
+                ns=ns,
+                version=version,
+                configuration=configuration,
+                secrets=secrets,
+                patch_strategy=patch_strategy,
+                max_retries=max_retries,
+                virtual_service=virtual_service,
+                section=section,
+                dry_run=dry_run,
+                snapshots=snapshots,
+            )
+        )
+
+        grouped = []
+        for group in groups:
+            taken = list(islice(outcomes, len(group)))
+            result = taken[0][0]
+            indexes = sorted({i for (_, selected) in taken for i in selected})
+            if dry_run:
+                result = dict(result, routes=indexes)
+            grouped.append((result, indexes))
+        return grouped
+
+    window = coalescing_window(configuration)
+    if (
+        window > 0
+        and virtual_service is None
+        and not dry_run
+        and snapshots is None
+    ):
+        result, indexes = coalesce(
+            (
+                ns,
+                version,
+                virtual_service_name,
+                patch_strategy,
+                section,
+                cluster_key(secrets),
+            ),
+            changes,
+            window,
+            flush,
+        )
+    else:
+        result, indexes = flush([changes])[0]
+
+    if fields is not None and not dry_run:
+        return dict(
+            slim_result(result, fields),
+            routes=indexes,
+            changed=result.get("changed"),
+        )
+    return result
+
+
+def write_faults(
+    virtual_service_name: str,
+    changes: List[FaultChange],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    virtual_service: Dict[str, Any] = None,
+    section: str = "http",
+    dry_run: str = None,
+    snapshots: Dict[Any, Dict[str, Any]] = None,
+) -> List[Tuple[Dict[str, Any], List[int]]]:
+    """
+    Apply, in a single patch, each `(routes, fault)` change in turn so the
+    last one wins on routes selected by several of them.
+
+    The changes target the routes of `section`, `http` or `tcp`, setting
+    the member of `ROUTE_FIELDS` it changes, `fault` or `route`. The value
+    of a change may be a callable, called with each selected route to get
+    the value to set on it.
+
+    Returns the result of the patch and the indexes of the selected routes
+    for each change. With `dry_run`, the result is the summary of what the
+    patch would change instead, see `dry_run_summary`.
+
+    The result tells whether the virtual service was `changed`: when the
+    selected routes already are as the changes would leave them, nothing
+    is written and the virtual service as read is returned.
+
+    Once the patch is written, the routes it changed, as they were before,
+    are saved in `snapshots`, when given, under the `cluster_key` of
+    `secrets`, in the shape of a ledger entry.
+    """
+    url = virtual_service_url(version, ns, virtual_service_name)
+    # what the last attempt read and sent
+    last = {}
+
+    def attempt_patch(attempt: int) -> Dict[str, Any]:
+        read_vs = virtual_service if not attempt else None
+        if read_vs is None:
+            # after a conflict, the informer may still hold the version the
+            # API server just rejected
+            read = read_virtual_service if attempt else get_virtual_service
+            result = read(
+                virtual_service_name,
+                ns=ns,
+                version=version,
+                configuration=configuration,
+                secrets=secrets,
+            )
+            if result["status"] != 200:
+                raise ActivityFailed(
+                    "Virtual Service '{}' does not exist: {}".format(
+                        virtual_service_name, str(result["body"])
+                    )
+                )
+            read_vs = result["body"]
+
+        entries = read_vs["spec"].get(section) or []
+        selected, faults = select_faults(read_vs, changes, section)
+        last.update(virtual_service=read_vs, selected=selected, faults=faults)
+        if not dry_run and unchanged(entries, faults, section):
+            logger.debug(
+                "Virtual service '{}' already has these faults, not "
+                "patching it".format(virtual_service_name)
+            )
+            return {
+                "status": 200,
+                "body": read_vs,
+                "headers": {},
+                "changed": False,
+            }
+        api = create_k8s_api_client(configuration, secrets)
+
+        content_type, payload = fault_patch(
+            patch_strategy,
+            virtual_service_name,
+            version,
+            read_vs,
+            faults,
+            section,
+        )
+        last["payload"] = payload
+        if dry_run == "client":
+            return {
+                "status": 200,
+                "body": client_side_apply(
+                    virtual_service_name, version, read_vs, faults, section
+                ),
+            }
+        return call_api(
+            api,
+            url,
+            "PATCH",
+            header_params={
+                "Content-Type": content_type,
+                "Accept": "application/json",
+            },
+            body=payload,
+            query_params=[("dryRun", "All")] if dry_run else None,
+        )
+
+    result = patch_with_retries(
+        url,
+        attempt_patch,
+        max_retries,
+        "Virtual service '{}'".format(virtual_service_name),
+    )
+    selected = last["selected"]
+    if result.get("changed") is False:
+        return [(result, indexes) for indexes in selected]
+
+    if dry_run:
+        summary = dry_run_summary(
+            dry_run, last["virtual_service"], result, last["payload"]
+        )
+        return [
+            (dict(summary, routes=indexes), indexes) for indexes in selected
+        ]
+
+    result["changed"] = result["status"] < 400
+    written(
+        virtual_service_name,
+        ns,
+        version,
+        last["virtual_service"],
+        list(last["faults"]),
+        result,
+        configuration,
+        section,
+        secrets,
+    )
+    if snapshots is not None and result["status"] < 400:
+        snapshot = {
+            "ns": ns,
+            "version": version,
+            "name": virtual_service_name,
+            "routes": route_records(
+                last["virtual_service"], list(last["faults"]), section
+            ),
+        }
+        if cluster_of(secrets):
+            snapshot["cluster"] = cluster_of(secrets)
+        snapshots[cluster_key(secrets)] = snapshot
+    return [(result, indexes) for indexes in selected]
+
+
+def patch_with_retries(
+    url: str,
+    attempt_patch: Callable[[int], Dict[str, Any]],
+    max_retries: int,
+    description: str,
+) -> Dict[str, Any]:
+    """
+    Call `attempt_patch` with the number of the attempt, from 0, until its
+    result is not a conflict, retrying up to `max_retries` times.
+
+    Only patches carrying the resource version they were built from can
+    conflict. `attempt_patch` must read the resource again on each retry.
+    """
+    attempt = 0
+    while True:
+        result = attempt_patch(attempt)
+        delay = retry_delay(url, result, attempt, max_retries, description)
+        if delay is None:
+            return result
+
+        attempt += 1
+        time.sleep(delay)
+
+
+def retry_delay(
+    url: str,
+    result: Dict[str, Any],
+    attempt: int,
+    max_retries: int,
+    description: str,
+) -> Optional[float]:
+    """
+    Return how many seconds to wait before retrying the patch that got
+    `result` on its `attempt`, from 0, or `None` when it must not be
+    retried. Retries are reported to the instrumentation hooks.
+
+    Only conflicts are retried: a `409`, or a `422` telling the `test` of
+    the resource version failed. Other `422` are invalid patches.
+    """
+    if not conflicting(result) or attempt >= max_retries:
+        return None
+
+    attempt += 1
+    delay = conflict_backoff(attempt)
+    emit(
+        "retry",
+        verb="PATCH",
+        url=url,
+        status=result["status"],
+        attempt=attempt,
+    )
+    logger.debug(
+        "{} changed while patching it, retrying in {}s ({}/{})".format(
+            description, delay, attempt, max_retries
+        )
+    )
+    return delay
+
+
+def conflicting(result: Dict[str, Any]) -> bool:
+    """
+    Tell if a patch failed because the resource changed since it was read.
+    """
+    if result["status"] == 409:
+        return True
+    if result["status"] != 422:
+        return False
+
+    body = result.get("body")
+    if isinstance(body, dict):
+        causes = (body.get("details") or {}).get("causes") or []
+        messages = [body.get("message") or ""]
+        messages.extend(c.get("message") or "" for c in causes)
+    else:
+        messages = [str(body)]
+    return any(
+        "testing value /metadata/resourceVersion failed" in m for m in messages
+    )
+
+
+def select_faults(
+    virtual_service: Dict[str, Any],
+    changes: List[FaultChange],
+    section: str = "http",
+) -> Tuple[List[List[int]], Dict[int, Any]]:
+    """
+    Return the indexes of the routes of `section` each change selects and
+    the value to set on each selected route, the last change winning.
+    """
+    entries = virtual_service["spec"].get(section) or []
+    index = get_route_index(entries, virtual_service.get("metadata"), section)
+    selected = [index.select(routes) for (routes, _) in changes]
+    faults = {}
+    for indexes, (_, fault) in zip(selected, changes):
+        for i in indexes:
+            faults[i] = fault(entries[i]) if callable(fault) else fault
+    return selected, faults
+
+
+def fault_patch(
+    patch_strategy: str,
+    virtual_service_name: str,
+    version: str,
+    virtual_service: Dict[str, Any],
+    faults: Dict[int, Optional[Dict[str, Any]]],
+    section: str = "http",
+) -> Tuple[str, Any]:
+    """
+    Return the content type and payload of the patch setting the fault of
+    each route index of `faults` on the given virtual service, or removing
+    it when it is `None`.
+    """
+    routes = virtual_service["spec"].get(section) or []
+    resource_version = virtual_service.get("metadata", {}).get(
+        "resourceVersion"
+    )
+    if patch_strategy == "merge":
+        return "application/merge-patch+json", merge_patch_faults(
+            virtual_service_name,
+            version,
+            routes,
+            faults,
+            section,
+            resource_version,
+        )
+
+    return "application/json-patch+json", json_patch_faults(
+        routes, faults, resource_version, section
+    )
+
+
+def unchanged(
+    routes: List[Dict[str, Any]],
+    faults: Dict[int, Optional[Dict[str, Any]]],
+    section: str = "http",
+) -> bool:
+    """
+    Tell if setting, or removing, the faults of the routes at the indexes of
+    `faults` would leave them as they are.
+    """
+    field = ROUTE_FIELDS[section]
+    return all(
+        routes[index].get(field) == fault for (index, fault) in faults.items()
+    )
+
+
+def fault_changes(
+    faults: List[Dict[str, Any]], with_fault: bool = True
+) -> List[FaultChange]:
+    """
+    Turn the `faults` of `set_faults` into the changes to make, removing the
+    faults unless `with_fault` is set.
+    """
+    if not faults:
+        raise ActivityFailed("At least one fault must be given")
+
+    changes = []
+    for item in faults:
+        routes = item.get("routes")
+        if not routes:
+            raise ActivityFailed(
+                "Each fault must select its routes: {}".format(item)
+            )
+        fault = item.get("fault") if with_fault else None
+        if with_fault and not fault:
+            raise ActivityFailed(
+                "Each fault must have a fault specification: {}".format(item)
+            )
+        changes.append((routes, fault))
+    return changes
+
+
+def check_patch_strategy(patch_strategy: str) -> None:
+    if patch_strategy not in PATCH_STRATEGIES:
+        raise ActivityFailed(
+            "Unknown patch strategy '{}', must be one of: {}".format(
+                patch_strategy, ", ".join(PATCH_STRATEGIES)
+            )
+        )
+
+
+def check_dry_run(dry_run: Optional[str]) -> None:
+    if dry_run and dry_run not in DRY_RUN_MODES:
+        raise ActivityFailed(
+            "Unknown dry run mode '{}', must be one of: {}".format(
+                dry_run, ", ".join(DRY_RUN_MODES)
+            )
+        )
+
+
+def client_side_apply(
+    virtual_service_name: str,
+    version: str,
+    virtual_service: Dict[str, Any],
+    faults: Dict[int, Optional[Dict[str, Any]]],
+    section: str = "http",
+) -> Dict[str, Any]:
+    """
+    Return the virtual service as the API server would once the faults are
+    patched, without calling it.
+    """
+    routes = virtual_service["spec"].get(section) or []
+    patch = merge_patch_faults(
+        virtual_service_name, version, routes, faults, section
+    )
+    return dict(
+        virtual_service, spec=dict(virtual_service["spec"], **patch["spec"])
+    )
+
+
+def dry_run_summary(
+    dry_run: str,
+    virtual_service: Dict[str, Any],
+    result: Dict[str, Any],
+    payload: Any,
+) -> Dict[str, Any]:
+    """
+    Summarize what the patch `payload` would change on the virtual service,
+    given the `result` of applying it without persisting it.
+
+    API errors are returned as they are.
+    """
+    if result["status"] >= 400:
+        return result
+
+    diff = structural_diff(
+        virtual_service.get("spec"), result["body"].get("spec"), "/spec"
+    )
+    return {
+        "status": result["status"],
+        "dryRun": dry_run,
+        "changed": bool(diff),
+        # as serialized by the Kubernetes client
+        "patchBytes": len(json.dumps(payload)),
+        "diff": diff,
+    }
+
+
+def conflict_backoff(attempt: int) -> float:
+    """
+    Seconds to wait before retrying a conflicting patch.
+    """
+    return min(0.1 * (2**attempt), 2.0)
+
+
+def written(
+    virtual_service_name: str,
+    ns: str,
+    version: str,
+    virtual_service: Dict[str, Any],
+    indexes: List[int],
+    result: Dict[str, Any],
+    configuration: Configuration = None,
+    section: str = "http",
+    secrets: Secrets = None,
+) -> None:
+    """
+    Book-keeping once the faults of a virtual service were patched: record
+    the faults it had before for rollback and refresh the informer.
+    """
+    if result["status"] < 400:
+        record_faults(
+            virtual_service_name,
+            ns,
+            version,
+            virtual_service,
+            indexes,
+            configuration,
+            section,
+            cluster_of(secrets),
+        )
+    remember_virtual_service(ns, version, result, secrets)
+
+
+def restore_faults(
+    entry: Dict[str, Any],
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Put back, in a single JSON Patch, the faults recorded in the ledger
+    entry of a virtual service, in the cluster it belongs to.
+    """
+    if entry.get("cluster"):
+        secrets = dict(secrets or {}, **entry["cluster"])
+    name, ns, version = entry["name"], entry["ns"], entry["version"]
+    url = virtual_service_url(version, ns, name)
+
+    def attempt_patch(attempt: int) -> Dict[str, Any]:
+        read = read_virtual_service if attempt else get_virtual_service
+        result = read(
+            name,
+            ns=ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        )
+        if result["status"] != 200:
+            return result
+
+        virtual_service = result["body"]
+        spec = virtual_service["spec"]
+        ops = []
+        resource_version = virtual_service.get("metadata", {}).get(
+            "resourceVersion"
+        )
+        if resource_version:
+            ops.append(
+                {
+                    "op": "test",
+                    "path": "/metadata/resourceVersion",
+                    "value": resource_version,
+                }
+            )
+
+        changes = 0
+        located = set()
+        for key, recorded in entry["routes"].items():
+            section = recorded.get("section", "http")
+            field = ROUTE_FIELDS[section]
+            routes = spec.get(section) or []
+            index = locate_route(
+                routes, recorded["index"], key, section, located
+            )
+            if index is None:
+                continue
+            located.add((section, index))
+
+            path = "/spec/{}/{}/{}".format(section, index, field)
+            current = routes[index].get(field)
+            original = recorded[field]
+            if original is None and current is not None:
+                ops.append({"op": "remove", "path": path})
+                changes += 1
+            elif original is not None and current != original:
+                ops.append({"op": "add", "path": path, "value": original})
+                changes += 1
+
+        if not changes:
+            return result
+
+        api = create_k8s_api_client(configuration, secrets)
+        result = call_api(
+            api,
+            url,
+            "PATCH",
+            header_params={
+                "Content-Type": "application/json-patch+json",
+                "Accept": "application/json",
+            },
+            body=ops,
+        )
+        remember_virtual_service(ns, version, result, secrets)
+        return result
+
+    return patch_with_retries(
+        url,
+        attempt_patch,
+        max_retries,
+        "Virtual service '{}'".format(name),
+    )
+
+
+def rollback_virtual_service(
+    snapshot: Dict[str, Any],
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    Put back the routes of a virtual service as they were before the patch
+    `snapshot` was taken of, see `write_faults`, leaving the faults set
+    before it in place.
+
+    The routes then back to what the ledger recorded for them need no
+    rollback anymore and are dropped from it.
+    """
+    result = restore_faults(snapshot, configuration, secrets, max_retries)
+    if result["status"] >= 400 and result["status"] != 404:
+        raise ActivityFailed(
+            "Failed to roll back virtual service '{}': {}".format(
+                snapshot["name"], str(result["body"])
+            )
+        )
+
+    for entry in pending_faults(configuration):
+        if entry_key(entry) != entry_key(snapshot):
+            continue
+        restored = []
+        for key, record in snapshot["routes"].items():
+            field = ROUTE_FIELDS[record.get("section", "http")]
+            recorded = entry["routes"].get(key)
+            if recorded is not None and recorded[field] == record[field]:
+                restored.append(key)
+        if restored:
+            forget_faults(entry, configuration, routes=restored)
+    return result
+
+
+def is_entry_of(
+    entry: Dict[str, Any],
+    virtual_service_name: str,
+    ns: str,
+    version: str,
+    secrets: Secrets = None,
+    kind: str = "VirtualService",
+) -> bool:
+    """
+    Tell if the ledger `entry` is the one of the virtual service, or of the
+    resource of another `kind`, in the cluster `secrets` connect to.
+    """
+    return entry_key(entry) == entry_key(
+        {
+            "kind": kind,
+            "ns": ns,
+            "version": version,
+            "name": virtual_service_name,
+            "cluster": cluster_of(secrets),
+        }
+    )
+
+
+def locate_route(
+    routes: List[Dict[str, Any]],
+    index: int,
+    key: str,
+    section: str = "http",
+    located: Set[Tuple[str, int]] = frozenset(),
+) -> Optional[int]:
+    """
+    Find the route of `section` that was at `index`, looking for one with
+    the same signature elsewhere when routes moved since. Routes already
+    `located` for other keys are skipped.
+    """
+    field = ROUTE_FIELDS[section]
+    signature = key_signature(key)
+
+    def found(i: int) -> bool:
+        return (section, i) not in located and (
+            route_signature(routes[i], field) == signature
+        )
+
+    if index < len(routes) and found(index):
+        return index
+
+    for i in range(len(routes)):
+        if found(i):
+            return i
+
+
+def remember_virtual_service(
+    ns: str, version: str, result: Dict[str, Any], secrets: Secrets = None
+) -> None:
+    """
+    Hand the virtual service we just wrote to the informer watching it, if
+    any, so it is not read back stale, and drop the cached listings it may
+    be part of.
+    """
+    if result["status"] < 400:
+        invalidate_virtual_services_cache(ns, version, secrets)
+    informer = get_informer(ns, version, secrets)
+    if informer is not None and result["status"] == 200:
+        if isinstance(result["body"], dict):
+            informer.update(result["body"])
+
+
+def merge_patch_faults(
+    virtual_service_name: str,
+    version: str,
+    http: List[Dict[str, Any]],
+    faults: Dict[int, Optional[Dict[str, Any]]],
+    section: str = "http",
+    resource_version: str = None,
+) -> Dict[str, Any]:
+    """
+    Build a merge-patch carrying the whole array of routes of `section` with
+    the faults set or removed on the routes at the indexes of `faults`.
+
+    Only the changed routes are copied, the others are shared with `http`
+    so the patch must not be modified in place.
+
+    With the `resource_version` the routes were read at, the API server
+    rejects the patch with a conflict if the virtual service changed since,
+    rather than overwriting that change with routes read from a stale copy.
+    """
+    field = ROUTE_FIELDS[section]
+    spec = list(http)
+    for index, fault in faults.items():
+        route = dict(http[index])
+        if fault is None:
+            route.pop(field, None)
+        else:
+            route[field] = fault
+        spec[index] = route
+
+    metadata = {"name": virtual_service_name}
+    if resource_version:
+        metadata["resourceVersion"] = resource_version
+    return {
+        "apiVersion": version,
+        "kind": "VirtualService",
+        "metadata": metadata,
+        "spec": {section: spec},
+    }
+
+
+def json_patch_faults(
+    http: List[Dict[str, Any]],
+    faults: Dict[int, Optional[Dict[str, Any]]],
+    resource_version: str = None,
+    section: str = "http",
+) -> List[Dict[str, Any]]:
+    """
+    Build a RFC 6902 JSON Patch setting or removing the `fault` of the routes
+    of `section` at the indexes of `faults`.
+
+    When `resource_version` is given, the patch first tests it so the API
+    server rejects the whole patch if the virtual service changed since it
+    was read.
+    """
+    ops = []
+    if resource_version:
+        ops.append(
+            {
+                "op": "test",
+                "path": "/metadata/resourceVersion",
+                "value": resource_version,
+            }
+        )
+
+    field = ROUTE_FIELDS[section]
+    for index, fault in faults.items():
+        path = "/spec/{}/{}/{}".format(section, index, field)
+        if fault is not None:
+            ops.append({"op": "add", "path": path, "value": fault})
+        elif field in http[index]:
+            ops.append({"op": "remove", "path": path})
+
+    return ops
+
+
+def resolve_virtual_services(
+    virtual_service_names: List[str],
+    label_selector: str,
+    namespaces: List[str],
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> List[Tuple[str, str]]:
+    """
+    Return the `(namespace, name)` of the targeted virtual services.
+    """
+    if virtual_service_names and label_selector:
+        raise ActivityFailed(
+            "Pass either virtual service names or a label selector, not both"
+        )
+
+    if virtual_service_names:
+        return [
+            (ns, name) for ns in namespaces for name in virtual_service_names
+        ]
+
+    if not label_selector:
+        raise ActivityFailed(
+            "Pass either virtual service names or a label selector"
+        )
+
+    targets = []
+    for ns in namespaces:
+        for item in iter_virtual_services(
+            ns=ns,
+            label_selector=label_selector,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        ):
+            targets.append((ns, item["metadata"]["name"]))
+    return targets
+
+
+def run_bulk(
+    targets: List[Tuple[str, ...]],
+    apply: Callable[..., Dict[str, Any]],
+    max_workers: int = 10,
+    max_error_rate: float = None,
+) -> Dict[str, Any]:
+    """
+    Call `apply` for each target on a thread pool and aggregate the outcome.
+    A target is a namespace and a name, optionally followed by the name of
+    the cluster it belongs to, or `None`, its API version and whatever else
+    `apply` is called with.
+
+    No more than `max_workers` targets are in flight at any time so that
+    nothing else is started once the error rate goes above `max_error_rate`.
+    """
+    outcomes = {
+        target: {"ns": target[0], "name": target[1], "status": "skipped"}
+        for target in targets
+    }
+    for target, outcome in outcomes.items():
+        if len(target) > 2 and target[2]:
+            outcome["cluster"] = target[2]
+        if len(target) > 3:
+            outcome["version"] = target[3]
+    remaining = iter(targets)
+    failed = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        in_flight = {}
+
+        def submit(count: int) -> None:
+            for target in islice(remaining, count):
+                in_flight[pool.submit(apply, *target)] = target
+
+        submit(max(1, max_workers))
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = outcomes[in_flight.pop(future)]
+                try:
+                    result = future.result()
+                except Exception as x:
+                    outcome.update({"status": "failed", "error": str(x)})
+                else:
+                    outcome["code"] = result["status"]
+                    if result["status"] >= 400:
+                        outcome.update(
+                            {"status": "failed", "error": result["body"]}
+                        )
+                    else:
+                        outcome["status"] = "succeeded"
+                        if "dryRun" in result:
+                            outcome.update(
+                                (k, result[k])
+                                for k in ("changed", "patchBytes", "diff")
+                            )
+
+                if outcome["status"] == "failed":
+                    failed += 1
+
+            if (
+                max_error_rate is not None
+                and failed / len(targets) > max_error_rate
+            ):
+                logger.warning(
+                    "Too many failures ({}/{}), skipping the remaining "
+                    "virtual services".format(failed, len(targets))
+                )
+                remaining = iter(())
+                continue
+
+            submit(len(done))
+
+    results = list(outcomes.values())
+    return {
+        "succeeded": sum(1 for r in results if r["status"] == "succeeded"),
+        "failed": failed,
+        "skipped": sum(1 for r in results if r["status"] == "skipped"),
+        "results": results,
+    }
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio counterparts of the probes and actions of `chaosistio.fault`.
+
+They return the same results as their synchronous versions but never block
+the event loop, so many of them can run concurrently. They require the
+`kubernetes_asyncio` package (`pip install chaostoolkit-istio[async]`).
+"""
+
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Dict, List
+
+from chaoslib.exceptions import ActivityFailed
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio.aio import async_call_api, create_async_k8s_api_client
+from chaosistio.api import slim_result, virtual_service_url
+from chaosistio.fault.actions import (
+    check_patch_strategy,
+    fault_patch,
+    retry_delay,
+    select_faults,
+    unchanged,
+    written,
+)
+from chaosistio.informer import get_informer
+
+__all__ = [
+    "get_virtual_service",
+    "set_fault",
+    "unset_fault",
+    "add_delay_fault",
+    "add_abort_fault",
+    "remove_delay_fault",
+    "remove_abort_fault",
+]
+logger = logging.getLogger("chaostoolkit")
+
+
+async def get_virtual_service(
+    virtual_service_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.probes.get_virtual_service`
+    """
+    result = None
+    informer = get_informer(ns, version, secrets)
+    if informer is not None:
+        obj = informer.get(ns, virtual_service_name)
+        if obj is not None:
+            result = {"status": 200, "body": obj, "headers": {}}
+
+    if result is None:
+        result = await read_virtual_service(
+            virtual_service_name, ns, version, configuration, secrets
+        )
+
+    if fields is not None:
+        return slim_result(result, fields)
+    return result
+
+
+async def set_fault(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    fault: Dict[str, Any],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.set_fault`
+    """
+    return await patch_faults(
+        virtual_service_name,
+        routes,
+        fault,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+async def unset_fault(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.unset_fault`
+    """
+    return await patch_faults(
+        virtual_service_name,
+        routes,
+        None,
+        ns=ns,
+        version=version,
+        configuration=configuration,
+        secrets=secrets,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+        fields=fields,
+    )
+
+
+async def add_delay_fault(
+    virtual_service_name: str,
+    fixed_delay: str,
+    routes: List[Dict[str, str]],
+    percentage: float = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.add_delay_fault`
+    """
+    fault = {"delay": {"fixedDelay": fixed_delay}}
+    if percentage is not None:
+        fault["delay"]["percentage"] = {}
+        fault["delay"]["percentage"]["value"] = percentage
+
+    return await set_fault(
+        virtual_service_name,
+        fault=fault,
+        ns=ns,
+        configuration=configuration,
+        secrets=secrets,
+        routes=routes,
+        version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+    )
+
+
+async def add_abort_fault(
+    virtual_service_name: str,
+    http_status: int,
+    routes: List[Dict[str, str]],
+    percentage: float = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.add_abort_fault`
+    """
+    fault = {"abort": {"httpStatus": http_status}}
+    if percentage is not None:
+        fault["abort"]["percentage"] = {}
+        fault["abort"]["percentage"]["value"] = percentage
+
+    return await set_fault(
+        virtual_service_name,
+        fault=fault,
+        ns=ns,
+        configuration=configuration,
+        secrets=secrets,
+        routes=routes,
+        version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+    )
+
+
+async def remove_delay_fault(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.remove_delay_fault`
+    """
+    return await unset_fault(
+        virtual_service_name,
+        ns=ns,
+        configuration=configuration,
+        secrets=secrets,
+        routes=routes,
+        version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+    )
+
+
+async def remove_abort_fault(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.remove_abort_fault`
+    """
+    return await unset_fault(
+        virtual_service_name,
+        ns=ns,
+        configuration=configuration,
+        secrets=secrets,
+        routes=routes,
+        version=version,
+        patch_strategy=patch_strategy,
+        max_retries=max_retries,
+    )
+
+
+###############################################################################
+# Private functions
+###############################################################################
+async def read_virtual_service(
+    virtual_service_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.probes.read_virtual_service`
+    """
+    api = await create_async_k8s_api_client(configuration, secrets)
+    url = virtual_service_url(version, ns, virtual_service_name)
+    return await async_call_api(
+        api, url, "GET", header_params={"Accept": "application/json"}
+    )
+
+
+async def patch_faults(
+    virtual_service_name: str,
+    routes: List[Dict[str, str]],
+    fault: Dict[str, Any] = None,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+    patch_strategy: str = "merge",
+    max_retries: int = 3,
+    fields: List[str] = None,
+) -> Dict[str, Any]:
+    """
+    See `chaosistio.fault.actions.patch_faults`
+    """
+    check_patch_strategy(patch_strategy)
+    url = virtual_service_url(version, ns, virtual_service_name)
+    description = "Virtual service '{}'".format(virtual_service_name)
+
+    attempt = 0
+    while True:
+        # after a conflict, the informer may still hold the version the API
+        # server just rejected
+        read = read_virtual_service if attempt else get_virtual_service
+        result = await read(
+            virtual_service_name,
+            ns=ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        )
+        if result["status"] != 200:
+            raise ActivityFailed(
+                "Virtual Service '{}' does not exist: {}".format(
+                    virtual_service_name, str(result["body"])
+                )
+            )
+
+        virtual_service = result["body"]
+        http = virtual_service["spec"].get("http") or []
+        (indexes,), faults = select_faults(virtual_service, [(routes, fault)])
+        if unchanged(http, faults):
+            result = dict(result, changed=False)
+            if fields is not None:
+                return dict(
+                    slim_result(result, fields), routes=indexes, changed=False
+                )
+            return result
+
+        content_type, payload = fault_patch(
+            patch_strategy,
+            virtual_service_name,
+            version,
+            virtual_service,
+            faults,
+        )
+
+        api = await create_async_k8s_api_client(configuration, secrets)
+        result = await async_call_api(
+            api,
+            url,
+            "PATCH",
+            header_params={
+                "Content-Type": content_type,
+                "Accept": "application/json",
+            },
+            body=payload,
+        )
+        result["changed"] = result["status"] < 400
+        delay = retry_delay(url, result, attempt, max_retries, description)
+        if delay is None:
+            # the ledger may be persisted to a file and is shared with the
+            # threads of the synchronous actions
+            await asyncio.get_running_loop().run_in_executor(
+                None,
+                partial(
+                    written,
+                    virtual_service_name,
+                    ns,
+                    version,
+                    virtual_service,
+                    indexes,
+                    result,
+                    configuration,
+                    secrets=secrets,
+                ),
+            )
+            if fields is not None:
+                return dict(
+                    slim_result(result, fields),
+                    routes=indexes,
+                    changed=result["changed"],
+                )
+            return result
+
+        attempt += 1
+        await asyncio.sleep(delay)
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, List
+
+__all__ = ["structural_diff"]
+
+
+def structural_diff(
+    before: Any, after: Any, path: str = ""
+) -> List[Dict[str, Any]]:
+    """
+    Compute the changes turning `before` into `after` as a list of
+    RFC 6902 like operations, `add`, `remove` or `replace`, on the deepest
+    paths that changed so the diff of a large document stays small.
+
+    Operations also carry the `previous` value of the paths they remove or
+    replace.
+    """
+    if isinstance(before, dict) and isinstance(after, dict):
+        ops = []
+        for key, value in before.items():
+            if key not in after:
+                ops.append(
+                    {
+                        "op": "remove",
+                        "path": pointer(path, key),
+                        "previous": value,
+                    }
+                )
+        for key, value in after.items():
+            if key not in before:
+                ops.append(
+                    {"op": "add", "path": pointer(path, key), "value": value}
+                )
+            else:
+                ops.extend(
+                    structural_diff(before[key], value, pointer(path, key))
+                )
+        return ops
+
+    if isinstance(before, list) and isinstance(after, list):
+        ops = []
+        for index, (old, new) in enumerate(zip(before, after)):
+            ops.extend(structural_diff(old, new, pointer(path, index)))
+        for index in range(len(after), len(before)):
+            ops.append(
+                {
+                    "op": "remove",
+                    "path": pointer(path, index),
+                    "previous": before[index],
+                }
+            )
+        for index in range(len(before), len(after)):
+            ops.append(
+                {
+                    "op": "add",
+                    "path": pointer(path, index),
+                    "value": after[index],
+                }
+            )
+        return ops
+
+    if before == after:
+        return []
+    return [{"op": "replace", "path": path, "value": after, "previous": before}]
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def pointer(path: str, token: Any) -> str:
+    token = str(token).replace("~", "~0").replace("/", "~1")
+    return "{}/{}".format(path, token)
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import threading
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Tuple
+
+from chaoslib.types import Configuration
+
+__all__ = [
+    "record_faults",
+    "record_traffic_policy",
+    "route_records",
+    "pending_faults",
+    "forget_faults",
+    "forget_traffic_policy",
+    "clear_ledger",
+    "ledger_path",
+    "entry_key",
+    "ROUTE_FIELDS",
+]
+logger = logging.getLogger("chaostoolkit")
+# member of the routes of each virtual service section the actions change
+ROUTE_FIELDS = {"http": "fault", "tcp": "route"}
+_ledger_lock = threading.Lock()
+_ledger: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+
+
+def ledger_path(configuration: Configuration = None) -> Optional[str]:
+    """
+    Path of the file the ledger is persisted to, set through the
+    `istio_fault_ledger_path` configuration key. The ledger is only kept in
+    memory when it is not set.
+    """
+    path = (configuration or {}).get("istio_fault_ledger_path")
+    if path:
+        return os.path.expanduser(path)
+
+
+def record_faults(
+    virtual_service_name: str,
+    ns: str,
+    version: str,
+    virtual_service: Dict[str, Any],
+    indexes: List[int],
+    configuration: Configuration = None,
+    section: str = "http",
+    cluster: Dict[str, str] = None,
+) -> None:
+    """
+    Remember the `fault` of the routes at `indexes` of the virtual service as
+    it was before we changed it. For `tcp` routes, their `route` is
+    remembered instead.
+
+    Only the first change of a route is recorded so the ledger always holds
+    the state from before the experiment touched it.
+
+    Virtual services of other clusters than the default one are recorded
+    apart, with the `cluster` they belong to, see
+    `chaosistio.clusters.cluster_of`.
+    """
+    if not indexes:
+        return
+
+    entry = {
+        "ns": ns,
+        "version": version,
+        "name": virtual_service_name,
+        "routes": {},
+    }
+    if cluster:
+        entry["cluster"] = dict(cluster)
+    key = entry_key(entry)
+    path = ledger_path(configuration)
+
+    with _ledger_lock:
+        if path:
+            load(path)
+
+        entry = _ledger.setdefault(key, entry)
+        records = route_records(virtual_service, indexes, section)
+        for route, record in records.items():
+            entry["routes"].setdefault(route, record)
+
+        if path:
+            save(path)
+
+
+def route_records(
+    virtual_service: Dict[str, Any], indexes: List[int], section: str = "http"
+) -> Dict[str, Dict[str, Any]]:
+    """
+    The records of the routes at `indexes` of the virtual service, as they
+    are kept in the `routes` of a ledger entry, by their `route_key`.
+    """
+    field = ROUTE_FIELDS[section]
+    routes = virtual_service["spec"][section]
+    resource_version = virtual_service.get("metadata", {}).get(
+        "resourceVersion"
+    )
+    records = {}
+    for index in indexes:
+        record = {
+            "index": index,
+            field: deepcopy(routes[index].get(field)),
+            "resourceVersion": resource_version,
+        }
+        if section != "http":
+            record["section"] = section
+        records[route_key(section, routes[index], index)] = record
+    return records
+
+
+def record_traffic_policy(
+    destination_rule_name: str,
+    ns: str,
+    version: str,
+    subset: Optional[str],
+    setting: str,
+    value: Optional[Dict[str, Any]],
+    configuration: Configuration = None,
+    cluster: Dict[str, str] = None,
+) -> None:
+    """
+    Remember the `setting` of the traffic policy of a destination rule, or
+    of its `subset`, as it was before we changed it, `None` when it was not
+    set.
+
+    Destination rules get their own entries, of the `DestinationRule` kind,
+    holding their `settings` rather than `routes`. As for virtual services,
+    only the first change is recorded.
+    """
+    entry = {
+        "kind": "DestinationRule",
+        "ns": ns,
+        "version": version,
+        "name": destination_rule_name,
+        "settings": {},
+    }
+    if cluster:
+        entry["cluster"] = dict(cluster)
+    key = entry_key(entry)
+    path = ledger_path(configuration)
+
+    with _ledger_lock:
+        if path:
+            load(path)
+
+        entry = _ledger.setdefault(key, entry)
+        entry["settings"].setdefault(
+            setting_key(subset, setting),
+            {"subset": subset, "setting": setting, "value": deepcopy(value)},
+        )
+
+        if path:
+            save(path)
+
+
+def pending_faults(
+    configuration: Configuration = None,
+) -> List[Dict[str, Any]]:
+    """
+    Return the ledger entries, one per virtual service or destination rule,
+    that still need to be rolled back.
+    """
+    path = ledger_path(configuration)
+    with _ledger_lock:
+        if path:
+            load(path)
+        return [dict(entry) for entry in _ledger.values()]
+
+
+def forget_faults(
+    entry: Dict[str, Any],
+    configuration: Configuration = None,
+    section: str = None,
+    routes: List[str] = None,
+) -> None:
+    """
+    Drop the ledger entry of a virtual service once it was rolled back, or
+    only its routes of `section`, or with the keys listed in `routes`, when
+    given.
+    """
+    path = ledger_path(configuration)
+    key = entry_key(entry)
+    with _ledger_lock:
+        if section is None and routes is None:
+            _ledger.pop(key, None)
+        elif key in _ledger:
+            kept = {
+                k: r
+                for (k, r) in _ledger[key]["routes"].items()
+                if (section is not None and r.get("section", "http") != section)
+                or (routes is not None and k not in routes)
+            }
+            if kept:
+                _ledger[key] = dict(_ledger[key], routes=kept)
+            else:
+                del _ledger[key]
+        if path:
+            save(path)
+
+
+def forget_traffic_policy(
+    entry: Dict[str, Any], key: str, configuration: Configuration = None
+) -> None:
+    """
+    Drop the setting recorded under `key`, see `setting_key`, from the
+    ledger entry of a destination rule once it was restored, and the entry
+    itself when it was its last setting.
+    """
+    path = ledger_path(configuration)
+    entry_id = entry_key(entry)
+    with _ledger_lock:
+        stored = _ledger.get(entry_id)
+        if stored is not None:
+            settings = {
+                k: s for (k, s) in stored["settings"].items() if k != key
+            }
+            if settings:
+                _ledger[entry_id] = dict(stored, settings=settings)
+            else:
+                del _ledger[entry_id]
+        if path:
+            save(path)
+
+
+def entry_key(entry: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Identify the resource of a ledger entry, in its cluster. Entries without
+    a `kind` are the ones of virtual services.
+    """
+    cluster = tuple(sorted((entry.get("cluster") or {}).items()))
+    return (
+        entry.get("kind", "VirtualService"),
+        entry["ns"],
+        entry["version"],
+        entry["name"],
+        cluster,
+    )
+
+
+def clear_ledger() -> None:
+    with _ledger_lock:
+        _ledger.clear()
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def route_signature(route: Dict[str, Any], field: str = "fault") -> str:
+    """
+    Identify a route by everything but the `field` we change so we can find
+    it back even if routes were inserted before it in the meantime.
+    """
+    return json.dumps(
+        {k: v for (k, v) in route.items() if k != field}, sort_keys=True
+    )
+
+
+def route_key(section: str, route: Dict[str, Any], index: int) -> str:
+    """
+    Key of a route in a ledger entry, made of its `section`, its `index`
+    and its signature, see `route_signature`.
+
+    The index tells apart routes with the same signature, such as routes
+    only differing by their fault or `tcp` routes without a `match`.
+    """
+    signature = route_signature(route, ROUTE_FIELDS[section])
+    return "{}:{}:{}".format(section, index, signature)
+
+
+def key_signature(key: str) -> str:
+    """
+    Signature of the route recorded under `key`, see `route_key`.
+    """
+    return key.split(":", 2)[2]
+
+
+def setting_key(subset: Optional[str], setting: str) -> str:
+    """
+    Key of a traffic policy setting in a ledger entry, the one of the
+    destination rule itself has no subset.
+    """
+    return "{}/{}".format(subset or "", setting)
+
+
+def load(path: str) -> None:
+    if not os.path.exists(path):
+        return
+
+    with open(path) as f:
+        for entry in json.load(f):
+            _ledger.setdefault(entry_key(entry), entry)
+
+
+def save(path: str) -> None:
+    tmp = "{}.tmp".format(path)
+    with open(tmp, "w") as f:
+        json.dump(list(_ledger.values()), f, indent=2)
+    os.replace(tmp, path)
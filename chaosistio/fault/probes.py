@@ -1,13 +1,38 @@
 # -*- coding: utf-8 -*-
-import json
-from typing import Any, Dict
+import copy
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
 
+from chaoslib.exceptions import ActivityFailed
 from chaoslib.types import Configuration, Secrets
-from kubernetes.client.rest import ApiException
 
 from chaosistio import create_k8s_api_client
+from chaosistio.api import (
+    call_api,
+    iter_listing,
+    slim_result,
+    stream_list,
+    virtual_service_url,
+)
+from chaosistio.clusters import Cluster, cluster_key, on_clusters
+from chaosistio.informer import get_informer
 
-__all__ = ["get_virtual_service"]
+if TYPE_CHECKING:  # pragma: no cover
+    from kubernetes import client
+
+__all__ = [
+    "get_virtual_service",
+    "list_virtual_services",
+    "wait_for_fault_propagation",
+]
+logger = logging.getLogger("chaostoolkit")
+ISTIOD_MONITORING_PORT = 15014
+_list_cache_lock = threading.Lock()
+_list_cache: Dict[Tuple[Any, ...], Tuple[float, List[Dict[str, Any]]]] = {}
 
 
 def get_virtual_service(
@@ -16,33 +41,431 @@ def get_virtual_service(
     version: str = "networking.istio.io/v1alpha3",
     configuration: Configuration = None,
     secrets: Secrets = None,
+    fields: List[str] = None,
+    clusters: List[Cluster] = None,
 ) -> Dict[str, Any]:
     """
     Get a virtual service identified by `name`
 
+    When an informer watches the namespace, the virtual service is read from
+    its local store instead of the API server.
+
+    Set `fields` to a list of dotted paths, such as
+    `metadata.resourceVersion` or `spec.http.0.fault`, to only return these
+    fields of the virtual service and no headers. This keeps the experiment
+    journal small with large virtual services.
+
+    Set `clusters` to read the virtual service from several clusters at
+    once, see `chaosistio.fault.actions.set_fault`. The result then maps
+    each cluster name to its own result.
+
     See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#VirtualService
     """  # noqa: E501
-    api = create_k8s_api_client(configuration, secrets)
-    url = "/apis/{}/namespaces/{}/virtualservices/{}".format(
-        version, ns, virtual_service_name
+    if clusters:
+
+        def apply(cluster_secrets: Secrets) -> Dict[str, Any]:
+            return get_virtual_service(
+                virtual_service_name,
+                ns=ns,
+                version=version,
+                configuration=configuration,
+                secrets=cluster_secrets,
+                fields=fields,
+            )
+
+        return on_clusters(clusters, secrets, apply)
+
+    result = None
+    informer = get_informer(ns, version, secrets)
+    if informer is not None:
+        obj = informer.get(ns, virtual_service_name)
+        if obj is not None:
+            result = {"status": 200, "body": obj, "headers": {}}
+
+    if result is None:
+        result = read_virtual_service(
+            virtual_service_name, ns, version, configuration, secrets
+        )
+
+    if fields is not None:
+        return slim_result(result, fields)
+    return result
+
+
+def list_virtual_services(
+    ns: str = "default",
+    label_selector: str = None,
+    field_selector: str = None,
+    all_namespaces: bool = False,
+    limit: int = 500,
+    cache_ttl: float = 5.0,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> List[Dict[str, Any]]:
+    """
+    List the virtual services in `ns`, or in all namespaces when
+    `all_namespaces` is set, optionally filtered by `label_selector` and
+    `field_selector`.
+
+    Virtual services are fetched in pages of `limit` items. The listing is
+    cached for `cache_ttl` seconds so several activities of the same
+    experiment do not list the cluster again. Set it to `0` to disable the
+    cache.
+
+    See https://istio.io/docs/reference/config/istio.networking.v1alpha3/#VirtualService
+    """  # noqa: E501
+    if all_namespaces:
+        ns = None
+    key = (ns, label_selector, field_selector, version, cluster_key(secrets))
+
+    if cache_ttl:
+        cached = cached_listing(key)
+        if cached is not None:
+            # copies so callers cannot alter the cached listing
+            return copy.deepcopy(cached)
+
+    items = list(
+        iter_virtual_services(
+            ns=ns,
+            label_selector=label_selector,
+            field_selector=field_selector,
+            all_namespaces=all_namespaces,
+            limit=limit,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        )
     )
 
-    try:
-        data, status, headers = api.call_api(
+    if cache_ttl:
+        with _list_cache_lock:
+            _list_cache[key] = (
+                time.monotonic() + cache_ttl,
+                copy.deepcopy(items),
+            )
+    return items
+
+
+def wait_for_fault_propagation(
+    virtual_service_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    resource_version: str = None,
+    proxies: List[str] = None,
+    timeout: float = 60.0,
+    interval: float = 1.0,
+    istio_namespace: str = "istio-system",
+    istiod_label_selector: str = "app=istiod",
+    pod_timeout: float = 5.0,
+    max_workers: int = 10,
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Wait until the Envoy sidecars applied the current version of a virtual
+    service, for instance right after a fault action, so the steady state
+    is measured once the fault is actually in effect
+
+    Every `interval` seconds, the distribution report of the virtual service
+    is requested from each istiod pod, through the Kubernetes API server, on
+    up to `max_workers` threads with a `pod_timeout` timeout. It tells which
+    version of the virtual service each connected proxy acknowledged.
+    istiod must run with `PILOT_ENABLE_CONFIG_DISTRIBUTION_TRACKING=true`.
+
+    The awaited version is `resource_version` or, when not set, the current
+    one of the virtual service. `proxies` lists identifiers of proxies,
+    such as `reviews-v1-5d9c7d9f4b-x2x7b.default`, to wait for even if istiod
+    does not report them yet.
+
+    Returns whether all the proxies `converged` before `timeout` seconds,
+    the ones still `pending` and percentiles of the time each proxy took to
+    apply the version since the probe started.
+
+    See https://istio.io/latest/docs/reference/commands/istioctl/#istioctl-experimental-wait
+    """  # noqa: E501
+    started = time.monotonic()
+    if resource_version is None:
+        result = get_virtual_service(
+            virtual_service_name,
+            ns=ns,
+            version=version,
+            configuration=configuration,
+            secrets=secrets,
+        )
+        if result["status"] != 200:
+            raise ActivityFailed(
+                "Virtual Service '{}' does not exist: {}".format(
+                    virtual_service_name, str(result["body"])
+                )
+            )
+        resource_version = result["body"]["metadata"]["resourceVersion"]
+
+    api = create_k8s_api_client(configuration, secrets)
+    pods = istiod_pods(api, istio_namespace, istiod_label_selector)
+    if not pods:
+        raise ActivityFailed(
+            "No running istiod pod matches '{}' in namespace '{}'".format(
+                istiod_label_selector, istio_namespace
+            )
+        )
+
+    resource = "VirtualService/{}/{}".format(ns, virtual_service_name)
+    expected = set(proxies or [])
+    seen = set(expected)
+    synced: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+
+    def poll(pod: str) -> Dict[str, str]:
+        try:
+            versions = distributed_versions(
+                api, istio_namespace, pod, resource, pod_timeout
+            )
+        except Exception as x:
+            errors[pod] = str(x)
+            return {}
+        errors.pop(pod, None)
+        return versions
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while True:
+            for versions in pool.map(poll, pods):
+                elapsed = time.monotonic() - started
+                for proxy, acked in versions.items():
+                    if expected and proxy not in expected:
+                        continue
+                    seen.add(proxy)
+                    if proxy not in synced and version_applied(
+                        acked, resource_version
+                    ):
+                        synced[proxy] = elapsed
+
+            pending = sorted(seen - set(synced))
+            elapsed = time.monotonic() - started
+            if (seen and not pending) or elapsed >= timeout:
+                break
+            time.sleep(min(interval, max(0.0, timeout - elapsed)))
+
+    converged = bool(seen) and not pending
+    if not converged:
+        logger.warning(
+            "{} of {} proxies did not apply version {} of virtual service "
+            "'{}' within {}s".format(
+                len(pending),
+                len(seen),
+                resource_version,
+                virtual_service_name,
+                timeout,
+            )
+        )
+
+    return {
+        "resourceVersion": resource_version,
+        "converged": converged,
+        "proxies": len(seen),
+        "synced": len(synced),
+        "pending": pending,
+        "duration": time.monotonic() - started,
+        "latency": percentiles(list(synced.values())),
+        "errors": errors,
+    }
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def iter_virtual_services(
+    ns: str = "default",
+    label_selector: str = None,
+    field_selector: str = None,
+    all_namespaces: bool = False,
+    limit: int = 500,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield virtual services one page at a time, following the `continue`
+    token returned by the API server.
+
+    Nothing is cached so only the page being read is held in memory, see
+    `list_virtual_services` for a cached listing.
+    """
+    if all_namespaces:
+        ns = None
+
+    api = create_k8s_api_client(configuration, secrets)
+    url = virtual_service_url(version, ns)
+    query_params = [("limit", limit)]
+    if label_selector:
+        query_params.append(("labelSelector", label_selector))
+    if field_selector:
+        query_params.append(("fieldSelector", field_selector))
+
+    token = None
+    while True:
+        params = list(query_params)
+        if token:
+            params.append(("continue", token))
+
+        listing = stream_list(
+            api,
             url,
-            "GET",
             header_params={"Accept": "application/json"},
-            auth_settings=["BearerToken"],
-            _preload_content=False,
+            query_params=params,
+        )
+        result = {}
+        yield from iter_listing(listing, result)
+
+        if result["status"] != 200:
+            raise ActivityFailed(
+                "Failed to list virtual services: {}".format(
+                    str(result["body"])
+                )
+            )
+
+        token = result["body"].get("metadata", {}).get("continue")
+        if not token:
+            break
+
+
+def cached_listing(key: Tuple[Any, ...]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Return the cached listing under `key` unless it expired. Expired
+    listings are evicted along the way.
+    """
+    now = time.monotonic()
+    with _list_cache_lock:
+        for k in [k for (k, c) in _list_cache.items() if c[0] <= now]:
+            del _list_cache[k]
+        cached = _list_cache.get(key)
+    return cached[1] if cached else None
+
+
+def read_virtual_service(
+    virtual_service_name: str,
+    ns: str = "default",
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> Dict[str, Any]:
+    """
+    Get a virtual service from the API server, never from an informer, for
+    instance to retry a write rejected because what was read is outdated.
+    """
+    api = create_k8s_api_client(configuration, secrets)
+    url = virtual_service_url(version, ns, virtual_service_name)
+    return call_api(
+        api, url, "GET", header_params={"Accept": "application/json"}
+    )
+
+
+def clear_virtual_services_cache() -> None:
+    """
+    Forget every cached listing of virtual services.
+    """
+    with _list_cache_lock:
+        _list_cache.clear()
+
+
+def invalidate_virtual_services_cache(
+    ns: str, version: str, secrets: Secrets = None
+) -> None:
+    """
+    Forget the cached listings that may contain a virtual service of `ns`,
+    in the cluster `secrets` connect to, as it was just written.
+    """
+    cluster = cluster_key(secrets)
+    with _list_cache_lock:
+        for key in list(_list_cache):
+            if key[0] in (ns, None) and key[3:] == (version, cluster):
+                del _list_cache[key]
+
+
+def istiod_pods(
+    api: "client.ApiClient", istio_namespace: str, label_selector: str
+) -> List[str]:
+    """
+    Names of the running istiod pods.
+    """
+    listing = stream_list(
+        api,
+        "/api/v1/namespaces/{}/pods".format(istio_namespace),
+        header_params={"Accept": "application/json"},
+        query_params=[("labelSelector", label_selector)],
+    )
+    pods = []
+    result = {}
+    for pod in iter_listing(listing, result):
+        if pod.get("status", {}).get("phase") == "Running":
+            pods.append(pod["metadata"]["name"])
+
+    if result["status"] != 200:
+        raise ActivityFailed(
+            "Failed to list istiod pods: {}".format(str(result["body"]))
         )
-    except ApiException as x:
-        body = x.body
-        if x.headers.get("Content-Type") == "application/json":
-            body = json.loads(body)
-        return {"status": x.status, "body": body, "headers": dict(**x.headers)}
+    return pods
+
+
+def distributed_versions(
+    api: "client.ApiClient",
+    istio_namespace: str,
+    pod: str,
+    resource: str,
+    timeout: float,
+) -> Dict[str, str]:
+    """
+    Ask an istiod pod, through the API server pod proxy, which version of
+    `resource` the proxies connected to it acknowledged in their routes.
+    """
+    result = call_api(
+        api,
+        "/api/v1/namespaces/{}/pods/{}:{}/proxy/debug/config_distribution".format(
+            istio_namespace, pod, ISTIOD_MONITORING_PORT
+        ),
+        "GET",
+        header_params={"Accept": "application/json"},
+        query_params=[("resource", resource)],
+        request_timeout=timeout,
+    )
+    if result["status"] != 200:
+        raise ActivityFailed(
+            "istiod pod '{}' failed to report the distribution of {}: "
+            "{}".format(pod, resource, str(result["body"]))
+        )
+
+    return {
+        entry["proxy"]: entry.get("route_acked", "")
+        for entry in result["body"] or []
+        if entry.get("proxy")
+    }
+
+
+def version_applied(acked: str, resource_version: str) -> bool:
+    if acked == resource_version:
+        return True
+    # resource versions are opaque but etcd backed ones are increasing
+    try:
+        return int(acked) >= int(resource_version)
+    except ValueError:
+        return False
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    """
+    Nearest-rank percentiles of `values`, `None` when there is none.
+    """
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    def rank(p: float) -> float:
+        return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
 
     return {
-        "status": status,
-        "body": json.loads(data.read(decode_content=True)),
-        "headers": dict(**headers),
+        "p50": rank(50),
+        "p90": rank(90),
+        "p99": rank(99),
+        "max": values[-1],
     }
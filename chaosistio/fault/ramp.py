@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+import logging
+import math
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from chaoslib.exceptions import ActivityFailed
+
+__all__ = ["FaultRamp", "ramp_schedule", "start_ramp", "stop_ramps"]
+logger = logging.getLogger("chaostoolkit")
+CURVES = ("linear", "exponential")
+_ramps_lock = threading.Lock()
+_ramps: Dict[Tuple[str, str, str], "FaultRamp"] = {}
+
+
+class FaultRamp:
+    """
+    Apply a sequence of fault percentages from a background thread, holding
+    each one for its duration.
+
+    A percentage equal to the one currently applied is not written again.
+    """
+
+    def __init__(
+        self,
+        steps: List[Dict[str, float]],
+        apply: Callable[[float], None],
+        routes: Set[str] = None,
+    ):
+        self.steps = steps
+        self.apply = apply
+        # ledger keys of the routes `apply` changed
+        self.routes = routes if routes is not None else set()
+        self.current = None
+        self.error = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self.run, name="chaosistio-ramp", daemon=True
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def run(self) -> None:
+        for step in self.steps:
+            if self._stopped.is_set():
+                return
+
+            percentage = step["percentage"]
+            if percentage != self.current:
+                try:
+                    self.apply(percentage)
+                except Exception as x:
+                    logger.error(
+                        "Fault ramp stopped at {}%: {}".format(percentage, x)
+                    )
+                    self.error = str(x)
+                    return
+                self.current = percentage
+
+            if self._stopped.wait(step.get("duration", 0)):
+                return
+
+
+def ramp_schedule(
+    schedule: List[Dict[str, float]] = None,
+    curve: str = None,
+    start_percentage: float = 1.0,
+    end_percentage: float = 100.0,
+    step_count: int = 5,
+    duration: float = 600.0,
+) -> List[Dict[str, float]]:
+    """
+    Normalize a ramp into a list of `{"percentage": ..., "duration": ...}`
+    steps.
+
+    Either `schedule` lists the steps explicitly or `curve` generates
+    `step_count` steps, evenly spread over `duration` seconds, going from
+    `start_percentage` to `end_percentage`.
+    """
+    if schedule:
+        return [
+            {
+                "percentage": float(step["percentage"]),
+                "duration": float(step.get("duration", 0)),
+            }
+            for step in schedule
+        ]
+
+    if curve not in CURVES:
+        raise ActivityFailed(
+            "A ramp needs either a schedule or a curve among: {}".format(
+                ", ".join(CURVES)
+            )
+        )
+    if step_count < 1:
+        raise ActivityFailed("A ramp needs at least one step")
+    if curve == "exponential" and start_percentage <= 0:
+        raise ActivityFailed("An exponential ramp must start above 0%")
+
+    hold = duration / step_count
+    steps = []
+    for i in range(step_count):
+        ratio = i / (step_count - 1) if step_count > 1 else 1
+        if curve == "linear":
+            percentage = start_percentage + (
+                (end_percentage - start_percentage) * ratio
+            )
+        else:
+            percentage = start_percentage * math.pow(
+                end_percentage / start_percentage, ratio
+            )
+        steps.append({"percentage": round(percentage, 2), "duration": hold})
+    return steps
+
+
+def start_ramp(
+    key: Tuple[str, str, str],
+    steps: List[Dict[str, float]],
+    apply: Callable[[float], None],
+    routes: Set[str] = None,
+) -> FaultRamp:
+    """
+    Start a ramp for the virtual service identified by `key`, stopping the
+    one already running for it, if any.
+
+    `apply` adds the ledger keys of the routes it changes to `routes`.
+    """
+    ramp = FaultRamp(steps, apply, routes)
+    with _ramps_lock:
+        previous = _ramps.pop(key, None)
+        _ramps[key] = ramp
+
+    if previous is not None:
+        previous.stop()
+    ramp.start()
+    return ramp
+
+
+def stop_ramps(
+    key: Optional[Tuple[str, str, str]] = None,
+) -> List[Tuple[Tuple[str, str, str], FaultRamp]]:
+    """
+    Stop the ramp of the virtual service identified by `key`, or all of them,
+    and return the stopped ramps.
+    """
+    with _ramps_lock:
+        if key is None:
+            stopped = list(_ramps.items())
+            _ramps.clear()
+        elif key in _ramps:
+            stopped = [(key, _ramps.pop(key))]
+        else:
+            stopped = []
+
+    for _, ramp in stopped:
+        ramp.stop()
+    return stopped
+
+
+def fault_with_percentage(
+    fault: Dict[str, Any], percentage: float
+) -> Dict[str, Any]:
+    """
+    Copy of `fault` with the percentage of each of its delay and abort set to
+    `percentage`.
+    """
+    fault = dict(fault)
+    for kind in ("delay", "abort"):
+        if kind in fault:
+            fault[kind] = dict(fault[kind], percentage={"value": percentage})
+    return fault
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+__all__ = ["RouteIndex", "get_route_index"]
+ROUTE_INDEX_CACHE_SIZE = 128
+_indexes_lock = threading.Lock()
+_indexes: "OrderedDict[Tuple[str, ...], RouteIndex]" = OrderedDict()
+
+
+class RouteIndex:
+    """
+    Index the `http`, or `tcp`, routes of a virtual service by destination
+    and name so route selectors are resolved without scanning the whole
+    spec.
+
+    Only the positions of the routes and their `match` blocks are kept, not
+    the routes themselves, so cached indexes of large virtual services stay
+    small.
+
+    A route selector is a dictionary supporting the following keys, all
+    optional but at least one must be set:
+
+    * `destination`: `{"host": ..., "subset": ...}` the route must forward
+      to, the subset is compared too, even when missing
+    * `weight`: the weight the route must give to that destination
+    * `name`: the name of the route
+    * `match`: conditions one of the route `match` blocks must contain, for
+      instance `{"uri": {"prefix": "/api"}}` or
+      `{"headers": {"end-user": {"exact": "jason"}}}`
+    """
+
+    def __init__(self, http: List[Dict[str, Any]]):
+        self.by_destination = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.matches: Dict[int, List[Dict[str, Any]]] = {}
+
+        for index, entry in enumerate(http):
+            if entry.get("name"):
+                self.by_name[entry["name"]].append(index)
+            if entry.get("match"):
+                self.matches[index] = entry["match"]
+            for route in entry.get("route", []):
+                if "destination" in route:
+                    destination = route["destination"]
+                    # not mandatory in response
+                    # https://istio.io/latest/docs/reference/config/networking/virtual-service/#Destination  # noqa: E501
+                    target = (destination["host"], destination.get("subset"))
+                    self.by_destination[target].append(
+                        (index, route.get("weight"))
+                    )
+
+    def select(self, selectors: List[Dict[str, Any]]) -> List[int]:
+        """
+        Return, in order, the indexes of the routes matching any selector.
+        """
+        indexes = set()
+        for selector in selectors:
+            indexes.update(self.select_one(selector))
+        return sorted(indexes)
+
+    def select_one(self, selector: Dict[str, Any]) -> Set[int]:
+        candidates = None
+
+        if "destination" in selector:
+            destination = selector["destination"]
+            target = (destination["host"], destination.get("subset"))
+            weight = selector.get("weight")
+            candidates = {
+                index
+                for (index, w) in self.by_destination.get(target, [])
+                if weight is None or w == weight
+            }
+
+        if "name" in selector:
+            named = set(self.by_name.get(selector["name"], []))
+            candidates = named if candidates is None else candidates & named
+
+        if "match" in selector:
+            if candidates is None:
+                candidates = self.matches
+            candidates = {
+                index
+                for index in candidates
+                if any(
+                    contains(block, selector["match"])
+                    for block in self.matches.get(index, [])
+                )
+            }
+
+        return set(candidates or ())
+
+
+def get_route_index(
+    http: List[Dict[str, Any]],
+    metadata: Optional[Dict[str, Any]] = None,
+    section: str = "http",
+) -> RouteIndex:
+    """
+    Return the index of the given routes of `section`, reusing the one built
+    for the same virtual service `resourceVersion` when possible.
+    """
+    metadata = metadata or {}
+    key = (
+        metadata.get("namespace"),
+        metadata.get("name"),
+        # tells apart the same virtual service in different clusters
+        metadata.get("uid", ""),
+        metadata.get("resourceVersion"),
+        section,
+    )
+    if None in key:
+        return RouteIndex(http)
+
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = RouteIndex(http)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > ROUTE_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def contains(value: Any, expected: Any) -> bool:
+    """
+    Tell if `value` holds everything in `expected`, recursively.
+    """
+    if isinstance(expected, dict):
+        if not isinstance(value, dict):
+            return False
+        return all(
+            k in value and contains(value[k], v) for (k, v) in expected.items()
+        )
+    return value == expected
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import socket
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from chaoslib.types import Configuration, Secrets
+
+from chaosistio import client_in_use, create_k8s_api_client
+from chaosistio.api import iter_listing, stream_list, virtual_service_url
+from chaosistio.clusters import cluster_key
+
+__all__ = [
+    "VirtualServiceInformer",
+    "start_informer",
+    "stop_informers",
+    "get_informer",
+]
+logger = logging.getLogger("chaostoolkit")
+_informers_lock = threading.Lock()
+_informers: Dict[Tuple[Any, ...], "VirtualServiceInformer"] = {}
+
+
+class VirtualServiceInformer:
+    """
+    Keep a local store of the virtual services of a namespace, or of all
+    namespaces when `ns` is `None`, up to date by watching them.
+
+    The informer lists the virtual services once and then applies the events
+    of a watch stream to its store. Bookmarks keep track of the latest
+    resource version and the store is listed again whenever the API server
+    tells us that version is too old (410 Gone).
+    """
+
+    def __init__(
+        self,
+        ns: str = None,
+        version: str = "networking.istio.io/v1alpha3",
+        configuration: Configuration = None,
+        secrets: Secrets = None,
+        watch_timeout: int = 300,
+        page_size: int = 500,
+    ):
+        self.ns = ns
+        self.version = version
+        self.configuration = configuration
+        self.secrets = secrets
+        self.watch_timeout = watch_timeout
+        self.page_size = page_size
+        self.resource_version = None
+        self._store = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stopped = threading.Event()
+        self._response = None
+        self._thread = None
+
+    @property
+    def synced(self) -> bool:
+        return self._synced.is_set()
+
+    def start(self, wait: bool = True, timeout: float = 30) -> None:
+        """
+        Start watching in a background thread and, unless `wait` is `False`,
+        block until the initial listing is stored.
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.run, name="chaosistio-informer", daemon=True
+            )
+            self._thread.start()
+
+        if wait:
+            self._synced.wait(timeout)
+
+    def stop(self) -> None:
+        """
+        Stop watching and drop the store.
+        """
+        self._stopped.set()
+        response = self._response
+        if response is not None:
+            interrupt(response)
+        if self._thread is not None:
+            self._thread.join(5)
+        self._synced.clear()
+        with self._lock:
+            self._store.clear()
+
+    def get(self, ns: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored virtual service, if any. The returned object is
+        shared and must not be mutated.
+        """
+        with self._lock:
+            return self._store.get((ns, name))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._store)
+
+    def update(self, obj: Dict[str, Any]) -> None:
+        """
+        Store a virtual service we just wrote, so reading it back does not
+        wait for its watch event, or one the watch sent us.
+
+        An object older than the stored one, such as the response to a
+        write that arrives after the watch event of a later write, is
+        ignored.
+        """
+        metadata = obj.get("metadata", {})
+        key = (metadata.get("namespace"), metadata.get("name"))
+        if None in key:
+            return
+        with self._lock:
+            stored = self._store.get(key)
+            if stored is not None and is_older(
+                metadata.get("resourceVersion"),
+                stored.get("metadata", {}).get("resourceVersion"),
+            ):
+                return
+            self._store[key] = obj
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                if self.resource_version is None:
+                    self.relist()
+                self.watch()
+            except Exception:
+                if self._stopped.is_set():
+                    break
+                logger.debug(
+                    "Virtual services watch failed, listing again",
+                    exc_info=True,
+                )
+                self.resource_version = None
+                self._stopped.wait(1)
+
+    def relist(self) -> None:
+        api = create_k8s_api_client(self.configuration, self.secrets)
+        url = virtual_service_url(self.version, self.ns)
+        store = {}
+        token = None
+        while True:
+            params = [("limit", self.page_size)]
+            if token:
+                params.append(("continue", token))
+            listing = stream_list(
+                api,
+                url,
+                header_params={"Accept": "application/json"},
+                query_params=params,
+            )
+            result = {}
+            for obj in iter_listing(listing, result):
+                meta = obj["metadata"]
+                store[(meta.get("namespace"), meta["name"])] = obj
+
+            if result["status"] != 200:
+                raise RuntimeError(
+                    "Failed to list virtual services: {}".format(result["body"])
+                )
+
+            metadata = result["body"].get("metadata", {})
+            token = metadata.get("continue")
+            if not token:
+                break
+
+        with self._lock:
+            self._store = store
+        self.resource_version = metadata.get("resourceVersion")
+        self._synced.set()
+
+    def watch(self) -> None:
+        api = create_k8s_api_client(self.configuration, self.secrets)
+        url = virtual_service_url(self.version, self.ns)
+        with client_in_use(api):
+            self.stream_events(api, url)
+
+    def stream_events(self, api: Any, url: str) -> None:
+        from kubernetes.client.rest import ApiException
+        from kubernetes.watch.watch import iter_resp_lines
+
+        try:
+            response, _, _ = api.call_api(
+                url,
+                "GET",
+                header_params={"Accept": "application/json"},
+                query_params=[
+                    ("watch", "true"),
+                    ("allowWatchBookmarks", "true"),
+                    ("resourceVersion", self.resource_version),
+                    ("timeoutSeconds", self.watch_timeout),
+                ],
+                auth_settings=["BearerToken"],
+                _preload_content=False,
+            )
+        except ApiException as x:
+            if x.status == 410:
+                self.resource_version = None
+                return
+            raise
+
+        self._response = response
+        try:
+            for line in iter_resp_lines(response):
+                if self._stopped.is_set():
+                    break
+                self.handle_event(json.loads(line))
+                if self.resource_version is None:
+                    break
+        finally:
+            self._response = None
+            response.release_conn()
+
+    def handle_event(self, event: Dict[str, Any]) -> None:
+        kind = event.get("type")
+        obj = event.get("object", {})
+
+        if kind == "ERROR":
+            if obj.get("code") == 410:
+                logger.debug("Virtual services watch expired, listing again")
+            self.resource_version = None
+            return
+
+        metadata = obj.get("metadata", {})
+        if kind in ("ADDED", "MODIFIED"):
+            self.update(obj)
+        elif kind == "DELETED":
+            with self._lock:
+                self._store.pop(
+                    (metadata.get("namespace"), metadata.get("name")), None
+                )
+
+        if metadata.get("resourceVersion"):
+            self.resource_version = metadata["resourceVersion"]
+
+
+def start_informer(
+    ns: str = None,
+    version: str = "networking.istio.io/v1alpha3",
+    configuration: Configuration = None,
+    secrets: Secrets = None,
+) -> VirtualServiceInformer:
+    """
+    Start, or return the already running, informer for the virtual services
+    of `ns` (all namespaces when `None`) in the cluster `secrets` connect to.
+    """
+    key = (ns, version, cluster_key(secrets))
+    with _informers_lock:
+        informer = _informers.get(key)
+        if informer is None:
+            informer = VirtualServiceInformer(
+                ns, version, configuration, secrets
+            )
+            _informers[key] = informer
+    informer.start()
+    return informer
+
+
+def stop_informers() -> None:
+    """
+    Stop every running informer.
+    """
+    with _informers_lock:
+        informers = list(_informers.values())
+        _informers.clear()
+
+    for informer in informers:
+        informer.stop()
+
+
+def get_informer(
+    ns: str,
+    version: str = "networking.istio.io/v1alpha3",
+    secrets: Secrets = None,
+) -> Optional[VirtualServiceInformer]:
+    """
+    Return a synced informer watching the virtual services of `ns` in the
+    cluster `secrets` connect to, if any.
+    """
+    if not _informers:
+        return None
+
+    cluster = cluster_key(secrets)
+    with _informers_lock:
+        for key in ((ns, version, cluster), (None, version, cluster)):
+            informer = _informers.get(key)
+            if informer is not None and informer.synced:
+                return informer
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def is_older(resource_version: str, than: str) -> bool:
+    """
+    Tell if `resource_version` comes before `than`. Resource versions are
+    opaque but etcd backed ones are increasing integers, others are never
+    considered older.
+    """
+    try:
+        return int(resource_version) < int(than)
+    except (TypeError, ValueError):
+        return False
+
+
+def interrupt(response: Any) -> None:
+    """
+    Unblock the thread reading a watch response.
+
+    Closing the response from another thread waits for the pending read to
+    return, which only happens once the API server sends an event, so the
+    socket is shut down instead.
+    """
+    shutdown = getattr(response, "shutdown", None)
+    if shutdown is not None:
+        # urllib3 >= 2.3
+        shutdown()
+        return
+
+    sock = getattr(getattr(response, "connection", None), "sock", None)
+    if sock is None:
+        response.close()
+        return
+
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the calls made to the Kubernetes API.
+
+Hooks are callables receiving an event name and its data. They are called,
+from the thread that made the call, for the following events:
+
+* `request`: an API call completed, with its `verb` (`GET`, `LIST`,
+  `PATCH`...), `url`, `status`, `duration` in seconds, `start_time_ns`,
+  `request_size` and `response_size` in bytes
+* `client`: `create_k8s_api_client` returned, with its `duration`,
+  `start_time_ns` and whether the client was `cached`
+* `retry`: an operation is retried after a conflict, with its `verb`,
+  `url`, `status` and `attempt`
+
+Nothing is measured while no hook is registered, so instrumentation costs
+a single test per call when disabled.
+"""
+
+import bisect
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+__all__ = [
+    "add_hook",
+    "remove_hook",
+    "clear_hooks",
+    "instrumented",
+    "emit",
+    "MetricsRegistry",
+    "OpenTelemetryHook",
+    "registry",
+]
+logger = logging.getLogger("chaostoolkit")
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+Hook = Callable[[str, Dict[str, Any]], None]
+# replaced, never mutated, so reading it needs no lock
+_hooks: Tuple[Hook, ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook) -> None:
+    global _hooks
+    with _hooks_lock:
+        if hook not in _hooks:
+            _hooks = _hooks + (hook,)
+
+
+def remove_hook(hook: Hook) -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+def clear_hooks() -> None:
+    global _hooks
+    with _hooks_lock:
+        _hooks = ()
+
+
+def instrumented() -> bool:
+    """
+    Tell if any hook is registered, callers skip measuring otherwise.
+    """
+    return bool(_hooks)
+
+
+def emit(event: str, **data: Any) -> None:
+    """
+    Pass an event to every hook. A failing hook is logged and ignored.
+    """
+    for hook in _hooks:
+        try:
+            hook(event, data)
+        except Exception:
+            logger.debug("Instrumentation hook failed", exc_info=True)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class MetricsRegistry:
+    """
+    Prometheus-style in-memory registry of the API calls, used as a hook.
+
+    It keeps, per verb, histograms of the latency and of the request and
+    response sizes, the count of responses per status code and the count of
+    retries, plus a histogram of the time spent getting a client.
+    """
+
+    def __init__(
+        self,
+        latency_buckets: Sequence[float] = LATENCY_BUCKETS,
+        size_buckets: Sequence[float] = SIZE_BUCKETS,
+    ):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.latency: Dict[Tuple[str, ...], Histogram] = {}
+            self.request_size: Dict[Tuple[str, ...], Histogram] = {}
+            self.response_size: Dict[Tuple[str, ...], Histogram] = {}
+            self.client_latency: Dict[Tuple[str, ...], Histogram] = {}
+            self.responses: Dict[Tuple[str, ...], int] = {}
+            self.retries: Dict[Tuple[str, ...], int] = {}
+
+    def __call__(self, event: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            if event == "request":
+                verb = (data["verb"],)
+                self.histogram(self.latency, verb, self.latency_buckets)
+                self.latency[verb].observe(data["duration"])
+                self.histogram(self.request_size, verb, self.size_buckets)
+                self.request_size[verb].observe(data["request_size"])
+                self.histogram(self.response_size, verb, self.size_buckets)
+                self.response_size[verb].observe(data["response_size"])
+                key = (data["verb"], str(data["status"]))
+                self.responses[key] = self.responses.get(key, 0) + 1
+            elif event == "client":
+                key = (str(data["cached"]).lower(),)
+                self.histogram(self.client_latency, key, self.latency_buckets)
+                self.client_latency[key].observe(data["duration"])
+            elif event == "retry":
+                key = (data["verb"],)
+                self.retries[key] = self.retries.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the metrics as a JSON serializable dictionary.
+        """
+        with self._lock:
+            return {
+                "requests": {
+                    verb: {
+                        "latency": h.snapshot(),
+                        "request_size": self.request_size[(verb,)].snapshot(),
+                        "response_size": self.response_size[(verb,)].snapshot(),
+                        "responses": {
+                            code: count
+                            for ((v, code), count) in self.responses.items()
+                            if v == verb
+                        },
+                        "retries": self.retries.get((verb,), 0),
+                    }
+                    for ((verb,), h) in self.latency.items()
+                },
+                "clients": {
+                    cached: h.snapshot()
+                    for ((cached,), h) in self.client_latency.items()
+                },
+            }
+
+    def render(self) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            histograms = [
+                (
+                    "chaosistio_api_request_duration_seconds",
+                    "Latency of the Kubernetes API calls",
+                    ("verb",),
+                    self.latency,
+                ),
+                (
+                    "chaosistio_api_request_size_bytes",
+                    "Size of the Kubernetes API request bodies",
+                    ("verb",),
+                    self.request_size,
+                ),
+                (
+                    "chaosistio_api_response_size_bytes",
+                    "Size of the Kubernetes API response bodies",
+                    ("verb",),
+                    self.response_size,
+                ),
+                (
+                    "chaosistio_client_duration_seconds",
+                    "Time spent getting a Kubernetes client",
+                    ("cached",),
+                    self.client_latency,
+                ),
+            ]
+            for name, doc, label_names, metric in histograms:
+                lines.append("# HELP {} {}".format(name, doc))
+                lines.append("# TYPE {} histogram".format(name))
+                for key, histogram in sorted(metric.items()):
+                    labels = list(zip(label_names, key))
+                    for bound, count in histogram.snapshot()["buckets"]:
+                        le = bound if bound == "+Inf" else repr(bound)
+                        lines.append(
+                            "{}_bucket{} {}".format(
+                                name,
+                                format_labels(labels + [("le", le)]),
+                                count,
+                            )
+                        )
+                    lines.append(
+                        "{}_sum{} {}".format(
+                            name, format_labels(labels), histogram.sum
+                        )
+                    )
+                    lines.append(
+                        "{}_count{} {}".format(
+                            name, format_labels(labels), histogram.count
+                        )
+                    )
+
+            counters = [
+                (
+                    "chaosistio_api_responses_total",
+                    "Kubernetes API responses per status code",
+                    ("verb", "code"),
+                    self.responses,
+                ),
+                (
+                    "chaosistio_api_retries_total",
+                    "Kubernetes API calls retried after a conflict",
+                    ("verb",),
+                    self.retries,
+                ),
+            ]
+            for name, doc, label_names, metric in counters:
+                lines.append("# HELP {} {}".format(name, doc))
+                lines.append("# TYPE {} counter".format(name))
+                for key, count in sorted(metric.items()):
+                    lines.append(
+                        "{}{} {}".format(
+                            name, format_labels(zip(label_names, key)), count
+                        )
+                    )
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def histogram(
+        metric: Dict[Tuple[str, ...], Histogram],
+        key: Tuple[str, ...],
+        buckets: Sequence[float],
+    ) -> None:
+        if key not in metric:
+            metric[key] = Histogram(buckets)
+
+
+class OpenTelemetryHook:
+    """
+    Hook turning the API calls into OpenTelemetry client spans, children of
+    the span current when the call was made. Retries are recorded as events
+    of the current span.
+
+    Requires the `opentelemetry-api` package
+    (`pip install chaostoolkit-istio[opentelemetry]`).
+    """
+
+    def __init__(self, tracer: Any = None):
+        from opentelemetry import trace
+
+        self.trace = trace
+        self.tracer = tracer or trace.get_tracer("chaosistio")
+
+    def __call__(self, event: str, data: Dict[str, Any]) -> None:
+        if event == "retry":
+            self.trace.get_current_span().add_event(
+                "chaosistio.retry",
+                {
+                    "http.request.method": data["verb"],
+                    "url.path": data["url"],
+                    "http.response.status_code": data["status"],
+                    "chaosistio.attempt": data["attempt"],
+                },
+            )
+            return
+
+        if event == "request":
+            name = data["verb"]
+            attributes = {
+                "http.request.method": data["verb"],
+                "url.path": data["url"],
+                "http.response.status_code": data["status"],
+                "http.request.body.size": data["request_size"],
+                "http.response.body.size": data["response_size"],
+            }
+        elif event == "client":
+            name = "create_k8s_api_client"
+            attributes = {"chaosistio.client.cached": data["cached"]}
+        else:
+            return
+
+        start = data["start_time_ns"]
+        span = self.tracer.start_span(
+            name,
+            kind=self.trace.SpanKind.CLIENT,
+            start_time=start,
+            attributes=attributes,
+        )
+        if event == "request" and data["status"] >= 400:
+            span.set_status(self.trace.StatusCode.ERROR)
+        span.end(end_time=start + int(data["duration"] * 1e9))
+
+
+# registry enabled by the `enable_api_instrumentation` action
+registry = MetricsRegistry()
+
+
+###############################################################################
+# Private functions
+###############################################################################
+def format_labels(labels: List[Tuple[str, str]]) -> str:
+    labels = list(labels)
+    if not labels:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                k, str(v).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for (k, v) in labels
+        )
+    )
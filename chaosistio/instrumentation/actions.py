@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from chaosistio.instrumentation import (
+    OpenTelemetryHook,
+    add_hook,
+    registry,
+    remove_hook,
+)
+
+__all__ = ["enable_api_instrumentation", "disable_api_instrumentation"]
+logger = logging.getLogger("chaostoolkit")
+_tracing_lock = threading.Lock()
+_tracing = None
+
+
+def enable_api_instrumentation(
+    metrics: bool = True, opentelemetry: bool = False
+) -> None:
+    """
+    Start measuring the calls made to the Kubernetes API.
+
+    With `metrics`, the latency of the calls, the size of their requests and
+    responses, their status codes and the number of retries are recorded in
+    histograms and counters that the `get_api_metrics` probe returns.
+
+    With `opentelemetry`, each call is also recorded as a client span,
+    child of the span current when it is made. This requires the
+    `opentelemetry-api` package
+    (`pip install chaostoolkit-istio[opentelemetry]`) and a configured
+    tracer provider.
+    """
+    global _tracing
+    if metrics:
+        add_hook(registry)
+    if opentelemetry:
+        with _tracing_lock:
+            if _tracing is None:
+                _tracing = OpenTelemetryHook()
+            add_hook(_tracing)
+    logger.debug("Kubernetes API instrumentation enabled")
+
+
+def disable_api_instrumentation() -> None:
+    """
+    Stop measuring the calls made to the Kubernetes API. Metrics recorded so
+    far are kept.
+    """
+    global _tracing
+    remove_hook(registry)
+    with _tracing_lock:
+        if _tracing is not None:
+            remove_hook(_tracing)
+            _tracing = None
+    logger.debug("Kubernetes API instrumentation disabled")
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from typing import Any, Dict, Union
+
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.instrumentation import registry
+
+__all__ = ["get_api_metrics"]
+FORMATS = ("json", "prometheus")
+
+
+def get_api_metrics(format: str = "json") -> Union[Dict[str, Any], str]:
+    """
+    Return the metrics recorded about the calls made to the Kubernetes API
+    since `enable_api_instrumentation` was called.
+
+    The `json` format returns, per verb, the latency, request and response
+    size histograms with cumulative buckets, the count of responses per
+    status code and the count of retries. The `prometheus` format renders
+    the same metrics in the Prometheus text exposition format, so they can
+    be pushed to a Pushgateway.
+    """
+    if format not in FORMATS:
+        raise ActivityFailed(
+            "Metrics format must be one of: {}".format(", ".join(FORMATS))
+        )
+    if format == "prometheus":
+        return registry.render()
+    return registry.snapshot()
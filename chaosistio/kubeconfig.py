@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Clients built from the Kubernetes configuration file, sharing the
+credentials of its exec plugins through `chaosistio.credentials`.
+
+This module imports the Kubernetes client package so it is only imported
+when the first client is built. `CachedExecKubeConfigLoader` overrides
+private methods of the loader of that package, which is why its version is
+capped to the releases it was tested with.
+"""
+
+import logging
+import weakref
+from datetime import datetime
+from typing import Optional
+
+from kubernetes import client
+from kubernetes.config.config_exception import ConfigException
+from kubernetes.config.kube_config import (
+    FileOrData,
+    KubeConfigLoader,
+    KubeConfigMerger,
+)
+
+from chaosistio.credentials import exec_credential, expiration
+
+__all__ = ["new_client_from_kubeconfig", "credential_expiry"]
+logger = logging.getLogger("chaostoolkit")
+# expiry of the client certificates the clients were built with
+_expiries: "weakref.WeakKeyDictionary[client.ApiClient, datetime]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+class CachedExecKubeConfigLoader(KubeConfigLoader):
+    """
+    Loader getting the credentials of exec plugins from the process cache
+    rather than running the plugin for every client, and reading the token
+    of that cache whenever a client calls the API so it follows its
+    refreshes.
+
+    Client certificates cannot be swapped that way, their expiry is kept in
+    `expiry` so the client can be rebuilt once they expire.
+    """
+
+    expiry: Optional[datetime] = None
+
+    def _load_from_exec_plugin(self):
+        if "exec" not in self._user:
+            return
+        try:
+            exec_config = self._user["exec"].value
+            base_path = self._get_base_path(self._cluster.path)
+            status = exec_credential(exec_config, base_path)
+            if "token" in status:
+                self.token = "Bearer {}".format(status["token"])
+                self._exec = (exec_config, base_path)
+            elif "clientCertificateData" in status:
+                if "clientKeyData" not in status:
+                    logger.error(
+                        "exec: missing clientKeyData field in plugin output"
+                    )
+                    return None
+                self.expiry = expiration(status)
+                self.cert_file = FileOrData(
+                    status,
+                    None,
+                    data_key_name="clientCertificateData",
+                    file_base_path=base_path,
+                    base64_file_content=False,
+                    temp_file_path=self._temp_file_path,
+                ).as_file()
+                self.key_file = FileOrData(
+                    status,
+                    None,
+                    data_key_name="clientKeyData",
+                    file_base_path=base_path,
+                    base64_file_content=False,
+                    temp_file_path=self._temp_file_path,
+                ).as_file()
+            else:
+                logger.error(
+                    "exec: missing token or clientCertificateData field in "
+                    "plugin output"
+                )
+                return None
+            return True
+        except Exception as x:
+            logger.error(str(x))
+
+    def _set_config(self, client_configuration):
+        super()._set_config(client_configuration)
+        if "_exec" not in self.__dict__:
+            return
+
+        exec_config, base_path = self._exec
+
+        def refresh_api_key(client_configuration):
+            status = exec_credential(exec_config, base_path)
+            client_configuration.api_key["authorization"] = "Bearer {}".format(
+                status["token"]
+            )
+
+        client_configuration.refresh_api_key_hook = refresh_api_key
+
+
+def new_client_from_kubeconfig(
+    path: str, context: str = None
+) -> client.ApiClient:
+    """
+    Same as `kubernetes.config.new_client_from_config` but exec plugins
+    only run when their cached credential expired.
+    """
+    kubeconfig = KubeConfigMerger(path)
+    if kubeconfig.config is None:
+        raise ConfigException(
+            "Invalid kube-config file. No configuration found."
+        )
+
+    loader = CachedExecKubeConfigLoader(
+        config_dict=kubeconfig.config,
+        active_context=context,
+        config_base_path=None,
+        config_persister=kubeconfig.save_changes,
+    )
+    configuration = type.__call__(client.Configuration)
+    loader.load_and_set(configuration)
+    api = client.ApiClient(configuration=configuration)
+    if loader.expiry is not None:
+        _expiries[api] = loader.expiry
+    return api
+
+
+def credential_expiry(api: client.ApiClient) -> Optional[datetime]:
+    """
+    When the client certificate `api` was built with expires, if it came
+    from an exec plugin and expires at all.
+    """
+    return _expiries.get(api)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Pytest fixtures running the chaostoolkit-istio activities against the
+in-memory fake API server of `chaosistio.fakeserver`.
+
+Enable them from a `conftest.py`:
+
+    pytest_plugins = ["chaosistio.pytest_plugin"]
+"""
+
+import pytest
+
+from chaosistio import close_k8s_api_clients
+from chaosistio.credentials import clear_credentials
+from chaosistio.fakeserver import FakeApiServer
+from chaosistio.fault.ledger import clear_ledger
+from chaosistio.fault.probes import clear_virtual_services_cache
+from chaosistio.fault.ramp import stop_ramps
+from chaosistio.informer import stop_informers
+from chaosistio.throttle import reset_throttling
+
+__all__ = ["istio_api_server", "istio_api_env"]
+
+
+@pytest.fixture
+def istio_api_server():
+    """
+    A fake API server, empty and running for the duration of the test.
+    """
+    with FakeApiServer() as server:
+        yield server
+
+
+@pytest.fixture
+def istio_api_env(istio_api_server, monkeypatch, tmp_path):
+    """
+    Point the activities at `istio_api_server`, whatever the local
+    Kubernetes configuration, and reset the state they keep across calls
+    once the test is done.
+    """
+    monkeypatch.setenv("KUBECONFIG", str(tmp_path / "kubeconfig"))
+    monkeypatch.setenv("KUBERNETES_HOST", istio_api_server.url)
+    monkeypatch.delenv("CHAOSTOOLKIT_IN_POD", raising=False)
+    yield istio_api_server
+    stop_ramps()
+    stop_informers()
+    close_k8s_api_clients()
+    clear_credentials()
+    clear_virtual_services_cache()
+    clear_ledger()
+    reset_throttling()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side throttling of the calls made to the Kubernetes API.
+
+Every write to a virtual service makes istiod push the new configuration to
+the sidecars, so patching many of them at once causes push storms on large
+meshes. The following configuration keys, shared by all the activities of
+the process, smooth this out:
+
+* `istio_api_write_rate`: maximum number of writes per second, unlimited
+  when not set
+* `istio_api_write_burst`: number of writes allowed at once before the rate
+  applies, defaults to the rate
+* `istio_api_max_throttle_retries`: how many times a call rejected with a
+  `429 Too Many Requests` is retried, 3 by default
+* `istio_fault_coalescing_window`: seconds a fault change waits for other
+  changes to the same virtual service so they are all sent in one write
+"""
+
+import email.utils
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from chaoslib.types import Configuration
+
+__all__ = [
+    "RateLimiter",
+    "configure_throttling",
+    "get_rate_limiter",
+    "reset_throttling",
+    "coalescing_window",
+    "coalesce",
+    "retry_after",
+]
+logger = logging.getLogger("chaostoolkit")
+WRITE_METHODS = frozenset(("POST", "PUT", "PATCH", "DELETE"))
+THROTTLE_KEYS = (
+    "istio_api_write_rate",
+    "istio_api_write_burst",
+    "istio_api_max_throttle_retries",
+)
+MAX_BACKOFF = 30.0
+_limiter_lock = threading.Lock()
+_limiter: Optional["RateLimiter"] = None
+_limiter_settings: Optional[Tuple[Any, ...]] = None
+_batches_lock = threading.Lock()
+_batches: Dict[Hashable, "Batch"] = {}
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the writes to `rate` per second, allowing bursts
+    of `burst` writes.
+
+    The rate adapts to the API server: it is halved whenever a call is
+    rejected with a 429, and every call is held back until the server
+    allows it again, then it recovers by a tenth of `rate` per successful
+    write.
+    """
+
+    def __init__(self, rate: float, burst: int = None, max_retries: int = 3):
+        if rate <= 0:
+            raise ValueError("The write rate must be positive")
+        self.max_rate = rate
+        self.min_rate = rate / 10
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.max_retries = max_retries
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, method: str = "PATCH") -> float:
+        """
+        Take a token for a call and return how many seconds to wait before
+        making it. Reads take no token but still wait while the API server
+        asked us to slow down.
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if method not in WRITE_METHODS:
+                return wait
+
+            elapsed = now - self.updated
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def retry_delay(
+        self, method: str, result: Dict[str, Any], attempt: int
+    ) -> Optional[float]:
+        """
+        Adapt the rate to the outcome of a call and return how long to wait
+        before retrying it, or `None` when it must not be retried.
+        """
+        status = result["status"]
+        if status != 429:
+            if method in WRITE_METHODS and status < 400:
+                with self._lock:
+                    self.rate = min(
+                        self.max_rate, self.rate + self.max_rate / 10
+                    )
+            return None
+
+        delay = retry_after(result.get("headers"))
+        if delay is None:
+            delay = min(0.5 * (2**attempt), MAX_BACKOFF)
+
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        logger.debug(
+            "Kubernetes API throttled us, writes slowed down to "
+            "{:.2f}/s".format(self.rate)
+        )
+
+        if attempt >= self.max_retries:
+            return None
+        return delay
+
+
+def configure_throttling(
+    configuration: Configuration = None,
+) -> Optional[RateLimiter]:
+    """
+    Set up the rate limiter of the process from the configuration, keeping
+    the current one, and the rate it learnt, when its settings did not
+    change or when the configuration has none of the throttling keys, as
+    is the case of internal calls.
+
+    Throttling is disabled when the throttling keys are set but not
+    `istio_api_write_rate`.
+    """
+    global _limiter, _limiter_settings
+    configuration = configuration or {}
+    if not any(k in configuration for k in THROTTLE_KEYS):
+        return _limiter
+
+    settings = (
+        configuration.get("istio_api_write_rate"),
+        configuration.get("istio_api_write_burst"),
+        configuration.get("istio_api_max_throttle_retries", 3),
+    )
+    with _limiter_lock:
+        if settings != _limiter_settings:
+            rate, burst, max_retries = settings
+            _limiter_settings = settings
+            _limiter = None
+            if rate:
+                _limiter = RateLimiter(
+                    float(rate),
+                    int(burst) if burst else None,
+                    int(max_retries),
+                )
+        return _limiter
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    return _limiter
+
+
+def reset_throttling() -> None:
+    """
+    Drop the rate limiter and forget the pending fault changes.
+    """
+    global _limiter, _limiter_settings
+    with _limiter_lock:
+        _limiter = None
+        _limiter_settings = None
+    with _batches_lock:
+        _batches.clear()
+
+
+def coalescing_window(configuration: Configuration = None) -> float:
+    """
+    Seconds set by the `istio_fault_coalescing_window` configuration key,
+    0 when changes are written right away.
+    """
+    return float((configuration or {}).get("istio_fault_coalescing_window", 0))
+
+
+def coalesce(
+    key: Hashable,
+    change: Any,
+    window: float,
+    flush: Callable[[List[Any]], List[Any]],
+) -> Any:
+    """
+    Queue `change` with the other changes made under `key` during `window`
+    seconds and return its own outcome once they are all applied.
+
+    The first caller waits for the window to close then calls `flush` with
+    the queued changes, in their submission order. `flush` returns the
+    outcome of each change. The other callers block until then and an error
+    raised by `flush` is raised to all of them.
+    """
+    with _batches_lock:
+        batch = _batches.get(key)
+        leader = batch is None
+        if leader:
+            batch = _batches[key] = Batch()
+        position = len(batch.changes)
+        batch.changes.append(change)
+
+    if leader:
+        time.sleep(window)
+        with _batches_lock:
+            if _batches.get(key) is batch:
+                del _batches[key]
+        if len(batch.changes) > 1:
+            logger.debug(
+                "Coalesced {} changes into a single write".format(
+                    len(batch.changes)
+                )
+            )
+        try:
+            batch.outcomes = flush(batch.changes)
+        except Exception as x:
+            batch.error = x
+        finally:
+            batch.done.set()
+    else:
+        batch.done.wait()
+
+    if batch.error is not None:
+        raise batch.error
+    return batch.outcomes[position]
+
+
+def retry_after(headers: Optional[Dict[str, str]]) -> Optional[float]:
+    """
+    Seconds to wait according to the `Retry-After` header, given either in
+    seconds or as an HTTP date.
+    """
+    value = None
+    for name, header in (headers or {}).items():
+        if name.lower() == "retry-after":
+            value = header
+            break
+    if not value:
+        return None
+
+    try:
+        return min(max(0.0, float(value)), MAX_BACKOFF)
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, min(when.timestamp() - time.time(), MAX_BACKOFF))
+
+
+###############################################################################
+# Private functions
+###############################################################################
+class Batch:
+    def __init__(self):
+        self.changes: List[Any] = []
+        self.outcomes: List[Any] = []
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+pytest_plugins = ["chaosistio.pytest_plugin"]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from chaosistio.api import decode_list, slim_result
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import set_fault
+from chaosistio.fault.probes import get_virtual_service
+
+LISTING = {
+    "apiVersion": "networking.istio.io/v1",
+    "items": [virtual_service("vs-{}".format(i), routes=3) for i in range(20)],
+    "kind": "VirtualServiceList",
+    "metadata": {"continue": "next", "resourceVersion": "12"},
+}
+
+
+def drain(generator):
+    items = []
+    while True:
+        try:
+            items.append(next(generator))
+        except StopIteration as x:
+            return items, x.value
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+def test_decode_list_yields_items_across_chunks(chunk_size):
+    raw = json.dumps(LISTING).encode("utf-8")
+    chunks = [raw[i : i + chunk_size] for i in range(0, len(raw), chunk_size)]
+
+    items, envelope = drain(decode_list(chunks))
+
+    assert items == LISTING["items"]
+    assert envelope == {
+        "apiVersion": "networking.istio.io/v1",
+        "kind": "VirtualServiceList",
+        "metadata": {"continue": "next", "resourceVersion": "12"},
+    }
+
+
+def test_decode_list_rejects_truncated_lists():
+    raw = json.dumps(LISTING).encode("utf-8")
+    with pytest.raises(ValueError):
+        drain(decode_list([raw[:-10]]))
+
+
+def test_slim_result_keeps_selected_fields():
+    result = {
+        "status": 200,
+        "headers": {"Content-Type": "application/json"},
+        "body": virtual_service(routes=2),
+    }
+    assert slim_result(
+        result, ["metadata.name", "spec.http.1.name", "spec.missing"]
+    ) == {
+        "status": 200,
+        "body": {
+            "metadata": {"name": "reviews"},
+            "spec": {"http": {"1": {"name": "route-1"}}},
+        },
+    }
+
+
+def test_fault_actions_return_selected_fields(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+
+    result = set_fault(
+        "reviews",
+        [{"destination": {"host": "reviews", "subset": "v2"}}],
+        {"abort": {"httpStatus": 503}},
+        patch_strategy="json",
+        fields=["metadata.resourceVersion"],
+    )
+    stored = istio_api_env.get("VirtualService", "reviews")
+    assert result == {
+        "status": 200,
+        "body": {
+            "metadata": {
+                "resourceVersion": stored["metadata"]["resourceVersion"]
+            }
+        },
+        "routes": [2],
+        "changed": True,
+    }
+
+    result = get_virtual_service("reviews", fields=["spec.http.2.fault"])
+    assert result == {
+        "status": 200,
+        "body": {
+            "spec": {"http": {"2": {"fault": {"abort": {"httpStatus": 503}}}}}
+        },
+    }
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import chaosistio
+from chaosistio import (
+    client_in_use,
+    close_k8s_api_clients,
+    create_k8s_api_client,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_clients():
+    close_k8s_api_clients()
+    yield
+    close_k8s_api_clients()
+
+
+@patch("chaosistio.kubeconfig.new_client_from_kubeconfig", autospec=True)
+def test_client_is_reused_for_same_kubeconfig(new_client, tmp_path):
+    kubeconfig = tmp_path / "config"
+    kubeconfig.write_text("")
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        api = create_k8s_api_client(None, {"KUBERNETES_CONTEXT": "ctx"})
+        assert create_k8s_api_client(None, {"KUBERNETES_CONTEXT": "ctx"}) is api
+
+    new_client.assert_called_once_with(str(kubeconfig), context="ctx")
+
+
+@patch("chaosistio.kubeconfig.new_client_from_kubeconfig", autospec=True)
+def test_client_is_rebuilt_when_kubeconfig_changes(new_client, tmp_path):
+    kubeconfig = tmp_path / "config"
+    kubeconfig.write_text("")
+    first, second = MagicMock(), MagicMock()
+    new_client.side_effect = [first, second]
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        assert create_k8s_api_client(None) is first
+        st = os.stat(kubeconfig)
+        os.utime(kubeconfig, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert create_k8s_api_client(None) is second
+
+    first.close.assert_called_once_with()
+    second.close.assert_not_called()
+
+
+@patch("chaosistio.has_local_config_file", autospec=True)
+def test_client_is_rebuilt_when_secrets_change(has_local_config_file):
+    has_local_config_file.return_value = False
+
+    with patch.dict(os.environ, {}, clear=True):
+        api = create_k8s_api_client(None, {"KUBERNETES_API_KEY": "a"})
+        assert create_k8s_api_client(None, {"KUBERNETES_API_KEY": "a"}) is api
+
+        other = create_k8s_api_client(None, {"KUBERNETES_API_KEY": "b"})
+        assert other is not api
+        assert other.configuration.api_key["authorization"] == "b"
+
+
+@patch("chaosistio.kubeconfig.new_client_from_kubeconfig", autospec=True)
+def test_close_k8s_api_clients(new_client, tmp_path):
+    kubeconfig = tmp_path / "config"
+    kubeconfig.write_text("")
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        api = create_k8s_api_client(None)
+        close_k8s_api_clients()
+        api.close.assert_called_once_with()
+
+        create_k8s_api_client(None)
+
+    assert new_client.call_count == 2
+
+
+@patch("chaosistio.kubeconfig.new_client_from_kubeconfig", autospec=True)
+def test_replaced_client_is_closed_once_its_calls_are_done(
+    new_client, tmp_path
+):
+    kubeconfig = tmp_path / "config"
+    kubeconfig.write_text("")
+    first, second = MagicMock(), MagicMock()
+    new_client.side_effect = [first, second]
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        api = create_k8s_api_client(None)
+        with client_in_use(api):
+            st = os.stat(kubeconfig)
+            os.utime(kubeconfig, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            assert create_k8s_api_client(None) is second
+            first.close.assert_not_called()
+
+    first.close.assert_called_once_with()
+
+
+@patch("chaosistio.has_local_config_file", autospec=True)
+def test_clients_of_same_host_with_other_credentials_coexist(
+    has_local_config_file,
+):
+    has_local_config_file.return_value = False
+
+    with patch.dict(os.environ, {"KUBERNETES_HOST": "http://k8s"}, clear=True):
+        a = create_k8s_api_client(None, {"KUBERNETES_API_KEY": "a"})
+        b = create_k8s_api_client(None, {"KUBERNETES_API_KEY": "b"})
+        assert create_k8s_api_client(None, {"KUBERNETES_API_KEY": "a"}) is a
+        assert create_k8s_api_client(None, {"KUBERNETES_API_KEY": "b"}) is b
+
+
+@patch("chaosistio.has_local_config_file", autospec=True)
+def test_slow_client_build_does_not_block_other_clients(
+    has_local_config_file,
+):
+    has_local_config_file.return_value = False
+    building, release = threading.Event(), threading.Event()
+    build = chaosistio.new_k8s_api_client
+
+    def slow_build(settings):
+        if settings.get("api_key") == "slow":
+            building.set()
+            release.wait(5)
+        return build(settings)
+
+    with patch.dict(os.environ, {}, clear=True), patch(
+        "chaosistio.new_k8s_api_client", side_effect=slow_build
+    ):
+        slow = threading.Thread(
+            target=create_k8s_api_client,
+            args=(None, {"KUBERNETES_API_KEY": "slow"}),
+        )
+        slow.start()
+        try:
+            assert building.wait(5)
+            api = create_k8s_api_client(None, {"KUBERNETES_API_KEY": "fast"})
+            assert api.configuration.api_key["authorization"] == "fast"
+            assert slow.is_alive()
+        finally:
+            release.set()
+            slow.join()
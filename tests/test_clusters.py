@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.clusters import cluster_name, cluster_secrets, on_clusters
+from chaosistio.fakeserver import FakeApiServer, virtual_service
+from chaosistio.fault.actions import (
+    add_delay_fault,
+    rollback_all_faults,
+    set_fault,
+    set_tcp_blackhole,
+    unset_tcp_blackhole,
+)
+from chaosistio.fault.probes import get_virtual_service
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.fixture
+def other_api_server():
+    with FakeApiServer() as server:
+        yield server
+
+
+@pytest.fixture
+def clusters(istio_api_env, other_api_server):
+    return [
+        {"name": "eu", "KUBERNETES_HOST": istio_api_env.url},
+        {"name": "us", "KUBERNETES_HOST": other_api_server.url},
+    ]
+
+
+def faults(server):
+    vs = server.get("VirtualService", "reviews")
+    return [route.get("fault") for route in vs["spec"]["http"]]
+
+
+def test_set_fault_on_clusters(istio_api_env, other_api_server, clusters):
+    for server in (istio_api_env, other_api_server):
+        server.add(virtual_service(routes=3))
+
+    result = set_fault("reviews", [V1], FAULT, clusters=clusters)
+    assert result["failed"] == []
+    assert result["rolledBack"] == []
+    assert sorted(result["clusters"]) == ["eu", "us"]
+    assert result["clusters"]["us"]["status"] == 200
+    assert faults(istio_api_env) == [None, FAULT, None]
+    assert faults(other_api_server) == [None, FAULT, None]
+
+    read = get_virtual_service(
+        "reviews", fields=["spec.http.1.fault"], clusters=clusters
+    )
+    for name in ("eu", "us"):
+        assert read["clusters"][name]["body"] == {
+            "spec": {"http": {"1": {"fault": FAULT}}}
+        }
+
+    # each cluster is rolled back on its own
+    result = rollback_all_faults(
+        secrets={"KUBERNETES_HOST": "http://127.0.0.1:1"}
+    )
+    assert result["succeeded"] == 2
+    assert faults(istio_api_env) == [None, None, None]
+    assert faults(other_api_server) == [None, None, None]
+
+
+@pytest.mark.parametrize("policy", ["rollback", "continue"])
+def test_partial_failure(istio_api_env, other_api_server, clusters, policy):
+    istio_api_env.add(virtual_service(routes=3))
+
+    result = add_delay_fault(
+        "reviews",
+        "1s",
+        [V1],
+        clusters=clusters,
+        on_partial_failure=policy,
+    )
+    assert result["failed"] == ["us"]
+    assert "does not exist" in result["clusters"]["us"]["error"]
+
+    if policy == "rollback":
+        assert result["rolledBack"] == ["eu"]
+        assert faults(istio_api_env) == [None, None, None]
+    else:
+        assert result["rolledBack"] == []
+        assert faults(istio_api_env)[1] == {"delay": {"fixedDelay": "1s"}}
+
+
+def test_partial_failure_keeps_earlier_faults(
+    istio_api_env, other_api_server, clusters
+):
+    vs = virtual_service(routes=3)
+    # set outside of the experiment
+    vs["spec"]["http"][2]["fault"] = FAULT
+    istio_api_env.add(vs)
+    v2 = {"destination": {"host": "reviews", "subset": "v2"}}
+    delay = {"delay": {"fixedDelay": "1s"}}
+
+    # an earlier action of the experiment
+    set_fault("reviews", [V1], FAULT, secrets=clusters[0])
+    result = add_delay_fault("reviews", "1s", [V1, v2], clusters=clusters)
+    assert result["failed"] == ["us"]
+    assert result["rolledBack"] == ["eu"]
+    assert faults(istio_api_env) == [None, FAULT, FAULT]
+
+    # only the earlier fault is left to roll back
+    set_fault("reviews", [v2], delay, secrets=clusters[0])
+    result = rollback_all_faults()
+    assert result["succeeded"] == 1
+    assert faults(istio_api_env) == [None, None, FAULT]
+
+
+def test_tcp_blackhole_on_clusters(istio_api_env, other_api_server, clusters):
+    originals = []
+    for server in (istio_api_env, other_api_server):
+        vs = virtual_service(routes=1)
+        vs["spec"]["tcp"] = [{"route": [{"destination": {"host": "redis"}}]}]
+        originals.append(server.add(vs)["spec"]["tcp"])
+    redis = {"destination": {"host": "redis"}}
+
+    set_tcp_blackhole("reviews", [redis], clusters=clusters)
+    result = unset_tcp_blackhole("reviews", clusters=clusters)
+
+    assert result["failed"] == []
+    for server, original in zip((istio_api_env, other_api_server), originals):
+        vs = server.get("VirtualService", "reviews")
+        assert vs["spec"]["tcp"] == original
+
+
+def test_clusters_by_context_name():
+    assert cluster_name("eu-west") == "eu-west"
+    assert cluster_secrets({"KUBERNETES_CONTEXT": "a", "x": 1}, "eu-west") == {
+        "KUBERNETES_CONTEXT": "eu-west",
+        "x": 1,
+    }
+    assert cluster_name({"KUBERNETES_HOST": "https://eu"}) == "https://eu"
+    with pytest.raises(ActivityFailed):
+        cluster_name({"KUBERNETES_API_KEY": "secret"})
+
+
+def test_invalid_clusters():
+    with pytest.raises(ActivityFailed):
+        on_clusters(["a"], None, dict, on_partial_failure="pray")
+    with pytest.raises(ActivityFailed):
+        on_clusters(["a", {"KUBERNETES_CONTEXT": "a"}], None, dict)
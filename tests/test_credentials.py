@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import stat
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+from chaosistio import close_k8s_api_clients, create_k8s_api_client
+from chaosistio.credentials import (
+    clear_credentials,
+    configure_credentials,
+    exec_credential,
+)
+
+PLUGIN = """
+import datetime, json, sys
+
+counter, lifetime = sys.argv[1], float(sys.argv[2])
+with open(counter, "a+") as f:
+    f.seek(0)
+    run = len(f.read()) + 1
+    f.write("x")
+
+expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+    seconds=lifetime
+)
+status = {"expirationTimestamp": expiry.strftime("%Y-%m-%dT%H:%M:%SZ")}
+if len(sys.argv) > 3:
+    status["clientCertificateData"] = "cert-{}".format(run)
+    status["clientKeyData"] = "key-{}".format(run)
+else:
+    status["token"] = "token-{}".format(run)
+print(json.dumps({
+    "apiVersion": "client.authentication.k8s.io/v1beta1",
+    "kind": "ExecCredential",
+    "status": status,
+}))
+"""
+
+
+DEFAULTS = {
+    "istio_exec_credentials_cache_dir": None,
+    "istio_exec_credentials_refresh_margin": None,
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_credentials():
+    clear_credentials()
+    configure_credentials(DEFAULTS)
+    yield
+    close_k8s_api_clients()
+    clear_credentials()
+    configure_credentials(DEFAULTS)
+
+
+@pytest.fixture
+def plugin(tmp_path):
+    script = tmp_path / "plugin.py"
+    script.write_text(PLUGIN)
+    counter = tmp_path / "runs"
+
+    def exec_config(lifetime: float = 900, certificate: bool = False) -> dict:
+        args = [str(script), str(counter), str(lifetime)]
+        if certificate:
+            args.append("certificate")
+        return {
+            "apiVersion": "client.authentication.k8s.io/v1beta1",
+            "command": sys.executable,
+            "args": args,
+        }
+
+    exec_config.runs = lambda: len(counter.read_text())
+    return exec_config
+
+
+def test_credential_is_cached_until_expiry(plugin):
+    exec_config = plugin()
+
+    assert exec_credential(exec_config)["token"] == "token-1"
+    assert exec_credential(exec_config)["token"] == "token-1"
+    assert plugin.runs() == 1
+
+
+def test_expired_credential_runs_plugin_again(plugin):
+    # expires within the skew so it is never considered valid
+    exec_config = plugin(lifetime=5)
+
+    assert exec_credential(exec_config)["token"] == "token-1"
+    assert exec_credential(exec_config)["token"] == "token-2"
+
+
+def test_credential_is_cached_on_disk(plugin, tmp_path):
+    cache_dir = tmp_path / "credentials"
+    configure_credentials({"istio_exec_credentials_cache_dir": str(cache_dir)})
+    exec_config = plugin()
+
+    assert exec_credential(exec_config)["token"] == "token-1"
+    clear_credentials()
+    assert exec_credential(exec_config)["token"] == "token-1"
+    assert plugin.runs() == 1
+
+    (path,) = cache_dir.iterdir()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert json.loads(path.read_text())["token"] == "token-1"
+
+
+def test_settings_are_kept_without_their_keys(plugin, tmp_path):
+    cache_dir = tmp_path / "credentials"
+    configure_credentials({"istio_exec_credentials_cache_dir": str(cache_dir)})
+    # as internal calls do
+    configure_credentials()
+    configure_credentials({"istio_api_write_rate": 10})
+
+    exec_credential(plugin())
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_credential_is_refreshed_before_expiry(plugin):
+    configure_credentials({"istio_exec_credentials_refresh_margin": 60})
+    exec_config = plugin(lifetime=14)
+
+    assert exec_credential(exec_config)["token"] == "token-1"
+
+    deadline = time.monotonic() + 10
+    while plugin.runs() < 2 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    time.sleep(0.2)
+
+    assert exec_credential(exec_config)["token"] == "token-2"
+    assert plugin.runs() == 2
+
+
+def write_kubeconfig(path, exec_config):
+    path.write_text(
+        json.dumps(
+            {
+                "apiVersion": "v1",
+                "kind": "Config",
+                "clusters": [
+                    {"name": "a", "cluster": {"server": "http://a"}},
+                    {"name": "b", "cluster": {"server": "http://b"}},
+                ],
+                "users": [{"name": "me", "user": {"exec": exec_config}}],
+                "contexts": [
+                    {"name": "a", "context": {"cluster": "a", "user": "me"}},
+                    {"name": "b", "context": {"cluster": "b", "user": "me"}},
+                ],
+                "current-context": "a",
+            }
+        )
+    )
+
+
+def test_clients_share_exec_credential(plugin, tmp_path):
+    kubeconfig = tmp_path / "config"
+    write_kubeconfig(kubeconfig, plugin())
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        a = create_k8s_api_client(None, {"KUBERNETES_CONTEXT": "a"})
+        b = create_k8s_api_client(None, {"KUBERNETES_CONTEXT": "b"})
+
+    assert a is not b
+    for api in (a, b):
+        auth = api.configuration.get_api_key_with_prefix("authorization")
+        assert auth == "Bearer token-1"
+    assert plugin.runs() == 1
+
+
+def test_client_is_rebuilt_when_its_certificate_expires(plugin, tmp_path):
+    kubeconfig = tmp_path / "config"
+    # expires within the skew so it is never considered valid
+    write_kubeconfig(kubeconfig, plugin(lifetime=5, certificate=True))
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        first = create_k8s_api_client(None)
+        second = create_k8s_api_client(None)
+
+    assert second is not first
+    assert plugin.runs() == 2
+    with open(second.configuration.cert_file) as f:
+        assert f.read() == "cert-2"
+
+
+def test_client_is_reused_while_its_certificate_is_valid(plugin, tmp_path):
+    kubeconfig = tmp_path / "config"
+    write_kubeconfig(kubeconfig, plugin(certificate=True))
+
+    with patch.dict(os.environ, {"KUBECONFIG": str(kubeconfig)}):
+        api = create_k8s_api_client(None)
+        assert create_k8s_api_client(None) is api
+
+    assert plugin.runs() == 1
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.destination.actions import (
+    limit_connection_pool,
+    set_connection_pool,
+    tighten_outlier_detection,
+    unset_connection_pool,
+    unset_outlier_detection,
+)
+from chaosistio.destination.probes import (
+    get_destination_rule,
+    get_traffic_policy,
+)
+from chaosistio.fakeserver import destination_rule, virtual_service
+from chaosistio.fault.actions import rollback_all_faults, set_fault
+from chaosistio.fault.ledger import clear_ledger, pending_faults
+
+POOL = {"tcp": {"maxConnections": 100}}
+OUTLIERS = {"consecutive5xxErrors": 5, "interval": "10s"}
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_limit_and_restore_connection_pool(istio_api_env, strategy):
+    istio_api_env.add(
+        destination_rule(
+            traffic_policy={"connectionPool": POOL, "loadBalancer": {}}
+        )
+    )
+
+    result = limit_connection_pool(
+        "reviews",
+        max_connections=1,
+        http1_max_pending_requests=1,
+        patch_strategy=strategy,
+        fields=["spec.trafficPolicy.connectionPool"],
+    )
+    assert result["status"] == 200
+    assert result["body"]["spec"]["trafficPolicy"]["connectionPool"] == {
+        "tcp": {"maxConnections": 1},
+        "http": {"http1MaxPendingRequests": 1},
+    }
+
+    # the original settings are put back, the others left alone
+    result = unset_connection_pool("reviews", patch_strategy=strategy)
+    assert result["status"] == 200
+    assert get_traffic_policy("reviews") == {
+        "connectionPool": POOL,
+        "loadBalancer": {},
+    }
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_outlier_detection_of_a_subset(istio_api_env, strategy):
+    istio_api_env.add(destination_rule(subsets=2))
+
+    result = tighten_outlier_detection(
+        "reviews", subset="v1", patch_strategy=strategy
+    )
+    assert result["status"] == 200
+    assert get_traffic_policy("reviews", subset="v1") == {
+        "outlierDetection": {
+            "consecutive5xxErrors": 1,
+            "interval": "1s",
+            "baseEjectionTime": "30s",
+            "maxEjectionPercent": 100,
+        }
+    }
+    assert get_traffic_policy("reviews", subset="v0") == {}
+    assert get_traffic_policy("reviews") == {}
+
+    # settings that did not exist before are removed
+    result = unset_outlier_detection(
+        "reviews", subset="v1", patch_strategy=strategy
+    )
+    assert result["status"] == 200
+    assert get_traffic_policy("reviews", subset="v1") == {}
+
+
+@patch("chaosistio.destination.actions.patch_traffic_policy", autospec=True)
+def test_shortcuts_pass_max_retries(patch_traffic_policy):
+    limit_connection_pool("reviews", max_connections=1, max_retries=7)
+    assert patch_traffic_policy.call_args.kwargs["max_retries"] == 7
+
+    tighten_outlier_detection("reviews", max_retries=0)
+    assert patch_traffic_policy.call_args.kwargs["max_retries"] == 0
+
+
+def test_only_first_change_is_restored(istio_api_env):
+    istio_api_env.add(
+        destination_rule(traffic_policy={"outlierDetection": OUTLIERS})
+    )
+
+    tighten_outlier_detection("reviews")
+    tighten_outlier_detection("reviews", consecutive_5xx_errors=2)
+    unset_outlier_detection("reviews")
+    assert get_traffic_policy("reviews") == {"outlierDetection": OUTLIERS}
+
+    # nothing recorded anymore, the setting is left alone
+    result = unset_outlier_detection("reviews")
+    assert result["status"] == 200
+    assert result["changed"] is False
+    assert get_traffic_policy("reviews") == {"outlierDetection": OUTLIERS}
+
+
+def test_failed_changes_are_not_recorded(istio_api_env):
+    istio_api_env.add(destination_rule())
+
+    with pytest.raises(ActivityFailed):
+        set_connection_pool("reviews", POOL, subset="v9")
+    with pytest.raises(ActivityFailed):
+        set_connection_pool("ratings", POOL)
+    with pytest.raises(ActivityFailed):
+        limit_connection_pool("reviews")
+
+    assert get_destination_rule("ratings")["status"] == 404
+    assert get_destination_rule("reviews", fields=["spec.host"]) == {
+        "status": 200,
+        "body": {"spec": {"host": "reviews"}},
+    }
+
+
+def test_settings_are_rolled_back_with_the_faults(istio_api_env, tmp_path):
+    configuration = {"istio_fault_ledger_path": str(tmp_path / "ledger")}
+    istio_api_env.add(
+        destination_rule(subsets=2, traffic_policy={"connectionPool": POOL})
+    )
+    istio_api_env.add(virtual_service(routes=2))
+
+    limit_connection_pool(
+        "reviews", max_connections=1, configuration=configuration
+    )
+    limit_connection_pool(
+        "reviews", max_connections=1, subset="v1", configuration=configuration
+    )
+    tighten_outlier_detection(
+        "reviews", subset="v1", configuration=configuration
+    )
+    set_fault("reviews", [V1], FAULT, configuration=configuration)
+
+    # as a later process would, with the persisted ledger only
+    clear_ledger()
+    istio_api_env.reset_counters()
+    outcome = rollback_all_faults(configuration)
+
+    assert {o["status"] for o in outcome["results"]} == {"succeeded"}
+    assert get_traffic_policy("reviews") == {"connectionPool": POOL}
+    assert get_traffic_policy("reviews", subset="v1") == {}
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert "fault" not in http[1]
+    assert pending_faults(configuration) == []
+
+
+def test_unset_in_a_fresh_process_keeps_settings(istio_api_env):
+    istio_api_env.add(
+        destination_rule(
+            traffic_policy={
+                "connectionPool": POOL,
+                "outlierDetection": OUTLIERS,
+            }
+        )
+    )
+    istio_api_env.reset_counters()
+
+    for strategy in ("merge", "json"):
+        unset_connection_pool("reviews", patch_strategy=strategy)
+        unset_outlier_detection("reviews", patch_strategy=strategy)
+
+    # only reads, no patch
+    assert istio_api_env.requests == 4
+    assert get_traffic_policy("reviews") == {
+        "connectionPool": POOL,
+        "outlierDetection": OUTLIERS,
+    }
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_unchanged_settings_are_not_patched(istio_api_env, strategy):
+    istio_api_env.add(destination_rule(traffic_policy={"connectionPool": POOL}))
+    istio_api_env.reset_counters()
+
+    result = set_connection_pool("reviews", POOL, patch_strategy=strategy)
+
+    assert result["changed"] is False
+    assert istio_api_env.requests == 1
+    assert pending_faults() == []
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.api import call_api
+from chaosistio.envoy.actions import (
+    add_bandwidth_limit,
+    add_delay_distribution,
+    remove_all_envoy_faults,
+    remove_envoy_fault,
+)
+from chaosistio.envoy.probes import list_envoy_faults
+
+REVIEWS = {"app": "reviews"}
+
+
+def inserted_filters(obj):
+    patches = obj["spec"]["configPatches"]
+    for patch in patches:
+        assert patch["applyTo"] == "HTTP_FILTER"
+        assert patch["patch"]["operation"] == "INSERT_BEFORE"
+    return [p["patch"]["value"] for p in patches]
+
+
+def test_bandwidth_limit(istio_api_env):
+    result = add_bandwidth_limit(
+        "slow-reviews", REVIEWS, limit_kbps=64, percentage=25.5
+    )
+    assert result["status"] == 201
+
+    obj = istio_api_env.get("EnvoyFilter", "slow-reviews")
+    assert obj["metadata"]["labels"] == {
+        "app.kubernetes.io/managed-by": "chaostoolkit-istio"
+    }
+    assert obj["spec"]["workloadSelector"] == {"labels": REVIEWS}
+    assert (
+        obj["spec"]["configPatches"][0]["match"]["context"] == "SIDECAR_INBOUND"
+    )
+    (fault,) = inserted_filters(obj)
+    assert fault["typed_config"]["response_rate_limit"] == {
+        "fixed_limit": {"limit_kbps": 64},
+        "percentage": {"numerator": 255000, "denominator": "MILLION"},
+    }
+
+
+def test_delay_distribution(istio_api_env):
+    add_delay_distribution(
+        "tail-latency",
+        REVIEWS,
+        percentiles={"99": "1.5s", "50": "20ms", "90": 100},
+        context="SIDECAR_OUTBOUND",
+    )
+
+    obj = istio_api_env.get("EnvoyFilter", "tail-latency")
+    sampler, fault = inserted_filters(obj)
+    code = sampler["typed_config"]["default_source_code"]["inline_string"]
+    assert (
+        "local points = {{0.0, 0.0}, {50.0, 20.0}, {90.0, 100.0}, "
+        "{99.0, 1500.0}}"
+    ) in code
+    assert 'replace("x-envoy-fault-delay-request"' in code
+    assert fault["typed_config"]["delay"] == {
+        "header_delay": {},
+        "percentage": {"numerator": 1000000, "denominator": "MILLION"},
+    }
+
+    # replaced in place, header driven this time
+    result = add_delay_distribution("tail-latency", REVIEWS)
+    assert result["status"] == 200
+    obj = istio_api_env.get("EnvoyFilter", "tail-latency")
+    assert [f["name"] for f in inserted_filters(obj)] == ["chaosistio.fault"]
+
+
+@pytest.mark.parametrize(
+    "percentiles",
+    [{"50": "1s", "90": "10ms"}, {"0": "1s"}, {"50": "soon"}, {"x": "1s"}],
+)
+def test_invalid_delay_distribution(istio_api_env, percentiles):
+    with pytest.raises(ActivityFailed):
+        add_delay_distribution("tail-latency", REVIEWS, percentiles)
+    assert list_envoy_faults() == []
+
+
+def test_invalid_envoy_faults(istio_api_env):
+    with pytest.raises(ActivityFailed):
+        add_bandwidth_limit("slow", REVIEWS, limit_kbps=0)
+    with pytest.raises(ActivityFailed):
+        add_bandwidth_limit("slow", REVIEWS, limit_kbps=1, percentage=101)
+    with pytest.raises(ActivityFailed):
+        add_bandwidth_limit("slow", {}, limit_kbps=1)
+    with pytest.raises(ActivityFailed):
+        add_bandwidth_limit("slow", REVIEWS, limit_kbps=1, context="NOWHERE")
+
+
+def test_envoy_faults_are_removed(istio_api_env):
+    add_bandwidth_limit("slow-reviews", REVIEWS, limit_kbps=64)
+    add_delay_distribution("slow-ratings", {"app": "ratings"}, ns="other")
+    istio_api_env.add(
+        {
+            "apiVersion": "networking.istio.io/v1alpha3",
+            "kind": "EnvoyFilter",
+            "metadata": {"name": "not-ours"},
+            "spec": {},
+        }
+    )
+
+    assert sorted(f["name"] for f in list_envoy_faults()) == [
+        "slow-ratings",
+        "slow-reviews",
+    ]
+    assert list_envoy_faults(ns="other") == [
+        {
+            "name": "slow-ratings",
+            "ns": "other",
+            "workloadSelector": {"labels": {"app": "ratings"}},
+        }
+    ]
+
+    assert remove_envoy_fault("slow-reviews")["status"] == 200
+    assert remove_envoy_fault("slow-reviews")["status"] == 404
+
+    result = remove_all_envoy_faults()
+    assert [r["name"] for r in result["removed"]] == ["slow-ratings"]
+    assert list_envoy_faults() == []
+    assert istio_api_env.get("EnvoyFilter", "not-ours") is not None
+
+
+def test_envoy_filter_is_replaced_only_when_ours(istio_api_env):
+    add_bandwidth_limit("slow-reviews", REVIEWS, limit_kbps=64)
+    result = add_bandwidth_limit("slow-reviews", REVIEWS, limit_kbps=32)
+    assert result["status"] == 200
+    (fault,) = inserted_filters(
+        istio_api_env.get("EnvoyFilter", "slow-reviews")
+    )
+    assert fault["typed_config"]["response_rate_limit"]["fixed_limit"] == {
+        "limit_kbps": 32
+    }
+
+    # without any label, as users usually create them
+    user_filter = {
+        "apiVersion": "networking.istio.io/v1alpha3",
+        "kind": "EnvoyFilter",
+        "metadata": {"name": "user-filter"},
+        "spec": {"configPatches": []},
+    }
+    istio_api_env.add(user_filter)
+
+    with pytest.raises(ActivityFailed) as x:
+        add_bandwidth_limit("user-filter", REVIEWS, limit_kbps=64)
+    assert "not managed by chaostoolkit-istio" in str(x.value)
+    obj = istio_api_env.get("EnvoyFilter", "user-filter")
+    assert "labels" not in obj["metadata"]
+    assert obj["spec"] == {"configPatches": []}
+
+
+def test_envoy_filter_is_removed_only_when_ours(istio_api_env):
+    istio_api_env.add(
+        {
+            "apiVersion": "networking.istio.io/v1alpha3",
+            "kind": "EnvoyFilter",
+            "metadata": {"name": "user-filter"},
+            "spec": {"configPatches": []},
+        }
+    )
+
+    with pytest.raises(ActivityFailed) as x:
+        remove_envoy_fault("user-filter")
+    assert "not managed by chaostoolkit-istio" in str(x.value)
+    assert istio_api_env.get("EnvoyFilter", "user-filter") is not None
+    assert "DELETE" not in istio_api_env.requests_by_method
+
+
+def test_envoy_filter_changed_since_checked_is_not_removed(istio_api_env):
+    add_bandwidth_limit("slow-reviews", REVIEWS, limit_kbps=64)
+
+    def concurrent_change(api, url, method, *args, **kwargs):
+        result = call_api(api, url, method, *args, **kwargs)
+        if method == "GET":
+            obj = istio_api_env.get("EnvoyFilter", "slow-reviews")
+            istio_api_env.add(dict(obj, spec={"configPatches": []}))
+        return result
+
+    with mock.patch("chaosistio.envoy.actions.call_api", concurrent_change):
+        with pytest.raises(ActivityFailed) as x:
+            remove_envoy_fault("slow-reviews")
+    assert "Precondition failed" in str(x.value)
+    obj = istio_api_env.get("EnvoyFilter", "slow-reviews")
+    assert obj["spec"] == {"configPatches": []}
+
+    assert remove_envoy_fault("slow-reviews")["status"] == 200
+    assert istio_api_env.get("EnvoyFilter", "slow-reviews") is None
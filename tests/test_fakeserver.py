@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import call_api, virtual_service_url
+from chaosistio.fakeserver import FakeApiServer, ResourcePath, virtual_service
+from chaosistio.fault.actions import (
+    set_fault,
+    start_virtual_service_informer,
+    unset_fault,
+)
+from chaosistio.fault.probes import get_virtual_service, list_virtual_services
+from chaosistio.informer import get_informer
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+def patch(url, content_type, body):
+    api = create_k8s_api_client(None)
+    return call_api(
+        api,
+        url,
+        "PATCH",
+        header_params={
+            "Content-Type": content_type,
+            "Accept": "application/json",
+        },
+        body=body,
+    )
+
+
+def test_set_and_unset_fault_with_both_strategies(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+
+    for strategy in ("merge", "json"):
+        result = set_fault("reviews", [V1], FAULT, patch_strategy=strategy)
+        assert result["status"] == 200
+        http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+        assert [r.get("fault") for r in http] == [None, FAULT, None]
+
+        result = unset_fault("reviews", [V1], patch_strategy=strategy)
+        assert result["status"] == 200
+        http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+        assert [r.get("fault") for r in http] == [None, None, None]
+
+
+def test_objects_are_served_at_every_version(istio_api_env):
+    istio_api_env.add(virtual_service(routes=1))
+
+    result = get_virtual_service("reviews", version="networking.istio.io/v1")
+    assert result["status"] == 200
+    assert result["body"]["apiVersion"] == "networking.istio.io/v1"
+
+    result = get_virtual_service("ratings")
+    assert result["status"] == 404
+
+
+def test_stale_resource_version_is_rejected(istio_api_env):
+    stored = istio_api_env.add(virtual_service(routes=1))
+    stale = stored["metadata"]["resourceVersion"]
+    istio_api_env.add(virtual_service(routes=2))
+    url = virtual_service_url(
+        "networking.istio.io/v1alpha3", "default", "reviews"
+    )
+
+    result = patch(
+        url,
+        "application/merge-patch+json",
+        {"metadata": {"resourceVersion": stale}, "spec": {"hosts": ["a"]}},
+    )
+    assert result["status"] == 409
+    assert result["body"]["reason"] == "Conflict"
+
+    result = patch(
+        url,
+        "application/json-patch+json",
+        [
+            {"op": "test", "path": "/metadata/resourceVersion", "value": stale},
+            {"op": "add", "path": "/spec/hosts/-", "value": "a"},
+        ],
+    )
+    assert result["status"] == 422
+    assert istio_api_env.get("VirtualService", "reviews")["spec"]["hosts"] == [
+        "reviews"
+    ]
+
+
+def test_list_pages_through_selected_objects(istio_api_env):
+    for i in range(5):
+        labels = {"app": "shop"} if i % 2 == 0 else {"app": "other"}
+        istio_api_env.add(virtual_service("vs-{}".format(i), labels=labels))
+    istio_api_env.add(
+        virtual_service("vs-x", ns="other", labels={"app": "shop"})
+    )
+
+    items = list_virtual_services(label_selector="app=shop", limit=2)
+    assert [vs["metadata"]["name"] for vs in items] == ["vs-0", "vs-2", "vs-4"]
+    assert istio_api_env.requests == 2
+
+    items = list_virtual_services(
+        label_selector="app in (shop)", all_namespaces=True, cache_ttl=0
+    )
+    assert len(items) == 4
+
+
+def test_informer_follows_changes(istio_api_env):
+    istio_api_env.add(virtual_service(routes=1))
+    result = start_virtual_service_informer(ns="default")
+    assert result["synced"] is True
+    assert result["count"] == 1
+
+    istio_api_env.add(virtual_service("ratings", routes=1))
+    informer = get_informer("default", "networking.istio.io/v1alpha3")
+    deadline = time.monotonic() + 5
+    while informer.get("default", "ratings") is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_watch_from_compacted_version_expires():
+    server = FakeApiServer(history_size=2)
+    for i in range(5):
+        server.add(virtual_service("vs-{}".format(i)))
+    path = ResourcePath(
+        "/apis/networking.istio.io/v1alpha3/namespaces/default/virtualservices"
+    )
+
+    (event,) = server.watch(path, {"resourceVersion": "1"})
+    assert event["type"] == "ERROR"
+    assert event["object"]["code"] == 410
+
+    events = list(
+        server.watch(path, {"resourceVersion": "3", "timeoutSeconds": "0"})
+    )
+    assert [e["object"]["metadata"]["name"] for e in events] == ["vs-3", "vs-4"]
+    server.httpd.server_close()
+
+
+def test_counters_add_up_across_handler_threads(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+    istio_api_env.reset_counters()
+    url = virtual_service_url("networking.istio.io/v1alpha3", "default")
+
+    def get(_):
+        api = create_k8s_api_client(None)
+        return call_api(api, url, "GET", {"Accept": "application/json"})
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(get, range(200)))
+
+    assert {r["status"] for r in results} == {200}
+    assert istio_api_env.requests == 200
+    assert istio_api_env.requests_by_method == {"GET": 200}
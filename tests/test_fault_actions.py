@@ -3,10 +3,14 @@ import json
 from unittest.mock import ANY, MagicMock, patch
 
 import pytest
+from chaoslib.exceptions import ActivityFailed
+from kubernetes.client.rest import ApiException
 
+from chaosistio.fakeserver import virtual_service
 from chaosistio.fault.actions import (
     add_abort_fault,
     add_delay_fault,
+    merge_patch_faults,
     remove_abort_fault,
     remove_delay_fault,
     set_fault,
@@ -175,51 +179,10 @@ def test_does_not_add_fault_if_no_route_matches(client, get_vs):
     client.return_value.call_api = call_api
 
     res = set_fault("mysvc", routes, fault)
-    call_api.assert_called_with(
-        "/apis/networking.istio.io/v1alpha3/namespaces/default/virtualservices/mysvc",
-        "PATCH",
-        header_params={
-            "Content-Type": "application/merge-patch+json",
-            "Accept": "application/json",
-        },
-        body={
-            "apiVersion": "networking.istio.io/v1alpha3",
-            "kind": "VirtualService",
-            "metadata": {"name": "mysvc"},
-            "spec": {
-                "http": [
-                    {
-                        "route": [
-                            {
-                                "destination": {
-                                    "host": "localhost",
-                                    "subset": "v2",
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "route": [
-                            {
-                                "destination": {
-                                    "host": "localhost",
-                                    "subset": "v1",
-                                }
-                            },
-                            {
-                                "destination": {
-                                    "host": "otherhost",
-                                    "subset": "v1",
-                                }
-                            },
-                        ]
-                    },
-                ]
-            },
-        },
-        auth_settings=["BearerToken"],
-        _preload_content=False,
-    )
+    # nothing to change, nothing is written
+    call_api.assert_not_called()
+    assert res["status"] == 200
+    assert res["changed"] is False
 
 
 @patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
@@ -534,3 +497,219 @@ def test_add_abort_fault(client, get_vs):
         auth_settings=["BearerToken"],
         _preload_content=False,
     )
+
+
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_set_fault_with_json_patch(client, get_vs):
+    fault = {"delay": {"fixedDelay": "5s"}}
+    routes = [{"destination": {"host": "localhost", "subset": "v2"}}]
+
+    get_vs.return_value = {
+        "status": 200,
+        "headers": {},
+        "body": {
+            "metadata": {"resourceVersion": "42"},
+            "spec": {
+                "http": [
+                    {"route": [{"destination": {"host": "localhost"}}]},
+                    {
+                        "route": [
+                            {
+                                "destination": {
+                                    "host": "localhost",
+                                    "subset": "v2",
+                                }
+                            },
+                        ]
+                    },
+                ]
+            },
+        },
+    }
+
+    content = MagicMock()
+    content.read.return_value = '"updated"'
+    call_api = MagicMock()
+    call_api.return_value = (content, 200, {})
+    client.return_value.call_api = call_api
+
+    res = set_fault("mysvc", routes, fault, patch_strategy="json")
+    assert res["status"] == 200
+    call_api.assert_called_once_with(
+        "/apis/networking.istio.io/v1alpha3/namespaces/default/virtualservices/mysvc",
+        "PATCH",
+        header_params={
+            "Content-Type": "application/json-patch+json",
+            "Accept": "application/json",
+        },
+        body=[
+            {
+                "op": "test",
+                "path": "/metadata/resourceVersion",
+                "value": "42",
+            },
+            {"op": "add", "path": "/spec/http/1/fault", "value": fault},
+        ],
+        auth_settings=["BearerToken"],
+        _preload_content=False,
+    )
+
+
+@patch("chaosistio.fault.actions.time.sleep", autospec=True)
+@patch("chaosistio.fault.actions.read_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_unset_fault_with_json_patch_retries_on_conflict(
+    client, get_vs, read_vs, sleep
+):
+    routes = [{"destination": {"host": "localhost", "subset": "v2"}}]
+
+    def vs(resource_version):
+        return {
+            "status": 200,
+            "headers": {},
+            "body": {
+                "metadata": {"resourceVersion": resource_version},
+                "spec": {
+                    "http": [
+                        {
+                            "fault": {"abort": {"httpStatus": 500}},
+                            "route": [
+                                {
+                                    "destination": {
+                                        "host": "localhost",
+                                        "subset": "v2",
+                                    }
+                                },
+                            ],
+                        },
+                        {"route": [{"destination": {"host": "localhost"}}]},
+                    ]
+                },
+            },
+        }
+
+    get_vs.return_value = vs("1")
+    # the retry reads the virtual service again from the API server
+    read_vs.return_value = vs("2")
+
+    conflict = ApiException(status=409, reason="Conflict")
+    content = MagicMock()
+    content.read.return_value = '"updated"'
+    call_api = MagicMock()
+    call_api.side_effect = [conflict, (content, 200, {})]
+    client.return_value.call_api = call_api
+
+    res = unset_fault("mysvc", routes, patch_strategy="json")
+    assert res["status"] == 200
+    assert sleep.call_count == 1
+    assert call_api.call_args.kwargs["body"] == [
+        {"op": "test", "path": "/metadata/resourceVersion", "value": "2"},
+        {"op": "remove", "path": "/spec/http/0/fault"},
+    ]
+
+
+def test_set_fault_rejects_unknown_patch_strategy():
+    with pytest.raises(ActivityFailed):
+        set_fault("mysvc", [], {}, patch_strategy="strategic")
+
+
+def test_merge_patch_only_copies_changed_routes():
+    fault = {"abort": {"httpStatus": 503}}
+    http = [
+        {"name": "a", "fault": {"delay": {"fixedDelay": "1s"}}},
+        {"name": "b"},
+        {"name": "c"},
+    ]
+    original = json.loads(json.dumps(http))
+
+    patch = merge_patch_faults("mysvc", "v1", http, {0: None, 2: fault})
+    spec = patch["spec"]["http"]
+    assert spec == [{"name": "a"}, {"name": "b"}, {"name": "c", "fault": fault}]
+    assert http == original
+    assert spec[1] is http[1]
+    assert spec[0] is not http[0] and spec[2] is not http[2]
+
+
+@patch("chaosistio.fault.actions.time.sleep", autospec=True)
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_json_patch_is_not_retried_when_invalid(client, get_vs, sleep):
+    routes = [{"destination": {"host": "localhost", "subset": "v2"}}]
+    get_vs.return_value = {
+        "status": 200,
+        "headers": {},
+        "body": {
+            "metadata": {"resourceVersion": "1"},
+            "spec": {
+                "http": [
+                    {
+                        "route": [
+                            {
+                                "destination": {
+                                    "host": "localhost",
+                                    "subset": "v2",
+                                }
+                            }
+                        ]
+                    }
+                ]
+            },
+        },
+    }
+    invalid = ApiException(status=422, reason="Invalid")
+    invalid.body = json.dumps(
+        {"kind": "Status", "reason": "Invalid", "message": "bad fault"}
+    )
+    invalid.headers = {"Content-Type": "application/json"}
+    call_api = MagicMock(side_effect=[invalid])
+    client.return_value.call_api = call_api
+
+    res = set_fault("mysvc", routes, {"oops": {}}, patch_strategy="json")
+    assert res["status"] == 422
+    assert call_api.call_count == 1
+    sleep.assert_not_called()
+
+
+def test_stale_resource_version_test_is_retried(istio_api_env):
+    vs = istio_api_env.add(virtual_service(routes=2))
+    stale = dict(vs, metadata=dict(vs["metadata"], resourceVersion="0"))
+
+    with patch(
+        "chaosistio.fault.actions.get_virtual_service", autospec=True
+    ) as get_vs:
+        get_vs.return_value = {"status": 200, "headers": {}, "body": stale}
+        res = set_fault(
+            "reviews",
+            [{"destination": {"host": "reviews", "subset": "v0"}}],
+            {"abort": {"httpStatus": 503}},
+            patch_strategy="json",
+        )
+
+    assert res["status"] == 200
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert http[0]["fault"] == {"abort": {"httpStatus": 503}}
+
+
+def test_merge_patch_does_not_overwrite_a_concurrent_write(istio_api_env):
+    stale = istio_api_env.add(virtual_service(routes=2))
+    # written after the informer, or the caller, read the virtual service
+    concurrent = json.loads(json.dumps(stale))
+    concurrent["spec"]["http"][1]["fault"] = {"abort": {"httpStatus": 500}}
+    istio_api_env.add(concurrent)
+
+    with patch(
+        "chaosistio.fault.actions.get_virtual_service", autospec=True
+    ) as get_vs:
+        get_vs.return_value = {"status": 200, "headers": {}, "body": stale}
+        res = set_fault(
+            "reviews",
+            [{"destination": {"host": "reviews", "subset": "v0"}}],
+            {"abort": {"httpStatus": 503}},
+        )
+
+    assert res["status"] == 200
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert http[0]["fault"] == {"abort": {"httpStatus": 503}}
+    assert http[1]["fault"] == {"abort": {"httpStatus": 500}}
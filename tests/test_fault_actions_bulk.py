@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import MagicMock, patch
+
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.fault.actions import bulk_set_fault, bulk_unset_fault
+from chaosistio.fault.probes import clear_virtual_services_cache
+
+ROUTES = [{"destination": {"host": "localhost", "subset": "v2"}}]
+FAULT = {"abort": {"httpStatus": 500}}
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    clear_virtual_services_cache()
+
+
+@patch("chaosistio.fault.actions.set_fault", autospec=True)
+def test_bulk_set_fault_on_names_across_namespaces(set_fault):
+    set_fault.return_value = {"status": 200, "body": {}, "headers": {}}
+
+    res = bulk_set_fault(
+        ROUTES,
+        FAULT,
+        virtual_service_names=["a", "b"],
+        namespaces=["ns1", "ns2"],
+    )
+
+    assert res["succeeded"] == 4
+    assert res["failed"] == 0
+    assert res["skipped"] == 0
+    assert {(r["ns"], r["name"]) for r in res["results"]} == {
+        ("ns1", "a"),
+        ("ns1", "b"),
+        ("ns2", "a"),
+        ("ns2", "b"),
+    }
+    assert set_fault.call_count == 4
+
+
+@patch("chaosistio.fault.actions.unset_fault", autospec=True)
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+def test_bulk_unset_fault_by_label_selector(client, unset_fault):
+    content = MagicMock()
+    content.stream.return_value = iter(
+        [
+            b'{"items": [{"metadata": {"name": "a"}}, '
+            b'{"metadata": {"name": "b"}}]}'
+        ]
+    )
+    call_api = MagicMock()
+    call_api.return_value = (content, 200, {})
+    client.return_value.call_api = call_api
+
+    def unset(name, routes, ns, **kwargs):
+        if name == "a":
+            return {"status": 200, "body": {}, "headers": {}}
+        raise ActivityFailed("boom")
+
+    unset_fault.side_effect = unset
+
+    res = bulk_unset_fault(ROUTES, label_selector="chaos=yes")
+
+    assert call_api.call_args.kwargs["query_params"] == [
+        ("limit", 500),
+        ("labelSelector", "chaos=yes"),
+    ]
+    assert res["succeeded"] == 1
+    assert res["failed"] == 1
+    failed = [r for r in res["results"] if r["status"] == "failed"]
+    assert failed == [
+        {"ns": "default", "name": "b", "status": "failed", "error": "boom"}
+    ]
+
+
+@patch("chaosistio.fault.actions.set_fault", autospec=True)
+def test_bulk_set_fault_stops_when_error_rate_is_exceeded(set_fault):
+    set_fault.return_value = {"status": 500, "body": "oops", "headers": {}}
+
+    res = bulk_set_fault(
+        ROUTES,
+        FAULT,
+        virtual_service_names=[str(i) for i in range(20)],
+        max_workers=1,
+        max_error_rate=0.1,
+    )
+
+    assert res["failed"] == 3
+    assert res["skipped"] == 17
+    assert res["succeeded"] == 0
+
+
+def test_bulk_set_fault_needs_targets():
+    with pytest.raises(ActivityFailed):
+        bulk_set_fault(ROUTES, FAULT)
+
+
+@patch("chaosistio.fault.actions.unset_fault", autospec=True)
+def test_bulk_unset_fault_passes_max_retries(unset_fault):
+    unset_fault.return_value = {"status": 200, "body": {}, "headers": {}}
+
+    bulk_unset_fault(ROUTES, virtual_service_names=["a"], max_retries=7)
+
+    assert unset_fault.call_args.kwargs["max_retries"] == 7
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import bulk_set_fault, set_fault, unset_fault
+from chaosistio.fault.diff import structural_diff
+from chaosistio.fault.ledger import pending_faults
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+@pytest.mark.parametrize("mode", ["client", "server"])
+def test_set_fault_dry_run(istio_api_env, mode, strategy):
+    istio_api_env.add(virtual_service(routes=3))
+    before = istio_api_env.get("VirtualService", "reviews")
+    pending = pending_faults()
+    istio_api_env.reset_counters()
+
+    result = set_fault(
+        "reviews", [V1], FAULT, patch_strategy=strategy, dry_run=mode
+    )
+
+    assert result["status"] == 200
+    assert result["dryRun"] == mode
+    assert result["changed"] is True
+    assert result["routes"] == [1]
+    assert result["patchBytes"] > 0
+    assert result["diff"] == [
+        {"op": "add", "path": "/spec/http/1/fault", "value": FAULT}
+    ]
+
+    assert istio_api_env.get("VirtualService", "reviews") == before
+    assert pending_faults() == pending
+    # a GET, and the dry run PATCH when done by the API server
+    assert istio_api_env.requests == (1 if mode == "client" else 2)
+
+
+def test_merge_patch_is_larger_than_json_patch(istio_api_env):
+    istio_api_env.add(virtual_service(routes=50))
+
+    merge = set_fault("reviews", [V1], FAULT, dry_run="client")
+    json = set_fault(
+        "reviews", [V1], FAULT, patch_strategy="json", dry_run="client"
+    )
+    assert merge["diff"] == json["diff"]
+    assert merge["patchBytes"] > 10 * json["patchBytes"]
+
+
+def test_unset_fault_dry_run_without_change(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+
+    result = unset_fault("reviews", [V1], dry_run="client")
+    assert result["changed"] is False
+    assert result["diff"] == []
+
+
+def test_dry_run_reports_api_errors(istio_api_env):
+    with pytest.raises(ActivityFailed):
+        set_fault("missing", [V1], FAULT, dry_run="server")
+
+
+def test_unknown_dry_run_mode():
+    with pytest.raises(ActivityFailed):
+        set_fault("reviews", [V1], FAULT, dry_run="maybe")
+
+
+def test_bulk_set_fault_dry_run(istio_api_env):
+    for name in ("reviews", "ratings", "details"):
+        istio_api_env.add(virtual_service(name=name, labels={"team": "a"}))
+    before = istio_api_env.get("VirtualService", "ratings")
+
+    result = bulk_set_fault(
+        [{"destination": {"host": "ratings", "subset": "v2"}}],
+        FAULT,
+        label_selector="team=a",
+        dry_run="server",
+    )
+
+    assert result["succeeded"] == 3
+    outcomes = {r["name"]: r for r in result["results"]}
+    assert outcomes["ratings"]["changed"] is True
+    assert outcomes["ratings"]["diff"][0]["path"] == "/spec/http/2/fault"
+    assert outcomes["reviews"]["changed"] is False
+    assert outcomes["details"]["diff"] == []
+    assert istio_api_env.get("VirtualService", "ratings") == before
+
+
+def test_structural_diff():
+    before = {"a": {"b": [1, 2, 3], "c/d": 1}, "e": "x"}
+    after = {"a": {"b": [1, 5], "c/d": 1, "f": True}}
+
+    assert structural_diff(before, after) == [
+        {"op": "remove", "path": "/e", "previous": "x"},
+        {"op": "replace", "path": "/a/b/1", "value": 5, "previous": 2},
+        {"op": "remove", "path": "/a/b/2", "previous": 3},
+        {"op": "add", "path": "/a/f", "value": True},
+    ]
+    assert structural_diff(before, before) == []
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import set_fault, set_faults, unset_fault
+
+V1 = [{"destination": {"host": "reviews", "subset": "v1"}}]
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_identical_fault_is_not_written_again(istio_api_env, strategy):
+    istio_api_env.add(virtual_service(routes=3))
+
+    result = set_fault("reviews", V1, FAULT, patch_strategy=strategy)
+    assert result["changed"] is True
+    written = istio_api_env.get("VirtualService", "reviews")
+
+    istio_api_env.reset_counters()
+    result = set_fault(
+        "reviews",
+        V1,
+        dict(FAULT),
+        patch_strategy=strategy,
+        fields=["metadata.resourceVersion"],
+    )
+    assert result == {
+        "status": 200,
+        "body": {"metadata": {"resourceVersion": "2"}},
+        "routes": [1],
+        "changed": False,
+    }
+    assert istio_api_env.requests == 1
+    assert istio_api_env.get("VirtualService", "reviews") == written
+
+    # only one of the routes already has it
+    result = set_faults(
+        "reviews",
+        [{"routes": V1 + [{"name": "route-2"}], "fault": FAULT}],
+    )
+    assert result["changed"] is True
+
+
+def test_nothing_to_remove_is_not_written(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+    istio_api_env.reset_counters()
+
+    assert unset_fault("reviews", V1)["changed"] is False
+    assert unset_fault("reviews", [{"name": "nope"}])["changed"] is False
+    assert istio_api_env.requests == 2
+    assert (
+        istio_api_env.get("VirtualService", "reviews")["metadata"][
+            "resourceVersion"
+        ]
+        == "1"
+    )
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import set_faults, unset_faults
+
+DELAY = {"delay": {"fixedDelay": "2s", "percentage": {"value": 100.0}}}
+ABORT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+FAULTS = [
+    {
+        "routes": [{"destination": {"host": "reviews", "subset": "v2"}}],
+        "fault": DELAY,
+    },
+    {
+        "routes": [
+            {"destination": {"host": "reviews", "subset": "v0"}},
+            {"name": "route-4"},
+        ],
+        "fault": ABORT,
+    },
+]
+
+
+def faults(server):
+    vs = server.get("VirtualService", "reviews")
+    return [route.get("fault") for route in vs["spec"]["http"]]
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_set_faults_in_a_single_write(istio_api_env, strategy):
+    istio_api_env.add(virtual_service(routes=5))
+    istio_api_env.reset_counters()
+
+    result = set_faults(
+        "reviews",
+        FAULTS,
+        patch_strategy=strategy,
+        fields=["metadata.resourceVersion"],
+    )
+    assert result["routes"] == [0, 2, 4]
+    assert faults(istio_api_env) == [ABORT, None, DELAY, None, ABORT]
+    # one GET and one PATCH
+    assert istio_api_env.requests == 2
+
+    istio_api_env.reset_counters()
+    unset_faults("reviews", FAULTS, patch_strategy=strategy)
+    assert faults(istio_api_env) == [None] * 5
+    assert istio_api_env.requests == 2
+
+
+def test_last_fault_wins(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+
+    set_faults(
+        "reviews",
+        [
+            {"routes": [{"name": "route-1"}], "fault": DELAY},
+            {"routes": [{"match": {"uri": {"prefix": "/r1"}}}], "fault": ABORT},
+        ],
+    )
+    assert faults(istio_api_env) == [None, ABORT, None]
+
+
+@pytest.mark.parametrize(
+    "items",
+    [[], [{"fault": DELAY}], [{"routes": [{"name": "route-1"}]}]],
+)
+def test_set_faults_rejects_incomplete_faults(istio_api_env, items):
+    with pytest.raises(ActivityFailed):
+        set_faults("reviews", items)
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import (
+    add_grpc_abort_fault,
+    remove_abort_fault,
+    rollback_all_faults,
+    set_fault,
+    set_tcp_blackhole,
+    unset_tcp_blackhole,
+)
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+MONGO = {"destination": {"host": "mongo"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+def with_tcp_routes(vs):
+    vs["spec"]["tcp"] = [
+        {
+            "match": [{"port": 27017}],
+            "route": [
+                {"destination": {"host": "mongo"}, "weight": 80},
+                {"destination": {"host": "mongo-replica"}, "weight": 20},
+            ],
+        },
+        {
+            "match": [{"port": 6379}],
+            "route": [{"destination": {"host": "redis"}}],
+        },
+    ]
+    return vs
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_grpc_abort_fault(istio_api_env, strategy):
+    istio_api_env.add(virtual_service(routes=2))
+
+    result = add_grpc_abort_fault(
+        "reviews", "UNAVAILABLE", [V1], percentage=10.0, patch_strategy=strategy
+    )
+    assert result["status"] == 200
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert http[1]["fault"] == {
+        "abort": {"grpcStatus": "UNAVAILABLE", "percentage": {"value": 10.0}}
+    }
+
+    remove_abort_fault("reviews", [V1], patch_strategy=strategy)
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert "fault" not in http[1]
+
+
+def test_grpc_abort_fault_rejects_unknown_status():
+    with pytest.raises(ActivityFailed):
+        add_grpc_abort_fault("reviews", "OOPS", [V1])
+
+
+@pytest.mark.parametrize("strategy", ["merge", "json"])
+def test_tcp_blackhole(istio_api_env, strategy):
+    istio_api_env.add(with_tcp_routes(virtual_service(routes=2)))
+
+    result = set_tcp_blackhole(
+        "reviews", [MONGO], patch_strategy=strategy, fields=["spec.tcp"]
+    )
+    assert result["status"] == 200
+    assert result["routes"] == [0]
+    tcp = istio_api_env.get("VirtualService", "reviews")["spec"]["tcp"]
+    assert tcp[0]["route"] == [
+        {
+            "destination": {"host": "mongo", "subset": "chaos-blackhole"},
+            "weight": 80,
+        },
+        {
+            "destination": {
+                "host": "mongo-replica",
+                "subset": "chaos-blackhole",
+            },
+            "weight": 20,
+        },
+    ]
+    assert tcp[1]["route"] == [{"destination": {"host": "redis"}}]
+
+    unset_tcp_blackhole("reviews")
+    vs = istio_api_env.get("VirtualService", "reviews")
+    assert (
+        vs["spec"]["tcp"] == with_tcp_routes(virtual_service())["spec"]["tcp"]
+    )
+
+    with pytest.raises(ActivityFailed):
+        unset_tcp_blackhole("reviews")
+
+
+def test_rollback_restores_http_and_tcp_routes(istio_api_env):
+    original = istio_api_env.add(with_tcp_routes(virtual_service(routes=2)))
+
+    set_fault("reviews", [V1], FAULT)
+    set_tcp_blackhole("reviews", [{"destination": {"host": "redis"}}])
+    result = rollback_all_faults()
+    assert result["succeeded"] == 1
+
+    vs = istio_api_env.get("VirtualService", "reviews")
+    assert vs["spec"] == original["spec"]
+
+
+def test_rollback_restores_tcp_routes_without_match(istio_api_env):
+    vs = virtual_service(routes=1)
+    vs["spec"]["tcp"] = [
+        {"route": [{"destination": {"host": "mongo"}}]},
+        {"route": [{"destination": {"host": "redis"}}]},
+    ]
+    istio_api_env.add(vs)
+    redis = {"destination": {"host": "redis"}}
+
+    set_tcp_blackhole("reviews", [MONGO, redis])
+    rollback_all_faults()
+
+    tcp = istio_api_env.get("VirtualService", "reviews")["spec"]["tcp"]
+    assert tcp == vs["spec"]["tcp"]
@@ -187,51 +187,10 @@ def test_does_not_add_fault_if_no_route_matches(client, get_vs):
         ns="default",
         version="networking.istio.io/v1beta1",
     )
-    call_api.assert_called_with(
-        "/apis/networking.istio.io/v1beta1/namespaces/default/virtualservices/mysvc",
-        "PATCH",
-        header_params={
-            "Content-Type": "application/merge-patch+json",
-            "Accept": "application/json",
-        },
-        body={
-            "apiVersion": "networking.istio.io/v1beta1",
-            "kind": "VirtualService",
-            "metadata": {"name": "mysvc"},
-            "spec": {
-                "http": [
-                    {
-                        "route": [
-                            {
-                                "destination": {
-                                    "host": "localhost",
-                                    "subset": "v2",
-                                }
-                            }
-                        ]
-                    },
-                    {
-                        "route": [
-                            {
-                                "destination": {
-                                    "host": "localhost",
-                                    "subset": "v1",
-                                }
-                            },
-                            {
-                                "destination": {
-                                    "host": "otherhost",
-                                    "subset": "v1",
-                                }
-                            },
-                        ]
-                    },
-                ]
-            },
-        },
-        auth_settings=["BearerToken"],
-        _preload_content=False,
-    )
+    # nothing to change, nothing is written
+    call_api.assert_not_called()
+    assert res["status"] == 200
+    assert res["changed"] is False
 
 
 @patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
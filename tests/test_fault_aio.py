@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import threading
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+pytest.importorskip("kubernetes_asyncio")
+
+from chaosistio.aio import (  # noqa: E402
+    async_call_api,
+    configure_concurrency,
+    create_async_k8s_api_client,
+)
+from chaosistio.fakeserver import virtual_service  # noqa: E402
+from chaosistio.fault.aio import (  # noqa: E402
+    add_abort_fault,
+    get_virtual_service,
+    set_fault,
+    unset_fault,
+)
+
+VS = {
+    "metadata": {"resourceVersion": "3"},
+    "spec": {
+        "http": [
+            {
+                "fault": {"abort": {"httpStatus": 500}},
+                "route": [
+                    {"destination": {"host": "localhost", "subset": "v2"}}
+                ],
+            },
+            {"route": [{"destination": {"host": "localhost"}}]},
+        ]
+    },
+}
+ROUTES = [{"destination": {"host": "localhost", "subset": "v2"}}]
+
+
+def response(body, status=200):
+    r = MagicMock()
+    r.status = status
+    r.headers = {"Content-Type": "application/json"}
+    r.read = AsyncMock(return_value=json.dumps(body).encode("utf-8"))
+    return r
+
+
+@patch("chaosistio.fault.aio.create_async_k8s_api_client")
+def test_get_virtual_service(client):
+    call_api = AsyncMock(return_value=response(VS))
+    client.return_value = MagicMock(call_api=call_api)
+
+    res = asyncio.run(get_virtual_service("mysvc"))
+    assert res == {
+        "status": 200,
+        "body": VS,
+        "headers": {"Content-Type": "application/json"},
+    }
+    call_api.assert_awaited_once_with(
+        "/apis/networking.istio.io/v1alpha3/namespaces/default/virtualservices/mysvc",
+        "GET",
+        header_params={"Accept": "application/json"},
+        auth_settings=["BearerToken"],
+        _preload_content=False,
+    )
+
+
+@patch("chaosistio.fault.aio.create_async_k8s_api_client")
+def test_add_abort_fault_many_concurrently(client):
+    call_api = AsyncMock(side_effect=lambda *a, **kw: response(VS))
+    client.return_value = MagicMock(call_api=call_api)
+
+    async def run():
+        return await asyncio.gather(
+            *[
+                add_abort_fault("svc{}".format(i), 503, ROUTES, percentage=50)
+                for i in range(50)
+            ]
+        )
+
+    results = asyncio.run(run())
+    assert all(r["status"] == 200 for r in results)
+    assert call_api.await_count == 100
+
+    patch_call = call_api.await_args_list[-1]
+    assert patch_call.args[1] == "PATCH"
+    http = patch_call.kwargs["body"]["spec"]["http"]
+    assert http[0]["fault"] == {
+        "abort": {"httpStatus": 503, "percentage": {"value": 50}}
+    }
+    assert "fault" not in http[1]
+
+
+@patch("chaosistio.fault.aio.create_async_k8s_api_client")
+def test_unset_fault_with_json_patch(client):
+    call_api = AsyncMock(side_effect=[response(VS), response(VS)])
+    client.return_value = MagicMock(call_api=call_api)
+
+    res = asyncio.run(unset_fault("mysvc", ROUTES, patch_strategy="json"))
+    assert res["status"] == 200
+    assert call_api.await_args.kwargs["body"] == [
+        {"op": "test", "path": "/metadata/resourceVersion", "value": "3"},
+        {"op": "remove", "path": "/spec/http/0/fault"},
+    ]
+
+
+@patch("chaosistio.fault.aio.asyncio.sleep", new_callable=AsyncMock)
+@patch("chaosistio.fault.aio.create_async_k8s_api_client")
+def test_json_patch_is_retried_on_conflict(client, sleep):
+    call_api = AsyncMock(
+        side_effect=[
+            response(VS),
+            response({"message": "conflict"}, status=409),
+            response(VS),
+            response(VS),
+        ]
+    )
+    client.return_value = MagicMock(call_api=call_api)
+
+    res = asyncio.run(unset_fault("mysvc", ROUTES, patch_strategy="json"))
+    assert res["status"] == 200
+    assert call_api.await_count == 4
+    sleep.assert_awaited_once()
+
+
+@patch("chaosistio.fault.aio.written")
+@patch("chaosistio.fault.aio.create_async_k8s_api_client")
+def test_ledger_is_written_off_the_event_loop(client, written):
+    call_api = AsyncMock(side_effect=[response(VS), response(VS)])
+    client.return_value = MagicMock(call_api=call_api)
+    threads = []
+    written.side_effect = lambda *a, **kw: threads.append(
+        threading.current_thread()
+    )
+
+    asyncio.run(unset_fault("mysvc", ROUTES))
+    assert len(threads) == 1
+    assert threads[0] is not threading.current_thread()
+
+
+def test_clients_are_closed_when_the_loop_shuts_down(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+
+    async def run():
+        api = await create_async_k8s_api_client(None)
+        assert await create_async_k8s_api_client(None) is api
+        res = await get_virtual_service("reviews")
+        assert res["status"] == 200
+        return api
+
+    clients = [asyncio.run(run()) for _ in range(4)]
+    assert len(set(map(id, clients))) == 4
+    assert all(api.rest_client.pool_manager.closed for api in clients)
+
+
+def test_calls_in_flight_are_bounded():
+    in_flight, peak = 0, 0
+
+    async def call_api(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return response({})
+
+    async def run():
+        configure_concurrency({"istio_async_max_concurrency": 3})
+        api = MagicMock(call_api=call_api)
+        await asyncio.gather(
+            *[async_call_api(api, "/", "GET", {}) for _ in range(20)]
+        )
+
+    try:
+        asyncio.run(run())
+    finally:
+        configure_concurrency({"istio_async_max_concurrency": 100})
+    assert peak == 3
+
+
+def test_set_fault_without_http_routes(istio_api_env):
+    vs = virtual_service(routes=0)
+    del vs["spec"]["http"]
+    istio_api_env.add(vs)
+
+    res = asyncio.run(
+        set_fault("reviews", ROUTES, {"abort": {"httpStatus": 503}})
+    )
+    assert res["status"] == 200
+    assert res["changed"] is False
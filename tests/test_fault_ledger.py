@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from chaosistio.fault.actions import rollback_all_faults, set_fault
+from chaosistio.fault.ledger import (
+    clear_ledger,
+    pending_faults,
+    record_faults,
+)
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+V2 = {"destination": {"host": "reviews", "subset": "v2"}}
+
+
+@pytest.fixture(autouse=True)
+def empty_ledger():
+    clear_ledger()
+    yield
+    clear_ledger()
+
+
+def virtual_service(resource_version, http):
+    return {
+        "status": 200,
+        "headers": {},
+        "body": {
+            "metadata": {
+                "name": "reviews",
+                "resourceVersion": resource_version,
+            },
+            "spec": {"http": http},
+        },
+    }
+
+
+def patched():
+    content = MagicMock()
+    content.read.return_value = '"updated"'
+    return (content, 200, {})
+
+
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_rollback_restores_previous_faults_in_one_write(client, get_vs):
+    existing = {"delay": {"fixedDelay": "1s"}}
+    injected = {"abort": {"httpStatus": 500}}
+    call_api = MagicMock(side_effect=lambda *a, **kw: patched())
+    client.return_value.call_api = call_api
+
+    get_vs.return_value = virtual_service(
+        "1", [{"route": [V1]}, {"route": [V2], "fault": existing}]
+    )
+    set_fault("reviews", [V1, V2], injected)
+
+    # a second fault does not overwrite what was recorded first
+    get_vs.return_value = virtual_service(
+        "2",
+        [
+            {"route": [V1], "fault": injected},
+            {"route": [V2], "fault": injected},
+        ],
+    )
+    set_fault("reviews", [V1], {"abort": {"httpStatus": 503}})
+
+    (entry,) = pending_faults()
+    assert [r["fault"] for r in entry["routes"].values()] == [None, existing]
+
+    # a route was inserted in front of the ones we changed
+    get_vs.return_value = virtual_service(
+        "3",
+        [
+            {"route": [{"destination": {"host": "ratings"}}]},
+            {"route": [V1], "fault": {"abort": {"httpStatus": 503}}},
+            {"route": [V2], "fault": injected},
+        ],
+    )
+    call_api.reset_mock()
+    res = rollback_all_faults()
+
+    assert res["succeeded"] == 1
+    call_api.assert_called_once()
+    assert call_api.call_args.kwargs["body"] == [
+        {"op": "test", "path": "/metadata/resourceVersion", "value": "3"},
+        {"op": "remove", "path": "/spec/http/1/fault"},
+        {"op": "add", "path": "/spec/http/2/fault", "value": existing},
+    ]
+    assert pending_faults() == []
+
+
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_rollback_restores_routes_only_differing_by_fault(client, get_vs):
+    existing = {"delay": {"fixedDelay": "1s"}}
+    injected = {"abort": {"httpStatus": 500}}
+    call_api = MagicMock(side_effect=lambda *a, **kw: patched())
+    client.return_value.call_api = call_api
+
+    get_vs.return_value = virtual_service(
+        "1", [{"route": [V1]}, {"route": [V1], "fault": existing}]
+    )
+    set_fault("reviews", [V1], injected)
+
+    (entry,) = pending_faults()
+    assert [r["fault"] for r in entry["routes"].values()] == [None, existing]
+
+    get_vs.return_value = virtual_service(
+        "2",
+        [
+            {"route": [V1], "fault": injected},
+            {"route": [V1], "fault": injected},
+        ],
+    )
+    call_api.reset_mock()
+    rollback_all_faults()
+
+    assert call_api.call_args.kwargs["body"] == [
+        {"op": "test", "path": "/metadata/resourceVersion", "value": "2"},
+        {"op": "remove", "path": "/spec/http/0/fault"},
+        {"op": "add", "path": "/spec/http/1/fault", "value": existing},
+    ]
+
+
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_ledger_is_persisted_to_a_file(client, get_vs, tmp_path):
+    path = tmp_path / "ledger.json"
+    configuration = {"istio_fault_ledger_path": str(path)}
+    client.return_value.call_api = MagicMock(
+        side_effect=lambda *a, **kw: patched()
+    )
+    get_vs.return_value = virtual_service("1", [{"route": [V1]}])
+
+    set_fault("reviews", [V1], {"abort": {"httpStatus": 500}}, ns="bookinfo")
+
+    assert pending_faults() != []
+    assert not path.exists()
+
+    clear_ledger()
+    set_fault(
+        "reviews",
+        [V1],
+        {"abort": {"httpStatus": 500}},
+        ns="bookinfo",
+        configuration=configuration,
+    )
+    clear_ledger()
+
+    (entry,) = json.loads(path.read_text())
+    assert entry["ns"] == "bookinfo"
+    assert pending_faults(configuration) == [entry]
+
+
+@patch("chaosistio.fault.actions.restore_faults", autospec=True)
+def test_rollback_restores_every_entry_of_a_virtual_service(restore):
+    restore.return_value = {"status": 200, "body": {}}
+    for version in ("networking.istio.io/v1alpha3", "networking.istio.io/v1"):
+        record_faults(
+            "reviews",
+            "default",
+            version,
+            virtual_service("1", [{"route": [V1]}])["body"],
+            [0],
+        )
+
+    result = rollback_all_faults()
+
+    assert result["succeeded"] == 2
+    versions = sorted(r["version"] for r in result["results"])
+    assert versions == [
+        "networking.istio.io/v1",
+        "networking.istio.io/v1alpha3",
+    ]
+    assert restore.call_count == 2
+    assert pending_faults() == []
@@ -1,10 +1,27 @@
 # -*- coding: utf-8 -*-
 import json
+import time
 from unittest.mock import ANY, MagicMock, patch
 
 import pytest
+from chaoslib.exceptions import ActivityFailed
+from kubernetes.client.rest import ApiException
 
-from chaosistio.fault.probes import get_virtual_service
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import add_abort_fault
+from chaosistio.fault import probes
+from chaosistio.fault.probes import (
+    clear_virtual_services_cache,
+    get_virtual_service,
+    iter_virtual_services,
+    list_virtual_services,
+    wait_for_fault_propagation,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    clear_virtual_services_cache()
 
 
 @patch("chaosistio.fault.probes.get_virtual_service", autospec=True)
@@ -24,3 +41,238 @@ def test_get_virtual_service(client, get_vs):
         auth_settings=["BearerToken"],
         _preload_content=False,
     )
+
+
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+def test_list_virtual_services_follows_pages(client):
+    first, second = MagicMock(), MagicMock()
+    first.stream.return_value = iter(
+        [
+            json.dumps(
+                {
+                    "metadata": {"continue": "next"},
+                    "items": [{"metadata": {"name": "a"}}],
+                }
+            ).encode("utf-8")
+        ]
+    )
+    second.stream.return_value = iter(
+        [
+            json.dumps(
+                {"metadata": {}, "items": [{"metadata": {"name": "b"}}]}
+            ).encode("utf-8")
+        ]
+    )
+    call_api = MagicMock()
+    call_api.side_effect = [(first, 200, {}), (second, 200, {})]
+    client.return_value.call_api = call_api
+
+    res = list_virtual_services(
+        label_selector="app=reviews", all_namespaces=True, limit=1
+    )
+    assert [vs["metadata"]["name"] for vs in res] == ["a", "b"]
+    call_api.assert_called_with(
+        "/apis/networking.istio.io/v1alpha3/virtualservices",
+        "GET",
+        header_params={"Accept": "application/json"},
+        query_params=[
+            ("limit", 1),
+            ("labelSelector", "app=reviews"),
+            ("continue", "next"),
+        ],
+        auth_settings=["BearerToken"],
+        _preload_content=False,
+    )
+
+    # served from the cache
+    assert (
+        list_virtual_services(
+            label_selector="app=reviews", all_namespaces=True, limit=1
+        )
+        == res
+    )
+    assert call_api.call_count == 2
+
+
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+def test_list_virtual_services_without_cache(client):
+    content = MagicMock()
+    content.stream.side_effect = lambda *args, **kwargs: iter(
+        [b'{"items": []}']
+    )
+    call_api = MagicMock()
+    call_api.return_value = (content, 200, {})
+    client.return_value.call_api = call_api
+
+    assert list_virtual_services(ns="bookinfo", cache_ttl=0) == []
+    assert list_virtual_services(ns="bookinfo", cache_ttl=0) == []
+    assert call_api.call_count == 2
+    assert call_api.call_args.args[0] == (
+        "/apis/networking.istio.io/v1alpha3/namespaces/bookinfo/virtualservices"
+    )
+
+
+def propagation_api(reports):
+    """
+    Fake API listing two istiod pods, each answering its distribution
+    reports in turn and repeating the last one.
+    """
+    rounds = {"istiod-a": list(reports[0]), "istiod-b": list(reports[1])}
+    vs = MagicMock()
+    vs.read.return_value = json.dumps(
+        {"metadata": {"name": "mysvc", "resourceVersion": "12"}}
+    )
+    pods = MagicMock()
+    pods.stream.return_value = iter(
+        [
+            json.dumps(
+                {
+                    "metadata": {},
+                    "items": [
+                        {
+                            "metadata": {"name": name},
+                            "status": {"phase": phase},
+                        }
+                        for (name, phase) in (
+                            ("istiod-a", "Running"),
+                            ("istiod-b", "Running"),
+                            ("istiod-c", "Pending"),
+                        )
+                    ],
+                }
+            ).encode("utf-8")
+        ]
+    )
+
+    def call_api(url, method, **kwargs):
+        if url.endswith("/virtualservices/mysvc"):
+            return vs, 200, {}
+        if url == "/api/v1/namespaces/istio-system/pods":
+            return pods, 200, {}
+
+        pod = url.split("/")[6].split(":")[0]
+        assert kwargs["query_params"] == [
+            ("resource", "VirtualService/default/mysvc")
+        ]
+        assert kwargs["_request_timeout"] == 5.0
+        report = rounds[pod][0]
+        if len(rounds[pod]) > 1:
+            rounds[pod].pop(0)
+        if isinstance(report, Exception):
+            raise report
+        content = MagicMock()
+        content.read.return_value = json.dumps(report)
+        return content, 200, {}
+
+    return call_api
+
+
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+def test_wait_for_fault_propagation(client):
+    client.return_value.call_api.side_effect = propagation_api(
+        [
+            [
+                [
+                    {"proxy": "a.default", "route_acked": "11"},
+                    {"proxy": "b.default", "route_acked": "12"},
+                ],
+                [
+                    {"proxy": "a.default", "route_acked": "12"},
+                    {"proxy": "b.default", "route_acked": "12"},
+                ],
+            ],
+            [
+                ApiException(status=503, reason="Unavailable"),
+                [{"proxy": "c.default", "route_acked": "13"}],
+            ],
+        ]
+    )
+
+    res = wait_for_fault_propagation("mysvc", interval=0.01)
+    assert res["converged"] is True
+    assert res["resourceVersion"] == "12"
+    assert res["proxies"] == 3
+    assert res["synced"] == 3
+    assert res["pending"] == []
+    assert res["errors"] == {}
+    assert 0 <= res["latency"]["p50"] <= res["latency"]["max"]
+
+
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+def test_wait_for_fault_propagation_times_out(client):
+    client.return_value.call_api.side_effect = propagation_api(
+        [
+            [[{"proxy": "a.default", "route_acked": "11"}]],
+            [[{"proxy": "b.default", "route_acked": "12"}]],
+        ]
+    )
+
+    res = wait_for_fault_propagation(
+        "mysvc",
+        resource_version="12",
+        proxies=["b.default", "d.default"],
+        timeout=0.1,
+        interval=0.01,
+    )
+    assert res["converged"] is False
+    assert res["proxies"] == 2
+    assert res["synced"] == 1
+    assert res["pending"] == ["d.default"]
+    assert res["latency"]["p99"] == res["latency"]["max"]
+
+
+def test_propagation_needs_istiod():
+    with patch(
+        "chaosistio.fault.probes.create_k8s_api_client", autospec=True
+    ) as client:
+        empty = MagicMock()
+        empty.stream.return_value = iter([b'{"metadata": {}, "items": []}'])
+        client.return_value.call_api.return_value = (empty, 200, {})
+        with pytest.raises(ActivityFailed):
+            wait_for_fault_propagation("mysvc", resource_version="1")
+
+
+def test_cached_listing_cannot_be_altered(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+
+    first = list_virtual_services()
+    first[0]["spec"]["http"].clear()
+    istio_api_env.reset_counters()
+
+    second = list_virtual_services()
+    assert len(second[0]["spec"]["http"]) == 2
+    assert istio_api_env.requests == 0
+
+
+def test_streamed_listing_is_not_cached(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+
+    assert len(list(iter_virtual_services())) == 1
+    assert probes._list_cache == {}
+
+
+def test_expired_listings_are_evicted(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+    list_virtual_services(ns="other", cache_ttl=0.01)
+    assert len(probes._list_cache) == 1
+
+    time.sleep(0.02)
+    list_virtual_services()
+
+    assert list(probes._list_cache) == [
+        ("default", None, None, "networking.istio.io/v1alpha3", ANY)
+    ]
+
+
+def test_listing_cache_is_invalidated_by_fault_writes(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+    assert list_virtual_services()[0]["spec"]["http"][0].get("fault") is None
+
+    add_abort_fault(
+        "reviews",
+        503,
+        routes=[{"destination": {"host": "reviews", "subset": "v0"}}],
+    )
+
+    fault = list_virtual_services()[0]["spec"]["http"][0]["fault"]
+    assert fault == {"abort": {"httpStatus": 503}}
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from chaoslib.exceptions import ActivityFailed
+
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import ramp_fault, set_fault, stop_fault_ramp
+from chaosistio.fault.ledger import clear_ledger, pending_faults
+from chaosistio.fault.ramp import (
+    FaultRamp,
+    _ramps,
+    ramp_schedule,
+    stop_ramps,
+)
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+
+
+@pytest.fixture(autouse=True)
+def no_ramps():
+    clear_ledger()
+    yield
+    stop_ramps()
+    clear_ledger()
+
+
+def test_linear_schedule():
+    steps = ramp_schedule(
+        curve="linear", start_percentage=0, end_percentage=100, step_count=5
+    )
+    assert [s["percentage"] for s in steps] == [0, 25, 50, 75, 100]
+    assert {s["duration"] for s in steps} == {120}
+
+
+def test_exponential_schedule():
+    steps = ramp_schedule(
+        curve="exponential",
+        start_percentage=1,
+        end_percentage=100,
+        step_count=3,
+        duration=30,
+    )
+    assert [s["percentage"] for s in steps] == [1, 10, 100]
+
+
+def test_schedule_requires_steps_or_curve():
+    with pytest.raises(ActivityFailed):
+        ramp_schedule()
+    with pytest.raises(ActivityFailed):
+        ramp_schedule(curve="exponential", start_percentage=0)
+
+
+def test_ramp_coalesces_identical_percentages():
+    apply = MagicMock()
+    ramp = FaultRamp(
+        ramp_schedule(
+            [{"percentage": 5}, {"percentage": 5}, {"percentage": 20}]
+        ),
+        apply,
+    )
+    ramp.run()
+
+    assert [c.args[0] for c in apply.call_args_list] == [5, 20]
+    assert ramp.current == 20
+
+
+def test_ramp_stops_on_error():
+    apply = MagicMock(side_effect=ActivityFailed("boom"))
+    ramp = FaultRamp(
+        ramp_schedule([{"percentage": 5}, {"percentage": 20}]), apply
+    )
+    ramp.run()
+
+    apply.assert_called_once_with(5)
+    assert ramp.current is None
+    assert ramp.error == "boom"
+
+
+@patch("chaosistio.fault.actions.get_virtual_service", autospec=True)
+@patch("chaosistio.fault.actions.create_k8s_api_client", autospec=True)
+def test_ramp_fault_reuses_patched_spec_and_rolls_back(client, get_vs):
+    resource_version = iter(range(2, 100))
+
+    def call_api(url, method, body=None, **kwargs):
+        content = MagicMock()
+        content.read.return_value = json.dumps(
+            {
+                "metadata": {
+                    "name": "reviews",
+                    "resourceVersion": str(next(resource_version)),
+                },
+                "spec": {"http": [{"route": [V1]}]},
+            }
+        )
+        return (content, 200, {})
+
+    client.return_value.call_api = MagicMock(side_effect=call_api)
+    get_vs.return_value = {
+        "status": 200,
+        "headers": {},
+        "body": {
+            "metadata": {"name": "reviews", "resourceVersion": "1"},
+            "spec": {"http": [{"route": [V1]}]},
+        },
+    }
+
+    res = ramp_fault(
+        "reviews",
+        [V1],
+        {"abort": {"httpStatus": 503}},
+        schedule=[
+            {"percentage": 10},
+            {"percentage": 10},
+            {"percentage": 50, "duration": 60},
+        ],
+    )
+    assert [s["percentage"] for s in res["steps"]] == [10, 10, 50]
+
+    call_api = client.return_value.call_api
+    deadline = time.monotonic() + 5
+    while call_api.call_count < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert call_api.call_count == 2
+    get_vs.assert_called_once()
+    second = call_api.call_args_list[1].kwargs["body"]
+    assert second[0] == {
+        "op": "test",
+        "path": "/metadata/resourceVersion",
+        "value": "2",
+    }
+    assert second[1]["value"]["abort"]["percentage"] == {"value": 50}
+
+    fault = second[1]["value"]
+    get_vs.return_value["body"]["spec"]["http"][0]["fault"] = fault
+    stopped = stop_fault_ramp("reviews")
+    (info,) = stopped["stopped"]
+    assert info["percentage"] == 50
+    assert info["status"] == 200
+    assert call_api.call_count == 3
+    assert call_api.call_args.kwargs["body"][1] == {
+        "op": "remove",
+        "path": "/spec/http/0/fault",
+    }
+    assert stop_fault_ramp("reviews") == {"stopped": []}
+
+
+def test_stop_fault_ramp_only_restores_the_ramp_routes(istio_api_env):
+    istio_api_env.add(virtual_service(routes=2))
+    v0 = {"destination": {"host": "reviews", "subset": "v0"}}
+    other = {"abort": {"httpStatus": 500}}
+    set_fault("reviews", [v0], other)
+
+    ramp_fault(
+        "reviews",
+        [V1],
+        {"abort": {"httpStatus": 503}},
+        schedule=[{"percentage": 10, "duration": 60}],
+    )
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+        if "fault" in http[1]:
+            break
+        time.sleep(0.01)
+
+    (info,) = stop_fault_ramp("reviews")["stopped"]
+    assert info["status"] == 200
+    assert info["error"] is None
+
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert http[0]["fault"] == other
+    assert "fault" not in http[1]
+    (entry,) = pending_faults()
+    assert len(entry["routes"]) == 1
+
+
+def test_stop_fault_ramp_reports_its_error(istio_api_env):
+    ramp_fault(
+        "missing",
+        [V1],
+        {"abort": {"httpStatus": 503}},
+        schedule=[{"percentage": 10, "duration": 60}],
+    )
+    ramp = _ramps[("default", "networking.istio.io/v1alpha3", "missing")]
+    deadline = time.monotonic() + 5
+    while ramp.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    (info,) = stop_fault_ramp("missing")["stopped"]
+    assert info["percentage"] is None
+    assert info["error"] == ramp.error
+    assert info["error"]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from chaosistio.fault.routes import RouteIndex, get_route_index
+
+HTTP = [
+    {
+        "name": "jason",
+        "match": [{"headers": {"end-user": {"exact": "jason"}}}],
+        "route": [{"destination": {"host": "reviews", "subset": "v2"}}],
+    },
+    {
+        "match": [
+            {"uri": {"prefix": "/api"}},
+            {"uri": {"prefix": "/v2/api"}},
+        ],
+        "route": [
+            {
+                "destination": {"host": "reviews", "subset": "v1"},
+                "weight": 80,
+            },
+            {
+                "destination": {"host": "reviews", "subset": "v2"},
+                "weight": 20,
+            },
+        ],
+    },
+    {"route": [{"destination": {"host": "reviews"}}]},
+]
+
+
+def test_select_by_destination():
+    index = RouteIndex(HTTP)
+    assert index.select(
+        [{"destination": {"host": "reviews", "subset": "v2"}}]
+    ) == [0, 1]
+    assert index.select([{"destination": {"host": "reviews"}}]) == [2]
+    assert index.select([{"destination": {"host": "ratings"}}]) == []
+
+
+def test_select_by_weight_name_and_match():
+    index = RouteIndex(HTTP)
+    v2 = {"host": "reviews", "subset": "v2"}
+
+    assert index.select([{"destination": v2, "weight": 20}]) == [1]
+    assert index.select([{"name": "jason"}]) == [0]
+    assert index.select([{"match": {"uri": {"prefix": "/v2/api"}}}]) == [1]
+    assert index.select(
+        [
+            {
+                "destination": v2,
+                "match": {"headers": {"end-user": {"exact": "jason"}}},
+            }
+        ]
+    ) == [0]
+    assert index.select([{}]) == []
+
+
+def test_index_is_reused_for_same_resource_version():
+    metadata = {"namespace": "ns", "name": "reviews", "resourceVersion": "1"}
+
+    index = get_route_index(HTTP, metadata)
+    assert get_route_index(HTTP, dict(metadata)) is index
+    assert get_route_index(HTTP, {**metadata, "resourceVersion": "2"}) is not (
+        index
+    )
+    assert get_route_index(HTTP) is not index
+
+
+def test_index_does_not_keep_the_routes():
+    index = RouteIndex(HTTP)
+
+    assert not hasattr(index, "http")
+    assert index.matches == {0: HTTP[0]["match"], 1: HTTP[1]["match"]}
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import subprocess
+import sys
+from typing import Dict
+
+
+def import_times(code: str) -> Dict[str, int]:
+    """
+    Run `code` in a fresh interpreter with `-X importtime` and return the
+    cumulative import time, in microseconds, of each imported module.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_discovery_does_not_import_kubernetes():
+    times = import_times(
+        "import chaosistio.fault.actions, chaosistio.fault.probes; "
+        "import chaosistio; chaosistio.discover(); "
+        "import sys; assert 'kubernetes' not in sys.modules"
+    )
+
+    assert "chaosistio" in times
+    assert "chaosistio.fault.actions" in times
+    kubernetes = [m for m in times if m.split(".")[0] == "kubernetes"]
+    assert kubernetes == []
+
+
+def test_kubernetes_is_imported_with_the_first_client():
+    times = import_times(
+        "import os; os.environ['KUBECONFIG'] = '/nonexistent'; "
+        "import chaosistio; chaosistio.create_k8s_api_client(None)"
+    )
+
+    assert "kubernetes.client" in times
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kubernetes.client.rest import ApiException
+
+from chaosistio.fault.actions import start_virtual_service_informer
+from chaosistio.fault.probes import get_virtual_service
+from chaosistio.informer import VirtualServiceInformer, stop_informers
+
+
+def vs(name, resource_version, ns="default"):
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": ns,
+            "resourceVersion": resource_version,
+        },
+        "spec": {"http": []},
+    }
+
+
+def list_response(body):
+    return iter([json.dumps(body).encode("utf-8")])
+
+
+def watch_response(*events):
+    response = MagicMock()
+    response.stream.return_value = iter(
+        [("\n".join(json.dumps(e) for e in events) + "\n").encode("utf-8")]
+    )
+    return response
+
+
+@pytest.fixture(autouse=True)
+def no_informers():
+    yield
+    stop_informers()
+
+
+@patch("chaosistio.informer.create_k8s_api_client", autospec=True)
+def test_informer_lists_then_applies_watch_events(client):
+    listing = MagicMock()
+    listing.stream.return_value = list_response(
+        {
+            "metadata": {"resourceVersion": "10"},
+            "items": [vs("a", "1"), vs("b", "2")],
+        }
+    )
+    events = watch_response(
+        {"type": "MODIFIED", "object": vs("a", "11")},
+        {"type": "DELETED", "object": vs("b", "12")},
+        {"type": "ADDED", "object": vs("c", "13")},
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "14"}}},
+    )
+    call_api = MagicMock()
+    call_api.side_effect = [(listing, 200, {}), (events, 200, {})]
+    client.return_value.call_api = call_api
+
+    informer = VirtualServiceInformer(ns="default")
+    informer.relist()
+    assert informer.synced
+    assert informer.resource_version == "10"
+    assert len(informer) == 2
+
+    informer.watch()
+    assert informer.get("default", "a")["metadata"]["resourceVersion"] == "11"
+    assert informer.get("default", "b") is None
+    assert informer.get("default", "c") is not None
+    assert informer.resource_version == "14"
+
+    assert ("resourceVersion", "10") in call_api.call_args.kwargs[
+        "query_params"
+    ]
+    events.release_conn.assert_called_once_with()
+
+
+@patch("chaosistio.informer.create_k8s_api_client", autospec=True)
+def test_informer_relists_when_watch_expired(client):
+    call_api = MagicMock()
+    client.return_value.call_api = call_api
+
+    informer = VirtualServiceInformer(ns="default")
+    informer.resource_version = "10"
+
+    call_api.return_value = (
+        watch_response({"type": "ERROR", "object": {"code": 410}}),
+        200,
+        {},
+    )
+    informer.watch()
+    assert informer.resource_version is None
+
+    informer.resource_version = "10"
+    call_api.side_effect = ApiException(status=410, reason="Gone")
+    informer.watch()
+    assert informer.resource_version is None
+
+
+@patch("chaosistio.fault.probes.create_k8s_api_client", autospec=True)
+@patch("chaosistio.informer.create_k8s_api_client", autospec=True)
+def test_get_virtual_service_reads_from_informer(informer_client, client):
+    listing = MagicMock()
+    listing.stream.side_effect = lambda *args, **kwargs: list_response(
+        {"metadata": {"resourceVersion": "10"}, "items": [vs("a", "1")]}
+    )
+    watching = MagicMock()
+    watching.stream.return_value = iter([])
+
+    def call_api(url, method, query_params, **kwargs):
+        if ("watch", "true") in query_params:
+            return (watching, 200, {})
+        return (listing, 200, {})
+
+    informer_client.return_value.call_api = call_api
+
+    res = start_virtual_service_informer(ns="default")
+    assert res["synced"]
+    assert res["count"] == 1
+
+    res = get_virtual_service("a")
+    assert res["status"] == 200
+    assert res["body"]["metadata"]["name"] == "a"
+    client.assert_not_called()
+
+
+def test_informer_ignores_older_versions():
+    informer = VirtualServiceInformer("default")
+    informer.update(vs("reviews", "7"))
+
+    informer.update(vs("reviews", "5"))
+    assert (
+        informer.get("default", "reviews")["metadata"]["resourceVersion"] == "7"
+    )
+
+    informer.update(vs("reviews", "9"))
+    assert (
+        informer.get("default", "reviews")["metadata"]["resourceVersion"] == "9"
+    )
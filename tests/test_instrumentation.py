@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from chaosistio import create_k8s_api_client
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import set_fault
+from chaosistio.fault.probes import get_virtual_service, list_virtual_services
+from chaosistio.instrumentation import (
+    MetricsRegistry,
+    add_hook,
+    clear_hooks,
+    emit,
+    instrumented,
+    registry,
+)
+from chaosistio.instrumentation.actions import (
+    disable_api_instrumentation,
+    enable_api_instrumentation,
+)
+from chaosistio.instrumentation.probes import get_api_metrics
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.fixture(autouse=True)
+def metrics():
+    registry.reset()
+    yield registry
+    clear_hooks()
+    registry.reset()
+
+
+def test_nothing_is_measured_without_hooks(istio_api_env):
+    istio_api_env.add(virtual_service(routes=1))
+    assert not instrumented()
+
+    get_virtual_service("reviews")
+    assert get_api_metrics() == {"requests": {}, "clients": {}}
+
+
+def test_api_calls_are_measured(istio_api_env, metrics):
+    istio_api_env.add(virtual_service(routes=3))
+    enable_api_instrumentation()
+
+    get_virtual_service("reviews")
+    get_virtual_service("ratings")
+    set_fault("reviews", [V1], FAULT, patch_strategy="json")
+    list_virtual_services()
+
+    snapshot = get_api_metrics()
+    requests = snapshot["requests"]
+    assert requests["GET"]["responses"] == {"200": 2, "404": 1}
+    assert requests["GET"]["latency"]["count"] == 3
+    assert requests["GET"]["latency"]["buckets"][-1] == ("+Inf", 3)
+    assert requests["GET"]["request_size"]["sum"] == 0
+    assert requests["GET"]["response_size"]["sum"] > 0
+    assert requests["PATCH"]["responses"] == {"200": 1}
+    assert requests["PATCH"]["request_size"]["sum"] > 0
+    assert requests["LIST"]["responses"] == {"200": 1}
+    assert requests["LIST"]["response_size"]["sum"] > 0
+
+    clients = snapshot["clients"]
+    assert clients["false"]["count"] == 1
+    assert clients["true"]["count"] == 4
+
+    disable_api_instrumentation()
+    assert not instrumented()
+    get_virtual_service("reviews")
+    assert get_api_metrics()["requests"]["GET"]["latency"]["count"] == 3
+
+
+def test_metrics_are_rendered_for_prometheus(metrics):
+    add_hook(metrics)
+    emit(
+        "request",
+        verb="PATCH",
+        url="/apis/networking.istio.io/v1alpha3/namespaces/default",
+        status=409,
+        duration=0.02,
+        start_time_ns=0,
+        request_size=300,
+        response_size=2000,
+    )
+    emit("retry", verb="PATCH", url="/", status=409, attempt=1)
+
+    text = get_api_metrics("prometheus")
+    assert "# TYPE chaosistio_api_request_duration_seconds histogram" in text
+    assert (
+        'chaosistio_api_request_duration_seconds_bucket{verb="PATCH",'
+        'le="0.01"} 0'
+    ) in text
+    assert (
+        'chaosistio_api_request_duration_seconds_bucket{verb="PATCH",'
+        'le="0.025"} 1'
+    ) in text
+    assert 'chaosistio_api_request_size_bytes_sum{verb="PATCH"} 300' in text
+    assert 'chaosistio_api_responses_total{verb="PATCH",code="409"} 1' in text
+    assert 'chaosistio_api_retries_total{verb="PATCH"} 1' in text
+    assert metrics.snapshot()["requests"]["PATCH"]["retries"] == 1
+
+
+def test_failing_hooks_are_ignored(istio_api_env):
+    def broken(event, data):
+        raise RuntimeError("oops")
+
+    istio_api_env.add(virtual_service(routes=1))
+    counter = MetricsRegistry()
+    add_hook(broken)
+    add_hook(counter)
+
+    assert get_virtual_service("reviews")["status"] == 200
+    assert counter.snapshot()["requests"]["GET"]["latency"]["count"] == 1
+
+
+def test_api_calls_are_traced(istio_api_env):
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    from chaosistio.instrumentation import OpenTelemetryHook
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    tracer = provider.get_tracer("test")
+    istio_api_env.add(virtual_service(routes=1))
+    add_hook(OpenTelemetryHook(tracer))
+
+    with tracer.start_as_current_span("experiment") as parent:
+        create_k8s_api_client(None)
+        get_virtual_service("ratings")
+
+    spans = {s.name: s for s in exporter.get_finished_spans()}
+    assert spans["GET"].parent.span_id == parent.get_span_context().span_id
+    assert spans["GET"].attributes["http.response.status_code"] == 404
+    assert not spans["GET"].status.is_ok
+    assert spans["GET"].end_time > spans["GET"].start_time
+    assert spans["create_k8s_api_client"].attributes[
+        "chaosistio.client.cached"
+    ] in (True, False)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import email.utils
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from kubernetes.client.rest import ApiException
+
+from chaosistio import create_k8s_api_client
+from chaosistio.api import call_api
+from chaosistio.fakeserver import virtual_service
+from chaosistio.fault.actions import set_fault
+from chaosistio.throttle import (
+    RateLimiter,
+    coalesce,
+    configure_throttling,
+    get_rate_limiter,
+    reset_throttling,
+    retry_after,
+)
+
+V1 = {"destination": {"host": "reviews", "subset": "v1"}}
+V2 = {"destination": {"host": "reviews", "subset": "v2"}}
+FAULT = {"abort": {"httpStatus": 503, "percentage": {"value": 50.0}}}
+
+
+@pytest.fixture(autouse=True)
+def throttling():
+    yield
+    reset_throttling()
+
+
+def test_writes_are_limited_after_a_burst():
+    limiter = RateLimiter(10, burst=2)
+
+    assert limiter.reserve("PATCH") == 0
+    assert limiter.reserve("PATCH") == 0
+    assert limiter.reserve("PATCH") == pytest.approx(0.1, abs=0.01)
+    assert limiter.reserve("PATCH") == pytest.approx(0.2, abs=0.01)
+    assert limiter.reserve("GET") == 0
+
+
+def test_rate_adapts_to_throttled_calls():
+    limiter = RateLimiter(10, max_retries=1)
+    throttled = {"status": 429, "headers": {"Retry-After": "2"}}
+
+    assert limiter.retry_delay("PATCH", throttled, 0) == 2
+    assert limiter.rate == 5
+    assert limiter.reserve("GET") == pytest.approx(2, abs=0.01)
+
+    assert limiter.retry_delay("PATCH", {"status": 429}, 1) is None
+    assert limiter.rate == 2.5
+
+    assert limiter.retry_delay("PATCH", {"status": 200}, 0) is None
+    assert limiter.rate == 3.5
+    assert limiter.retry_delay("PATCH", {"status": 409}, 0) is None
+    assert limiter.rate == 3.5
+
+
+def test_retry_after_header_is_parsed():
+    assert retry_after(None) is None
+    assert retry_after({"Content-Type": "application/json"}) is None
+    assert retry_after({"retry-after": "3"}) == 3
+    assert retry_after({"Retry-After": "soon"}) is None
+
+    when = email.utils.formatdate(time.time() + 5, usegmt=True)
+    assert retry_after({"Retry-After": when}) == pytest.approx(5, abs=1.5)
+
+
+def test_throttling_is_configured_once_per_settings():
+    assert configure_throttling(None) is None
+    limiter = configure_throttling({"istio_api_write_rate": 5})
+    assert limiter.burst == 5
+    assert configure_throttling({"istio_api_write_rate": 5}) is limiter
+    assert get_rate_limiter() is limiter
+
+    other = configure_throttling(
+        {"istio_api_write_rate": 5, "istio_api_write_burst": 1}
+    )
+    assert other is not limiter
+    assert other.burst == 1
+    assert configure_throttling({"istio_api_write_burst": 1}) is None
+
+
+def test_throttling_is_kept_without_throttling_keys(istio_api_env):
+    limiter = configure_throttling({"istio_api_write_rate": 5})
+    limiter.rate = 2
+
+    assert configure_throttling(None) is limiter
+    assert configure_throttling({"istio_fault_coalescing_window": 1}) is limiter
+    create_k8s_api_client({})
+    assert get_rate_limiter() is limiter
+    assert limiter.rate == 2
+
+
+@patch("chaosistio.api.time.sleep", autospec=True)
+def test_throttled_calls_are_retried(sleep):
+    configure_throttling({"istio_api_write_rate": 100})
+    throttled = ApiException(status=429, reason="Too Many Requests")
+    throttled.headers = {"Retry-After": "1"}
+    content = MagicMock()
+    content.read.return_value = b'"updated"'
+    api = MagicMock()
+    api.call_api.side_effect = [throttled, (content, 200, {})]
+
+    result = call_api(api, "/", "PATCH", header_params={}, body=[])
+
+    assert result["status"] == 200
+    assert api.call_api.call_count == 2
+    sleep.assert_any_call(1.0)
+    assert get_rate_limiter().rate == 60
+
+
+def test_changes_are_coalesced_into_one_write(istio_api_env):
+    istio_api_env.add(virtual_service(routes=3))
+    istio_api_env.reset_counters()
+    configuration = {"istio_fault_coalescing_window": 0.5}
+    results = {}
+
+    def apply(route):
+        results[route["destination"]["subset"]] = set_fault(
+            "reviews",
+            [route],
+            FAULT,
+            configuration=configuration,
+            patch_strategy="json",
+            fields=["metadata.name"],
+        )
+
+    threads = [threading.Thread(target=apply, args=(r,)) for r in (V1, V2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # a single read and a single write
+    assert istio_api_env.requests == 2
+    assert results["v1"]["routes"] == [1]
+    assert results["v2"]["routes"] == [2]
+    http = istio_api_env.get("VirtualService", "reviews")["spec"]["http"]
+    assert [r.get("fault") for r in http] == [None, FAULT, FAULT]
+
+
+def test_coalesced_errors_are_raised_to_every_caller():
+    errors = []
+
+    def flush(changes):
+        raise RuntimeError("boom")
+
+    def apply(change):
+        try:
+            coalesce("key", change, 0.2, flush)
+        except RuntimeError as x:
+            errors.append(str(x))
+
+    threads = [threading.Thread(target=apply, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == ["boom", "boom", "boom"]